@@ -1,23 +1,427 @@
-import random
-import string
-import gnupg
+import io
 import os
 import json
-from flask import Flask, render_template, request, jsonify
+import secrets
+import tempfile
+from flask import Flask, render_template, request, jsonify, g, Response
+from flask.json.provider import DefaultJSONProvider
 import threading
 import time
+import urllib.parse
+from contextlib import contextmanager
+
+import credential_io
+from crypto_backend import CryptoError, get_backend
+from decrypt_cache import DecryptCache
+import envelope
+from event_hub import EventHub, HubFull, format_event
+from entropy_pool import default_pool, password_generator, sanitization_strings
+from metrics import CONTENT_TYPE, Registry
+from password_generator import PasswordGenerator
+from secret_store import SessionStore, SharedSessionStore
+from site_index import SiteIndex, host_of
+import tracing
+from vault import Vault, VaultError
+import vault_sync
+from worker_pool import CryptoWorkerPool, DEFAULT_MAX_PENDING, DEFAULT_WORKERS
 
 app = Flask(__name__)
 
-# Initialize GPG with gnupg home
+# Crypto backend: "gnupg" (default) or "aead", see crypto_backend.py.  The GPG
+# home and backend are created on first use, so importing the app (worker boot,
+# tests, tools) does not start gpg.
 GPG_HOME = os.path.expanduser("~/.password_manager_web_gpg")
-if not os.path.exists(GPG_HOME):
-    os.makedirs(GPG_HOME, mode=0o700)
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_crypto_backend():
+    """Return the shared crypto backend, creating it on first use"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if not os.path.exists(GPG_HOME):
+                    os.makedirs(GPG_HOME, mode=0o700)
+                _backend = get_backend(gnupghome=GPG_HOME)
+    return _backend
+
+
+# Recently decrypted ciphertexts; set either setting to 0 to disable caching
+decrypt_cache = DecryptCache(
+    max_entries=int(os.environ.get('PASSWORD_MANAGER_DECRYPT_CACHE_SIZE', 128)),
+    ttl=float(os.environ.get('PASSWORD_MANAGER_DECRYPT_CACHE_TTL', 30))
+)
+
+# Bounded pool used by the batch endpoints to run crypto operations in parallel
+crypto_pool = CryptoWorkerPool(
+    workers=int(os.environ.get('PASSWORD_MANAGER_CRYPTO_WORKERS', DEFAULT_WORKERS)),
+    max_pending=int(os.environ.get('PASSWORD_MANAGER_CRYPTO_QUEUE', DEFAULT_MAX_PENDING))
+)
+
+# Largest number of items accepted by a single batch request
+MAX_BATCH_ITEMS = 1000
+
+# Format of the ciphertexts the endpoints return: "armor" (default) or the
+# smaller "compact" envelope, see envelope.py.  A request picks its own with
+# ?format= or the X-Ciphertext-Format header; decryption accepts either.
+CIPHERTEXT_FORMAT = os.environ.get('PASSWORD_MANAGER_CIPHERTEXT_FORMAT', envelope.ARMOR)
+FORMAT_HEADER = 'X-Ciphertext-Format'
+
+# Per-session storage for passwords, keyed by the session cookie.  In memory by
+# default; serve.py points PASSWORD_MANAGER_SESSION_DB at a database shared by
+# all worker processes (see secret_store.SharedSessionStore).
+# Created on first use, like the backend.
+SESSION_DB = os.environ.get('PASSWORD_MANAGER_SESSION_DB')
+if SESSION_DB and not os.environ.get('PASSWORD_MANAGER_SESSION_KEY'):
+    raise RuntimeError("PASSWORD_MANAGER_SESSION_DB requires PASSWORD_MANAGER_SESSION_KEY (hex)")
+_session_store = None
+_session_store_lock = threading.Lock()
+# Idle sessions are also swept in the background, not only when touched
+SESSION_PURGE_SECONDS = float(os.environ.get('PASSWORD_MANAGER_SESSION_PURGE_SECONDS', 60))
+_session_purge_stop = threading.Event()
+
+# Opt-in request tracing: Server-Timing headers, plus a JSON-lines trace file if set
+TRACE_FILE = os.environ.get('PASSWORD_MANAGER_TRACE_FILE')
+TRACING_ENABLED = bool(TRACE_FILE) or os.environ.get('PASSWORD_MANAGER_TRACING', '').lower() in ('1', 'true', 'yes')
+trace_writer = tracing.TraceWriter(TRACE_FILE) if TRACE_FILE else None
+
+
+def get_session_store():
+    """Return the shared session store, creating it on first use"""
+    global _session_store
+    if _session_store is None:
+        with _session_store_lock:
+            if _session_store is None:
+                ttl = int(os.environ.get('PASSWORD_MANAGER_SESSION_TTL', 900))
+                max_sessions = int(os.environ.get('PASSWORD_MANAGER_MAX_SESSIONS', 10000))
+                if SESSION_DB:
+                    store = SharedSessionStore(SESSION_DB, bytes.fromhex(os.environ['PASSWORD_MANAGER_SESSION_KEY']),
+                                               ttl=ttl, max_sessions=max_sessions)
+                else:
+                    store = SessionStore(ttl=ttl, max_sessions=max_sessions)
+                if SESSION_PURGE_SECONDS > 0:
+                    threading.Thread(target=purge_sessions, args=(store, SESSION_PURGE_SECONDS, _session_purge_stop),
+                                     name='session-purge', daemon=True).start()
+                if TRACING_ENABLED:
+                    store = tracing.TracedProxy(store, 'store', ('get', 'set', 'contains', 'delete'))
+                _session_store = store
+    return _session_store
+
+
+def purge_sessions(store, interval, stop):
+    """Drop the store's idle sessions every interval seconds until stop is set"""
+    while not stop.wait(interval):
+        try:
+            store.purge_expired()
+        except Exception:
+            app.logger.exception("Session purge failed")  # e.g. the shared database stayed locked
+
+
+# Server-sent event streams (GET /api/events, see event_hub.py).  Each open
+# stream holds a server thread, so they are capped per process (serve.py lowers
+# the cap below its thread count) and ended after EVENT_STREAM_SECONDS; clients
+# reconnect.
+event_hub = EventHub(max_channels=int(os.environ.get('PASSWORD_MANAGER_MAX_EVENT_STREAMS', 32)))
+EVENT_STREAM_SECONDS = 300
+EVENT_HEARTBEAT_SECONDS = 15
+
+# Admin endpoints (sampling profiler) are disabled unless a token is configured
+ADMIN_TOKEN = os.environ.get('PASSWORD_MANAGER_ADMIN_TOKEN')
+ADMIN_HEADER = 'X-Admin-Token'
+PROFILE_DIR = os.environ.get('PASSWORD_MANAGER_PROFILE_DIR', tempfile.gettempdir())
+MAX_PROFILE_SECONDS = 300
+profiler = tracing.SamplingProfiler()
+
+# Persistent vault of encrypted entries, opened on first use.  When several
+# processes serve the app (PASSWORD_MANAGER_VAULT_SHARED, set by serve.py) each
+# opens it shared and holds its lock per request: shared to read, exclusive to
+# write, waiting up to VAULT_LOCK_TIMEOUT for the other processes.
+VAULT_PATH = os.environ.get('PASSWORD_MANAGER_VAULT', os.path.expanduser("~/.password_manager_web_vault"))
+VAULT_SHARED = os.environ.get('PASSWORD_MANAGER_VAULT_SHARED', '').lower() in ('1', 'true', 'yes')
+VAULT_LOCK_TIMEOUT = 10
+# The vault endpoints are off unless PASSWORD_MANAGER_VAULT_TOKEN is set, and
+# then require it in the X-Vault-Token header, like the sync endpoints.
+VAULT_TOKEN = os.environ.get('PASSWORD_MANAGER_VAULT_TOKEN')
+VAULT_TOKEN_HEADER = 'X-Vault-Token'
+_vault = None
+_vault_lock = threading.Lock()
+
+
+def vault_allowed():
+    """True if the request carries the configured vault token"""
+    supplied = request.headers.get(VAULT_TOKEN_HEADER, '')
+    return bool(VAULT_TOKEN) and secrets.compare_digest(supplied.encode(), VAULT_TOKEN.encode())
+
+
+def get_vault():
+    """Return the shared Vault, opening it on first use"""
+    global _vault
+    if _vault is None:
+        with _vault_lock:
+            if _vault is None:
+                vault = Vault(VAULT_PATH, lock_timeout=VAULT_LOCK_TIMEOUT, shared=True) if VAULT_SHARED else Vault(VAULT_PATH)
+                if TRACING_ENABLED:
+                    vault = tracing.TracedProxy(vault, 'store', ('get', 'put', 'delete', 'ids'))
+                _vault = vault
+    return _vault
+
+
+@contextmanager
+def open_vault(write=False):
+    """Yield the vault for one request, holding its lock in shared mode (exclusively to write)"""
+    vault = get_vault()
+    with vault.hold(exclusive=write):
+        yield vault
+
+
+# Host and name index over the vault (see site_index.py), built on first use.
+# When the vault's fingerprint shows writes that did not go through
+# put_indexed/delete_indexed, such as another worker's, the entries they touched
+# are reindexed; only a compaction elsewhere forces a full rebuild.
+site_index = SiteIndex()
+_site_index_lock = threading.Lock()
+
+# Most entries returned by one /api/lookup
+MAX_LOOKUP_RESULTS = 20
+
+
+def read_changes(vault, changed):
+    """Split the ids from Vault.changes_since into (current entries, deleted ids)"""
+    entries, deleted = [], []
+    for entry_id in sorted(changed):
+        try:
+            entries.append(vault.get(entry_id))
+        except VaultError:
+            deleted.append(entry_id)
+    return entries, deleted
+
+
+def get_site_index(vault):
+    """Return the site index, brought up to date with vault"""
+    if site_index.version != vault.fingerprint():
+        with _site_index_lock:
+            changed, fingerprint = vault.changes_since(site_index.version)
+            if site_index.version != fingerprint:
+                with tracing.span('index'):
+                    if changed is None:
+                        site_index.load(vault.iter_entries(), fingerprint)
+                    else:
+                        entries, deleted = read_changes(vault, changed)
+                        for entry in entries:
+                            site_index.add(entry['id'], entry.get('name', ''), entry.get('origin'))
+                        for entry_id in deleted:
+                            site_index.remove(entry_id)
+                        site_index.version = fingerprint
+    return site_index
+
+
+# Hash tree over the vault for delta sync with other nodes (see vault_sync.py),
+# updated from the entries written since when the vault's fingerprint changes.
+# The sync endpoints are off
+# unless PASSWORD_MANAGER_SYNC_TOKEN is set, and then require it in the
+# X-Sync-Token header.
+SYNC_TOKEN = os.environ.get('PASSWORD_MANAGER_SYNC_TOKEN')
+_sync_tree = None
+_sync_tree_lock = threading.Lock()
+
+
+def get_sync_tree(vault):
+    """Return the sync tree for vault's current contents"""
+    global _sync_tree
+    if _sync_tree is None or _sync_tree.version != vault.fingerprint():
+        with _sync_tree_lock:
+            changed, fingerprint = vault.changes_since(_sync_tree.version if _sync_tree is not None else None)
+            if _sync_tree is None or _sync_tree.version != fingerprint:
+                with tracing.span('index'):
+                    if changed is None:
+                        _sync_tree = vault_sync.SyncTree(vault.iter_entries(), fingerprint)
+                    else:
+                        _sync_tree = _sync_tree.updated(*read_changes(vault, changed), version=fingerprint)
+    return _sync_tree
+
+
+def put_indexed(vault, encrypted, name='', origin=None, sync=True, **metadata):
+    """Add an entry to the vault and the site index; origin is a host name or None"""
+    if origin:
+        metadata['origin'] = origin
+    with _site_index_lock:
+        current = site_index.version == vault.fingerprint()
+        entry_id = vault.put(encrypted, name=name, sync=sync, **metadata)
+        if current:
+            site_index.add(entry_id, name, origin)
+            site_index.version = vault.fingerprint()
+    return entry_id
+
+
+def delete_indexed(vault, entry_id):
+    """Delete a vault entry and drop it from the site index"""
+    with _site_index_lock:
+        current = site_index.version == vault.fingerprint()
+        vault.delete(entry_id, sync=True)
+        if current:
+            site_index.remove(entry_id)
+            site_index.version = vault.fingerprint()
+
+
+def shutdown():
+    """Release process resources: flush and close the vault, stop the pools"""
+    global _vault
+    with _vault_lock:
+        if _vault is not None:
+            _vault.close()
+            _vault = None
+    _session_purge_stop.set()
+    crypto_pool.shutdown(wait=True)
+    default_pool.stop()
+    if trace_writer is not None:
+        trace_writer.close()
+
+
+# Prometheus metrics, served at /api/metrics
+registry = Registry()
+http_requests = registry.counter(
+    'password_manager_http_requests_total', 'HTTP requests by route, method and status code',
+    ('route', 'method', 'status'))
+http_latency = registry.histogram(
+    'password_manager_http_request_duration_seconds', 'HTTP request latency by route',
+    ('route', 'method'))
+operation_latency = registry.histogram(
+    'password_manager_operation_duration_seconds', 'Latency of password manager operations',
+    ('operation',))
+crypto_errors = registry.counter(
+    'password_manager_crypto_errors_total', 'Failed crypto operations by failure status',
+    ('operation', 'status'))
+crypto_in_flight = registry.gauge(
+    'password_manager_crypto_in_flight', 'Crypto backend calls currently running')
+registry.gauge('password_manager_crypto_pool_pending', 'Batch items queued or running in the crypto pool',
+               callback=lambda: crypto_pool.pending)
+registry.gauge('password_manager_sessions', 'Live sessions in the session store',
+               callback=lambda: len(_session_store) if _session_store is not None else 0)
+registry.gauge('password_manager_session_store_bytes', 'Approximate bytes held by the session store',
+               callback=lambda: _session_store.size_bytes if _session_store is not None else 0)
+registry.gauge('password_manager_decrypt_cache_entries', 'Entries in the decrypt cache',
+               callback=lambda: decrypt_cache.stats()['size'])
+registry.counter('password_manager_decrypt_cache_lookups_total', 'Decrypt cache lookups by result', ('result',),
+                 callback=lambda: {('hit',): decrypt_cache.hits, ('miss',): decrypt_cache.misses})
+registry.gauge('password_manager_entropy_pool_available_bytes', 'Random bytes buffered in the entropy pool',
+               callback=lambda: default_pool.stats()['available'])
+registry.counter('password_manager_entropy_pool_empty_total', 'Reads that found the entropy pool empty',
+                 callback=lambda: default_pool.empty_events)
+registry.gauge('password_manager_vault_entries', 'Entries in the vault (0 until it is opened)',
+               callback=lambda: len(_vault) if _vault is not None else 0)
+registry.gauge('password_manager_event_streams', 'Open server-sent event streams',
+               callback=lambda: len(event_hub))
+registry.gauge('password_manager_site_index_entries', 'Vault entries in the site index',
+               callback=lambda: len(site_index))
+
+
+@contextmanager
+def track_crypto(operation):
+    """Time a backend call and count its failures by CryptoError status"""
+    crypto_in_flight.inc()
+    try:
+        with operation_latency.time(operation=operation), tracing.span(operation):
+            yield
+    except CryptoError as e:
+        crypto_errors.inc(operation=operation, status=e.status)
+        raise
+    finally:
+        crypto_in_flight.dec()
+
+
+SESSION_COOKIE = 'pm_session'
+SESSION_HEADER = 'X-Session-Id'
+
 
-gpg = gnupg.GPG(gnupghome=GPG_HOME)
+def current_session_id(create=False):
+    """Return the caller's session id from cookie or header, optionally minting one"""
+    if 'session_id' not in g:
+        g.session_id = request.cookies.get(SESSION_COOKIE) or request.headers.get(SESSION_HEADER)
+        g.new_session = False
+    if g.session_id is None and create:
+        g.session_id = secrets.token_urlsafe(16)
+        g.new_session = True
+    return g.session_id
 
-# In-memory storage for passwords
-password_storage = {}
+
+@app.after_request
+def set_session_cookie(response):
+    """Hand newly created session ids back to the client"""
+    if g.get('new_session'):
+        response.set_cookie(SESSION_COOKIE, g.session_id, httponly=True, samesite='Strict')
+        response.headers[SESSION_HEADER] = g.session_id
+    return response
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+class TracingJSONProvider(DefaultJSONProvider):
+    """JSON provider that records response serialization as a 'json' span"""
+
+    def response(self, *args, **kwargs):
+        with tracing.span('json'):
+            return super().response(*args, **kwargs)
+
+
+if TRACING_ENABLED:
+    app.json = TracingJSONProvider(app)
+
+
+@app.before_request
+def start_trace():
+    """Begin a trace and parse the JSON body up front so parsing gets its own span"""
+    if not TRACING_ENABLED:
+        return
+    tracing.begin(f'{request.method} {request.path}')
+    if request.is_json:
+        with tracing.span('parse'):
+            request.get_json(silent=True)
+
+
+@app.after_request
+def finish_trace(response):
+    """Report the request's spans in Server-Timing and the trace file"""
+    trace = tracing.end() if TRACING_ENABLED else None
+    if trace is not None:
+        response.headers['Server-Timing'] = trace.server_timing()
+        if trace_writer is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            trace_writer.write(trace.to_dict(route=route, method=request.method, status=response.status_code))
+    return response
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Count the request and observe its latency under the matched route pattern"""
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    http_requests.inc(route=route, method=request.method, status=response.status_code)
+    if 'request_started' in g:
+        http_latency.observe(time.perf_counter() - g.request_started, route=route, method=request.method)
+    return response
+
+
+def choose_format(*requested):
+    """The first requested ciphertext format given, or the default; raises ValueError if unknown"""
+    fmt = next((value for value in requested if value), CIPHERTEXT_FORMAT).strip().lower()
+    if fmt not in envelope.FORMATS:
+        raise ValueError(f"Unknown ciphertext format '{fmt}'. Choose from: {', '.join(envelope.FORMATS)}")
+    return fmt
+
+
+def requested_format():
+    return choose_format(request.args.get('format'), request.headers.get(FORMAT_HEADER))
+
+
+def in_format(ciphertext, fmt):
+    """ciphertext converted to fmt; data that is not a recognized message is returned as stored"""
+    try:
+        return envelope.convert(ciphertext, fmt)
+    except envelope.EnvelopeError:
+        return ciphertext
 
 
 class PasswordManager:
@@ -26,51 +430,32 @@ class PasswordManager:
     @staticmethod
     def generate_random_password(length):
         """Generate random password with uppercase, lowercase, digits, and symbols"""
-        characters = string.ascii_uppercase + string.ascii_lowercase + string.digits + "!@#"
-        password = ''.join(random.choice(characters) for _ in range(length))
-        return password
+        with operation_latency.time(operation='generate'):
+            return password_generator.generate(length)
     
     @staticmethod
-    def encrypt_password(password):
-        """Encrypt password using GPG AES256"""
-        encrypted_data = gpg.encrypt(
-            password,
-            recipients=None,
-            symmetric='AES256',
-            always_trust=True,
-            passphrase='password_manager_default_key'
-        )
-        
-        if not encrypted_data.ok:
-            raise Exception(f"Encryption failed: {encrypted_data.status}")
-        
-        return str(encrypted_data)
+    def encrypt_password(password, fmt=envelope.ARMOR):
+        """Encrypt password using the configured backend (AES256), armored or compact"""
+        with track_crypto('encrypt'):
+            if fmt == envelope.COMPACT:
+                return get_crypto_backend().encrypt_compact(password)
+            return get_crypto_backend().encrypt(password)
     
     @staticmethod
     def decrypt_password(encrypted_str):
-        """Decrypt password using GPG"""
-        decrypted_data = gpg.decrypt(
-            encrypted_str,
-            always_trust=True,
-            passphrase='password_manager_default_key'
-        )
-        
-        if not decrypted_data.ok:
-            raise Exception(f"Decryption failed: {decrypted_data.status}")
-        
-        return str(decrypted_data)
+        """Decrypt an armored or compact password using the configured backend, reusing recent results"""
+        decrypted = decrypt_cache.get(encrypted_str)
+        if decrypted is None:
+            with track_crypto('decrypt'):
+                decrypted = get_crypto_backend().decrypt(encrypted_str)
+            decrypt_cache.put(encrypted_str, decrypted)
+        return decrypted
     
     @staticmethod
     def sanitize_clipboard_text():
         """Generate random 264-character strings for clipboard sanitization"""
-        sanitized = []
-        for _ in range(5):
-            random_str = ''.join(
-                random.choice(string.ascii_letters + string.digits + string.punctuation)
-                for _ in range(264)
-            )
-            sanitized.append(random_str)
-        return sanitized
+        with operation_latency.time(operation='sanitize'):
+            return sanitization_strings(5, 264)
 
 
 @app.route('/')
@@ -90,7 +475,7 @@ def generate_password():
             return jsonify({'error': 'Length must be at least 1'}), 400
         
         password = PasswordManager.generate_random_password(length)
-        password_storage['current'] = password
+        get_session_store().set(current_session_id(create=True), 'current', password)
         
         return jsonify({
             'success': True,
@@ -101,16 +486,55 @@ def generate_password():
         return jsonify({'error': str(e)}), 500
 
 
+# Upper bounds for /api/generate-passwords
+MAX_GENERATE_COUNT = 1000000
+MAX_GENERATE_LENGTH = 4096
+
+
+@app.route('/api/generate-passwords', methods=['GET'])
+def generate_passwords():
+    """Stream count random passwords as NDJSON, one {"password": ...} object per line"""
+    try:
+        count = int(request.args.get('count', 1))
+        length = int(request.args.get('length', 16))
+        alphabet = request.args.get('alphabet')
+        generator = PasswordGenerator(alphabet, source=default_pool.read) if alphabet else password_generator
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if not 1 <= count <= MAX_GENERATE_COUNT:
+        return jsonify({'error': f'Count must be between 1 and {MAX_GENERATE_COUNT}'}), 400
+    if not 1 <= length <= MAX_GENERATE_LENGTH:
+        return jsonify({'error': f'Length must be between 1 and {MAX_GENERATE_LENGTH}'}), 400
+
+    def stream():
+        lines = []
+        for password in generator.generate_many(count, length):
+            lines.append(json.dumps({'password': password}))
+            if len(lines) >= 1000:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+    return Response(stream(), mimetype='application/x-ndjson')
+
+
 @app.route('/api/encrypt-password', methods=['POST'])
 def encrypt_password():
     """Encrypt the current password"""
     try:
-        if 'current' not in password_storage:
+        fmt = requested_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        session_id = current_session_id()
+        password = get_session_store().get(session_id, 'current')
+        if password is None:
             return jsonify({'error': 'No password to encrypt. Generate one first.'}), 400
         
-        password = password_storage['current']
-        encrypted = PasswordManager.encrypt_password(password)
-        password_storage['encrypted'] = encrypted
+        encrypted = PasswordManager.encrypt_password(password, fmt)
+        get_session_store().set(session_id, 'encrypted', encrypted)
         
         # Return preview of encrypted password
         preview = encrypted[:50] + "..." if len(encrypted) > 50 else encrypted
@@ -118,7 +542,8 @@ def encrypt_password():
         return jsonify({
             'success': True,
             'preview': preview,
-            'length': len(encrypted)
+            'length': len(encrypted),
+            'format': fmt
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -128,18 +553,29 @@ def encrypt_password():
 def get_encrypted():
     """Get the encrypted password for clipboard"""
     try:
-        if 'encrypted' not in password_storage:
+        fmt = requested_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        encrypted = get_session_store().get(current_session_id(), 'encrypted')
+        if encrypted is None:
             return jsonify({'error': 'No encrypted password. Encrypt one first.'}), 400
         
-        encrypted = password_storage['encrypted']
         return jsonify({
             'success': True,
-            'data': encrypted
+            'data': in_format(encrypted, fmt),
+            'format': fmt
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+def push_sanitization_strings(session_id):
+    """Send the session's open event streams their next batch of sanitization strings"""
+    if session_id is not None and event_hub.has_channel(session_id):
+        event_hub.publish(session_id, 'sanitize', {'sanitized_strings': PasswordManager.sanitize_clipboard_text()})
+
+
 @app.route('/api/decrypt-from-clipboard', methods=['POST'])
 def decrypt_from_clipboard():
     """Decrypt password from clipboard data"""
@@ -151,18 +587,140 @@ def decrypt_from_clipboard():
             return jsonify({'error': 'No encrypted data provided'}), 400
         
         decrypted = PasswordManager.decrypt_password(encrypted_str)
-        password_storage['current'] = decrypted
+        session_id = current_session_id(create=True)
+        get_session_store().set(session_id, 'current', decrypted)
         
-        return jsonify({
+        response = jsonify({
             'success': True,
             'length': len(decrypted),
             'masked': '*' * len(decrypted),
             'message': 'Password decrypted! Clipboard being sanitized...'
         })
+        # A client with an event stream sanitizes with the batch it holds; push the next one
+        response.call_on_close(lambda: push_sanitization_strings(session_id))
+        return response
     except Exception as e:
         return jsonify({'error': f'Decryption failed: {str(e)}'}), 500
 
 
+@app.route('/api/decrypt-and-sanitize', methods=['POST'])
+def decrypt_and_sanitize():
+    """Decrypt password from clipboard data and return the sanitization strings in the same response"""
+    try:
+        data = request.json
+        encrypted_str = data.get('data', '')
+        
+        if not encrypted_str:
+            return jsonify({'error': 'No encrypted data provided'}), 400
+        
+        decrypted = PasswordManager.decrypt_password(encrypted_str)
+        get_session_store().set(current_session_id(create=True), 'current', decrypted)
+        
+        return jsonify({
+            'success': True,
+            'length': len(decrypted),
+            'masked': '*' * len(decrypted),
+            'sanitized_strings': PasswordManager.sanitize_clipboard_text(),
+            'message': 'Password decrypted! Overwrite the clipboard with the sanitized strings.'
+        })
+    except Exception as e:
+        return jsonify({'error': f'Decryption failed: {str(e)}'}), 500
+
+
+@app.route('/api/events', methods=['GET'])
+def events():
+    """Server-sent event stream for the session: a 'sanitize' batch now and after each decrypt"""
+    session_id = current_session_id(create=True)
+    try:
+        channel = event_hub.open(session_id)
+    except HubFull as e:
+        return jsonify({'error': str(e)}), 503
+    channel.put('sanitize', {'sanitized_strings': PasswordManager.sanitize_clipboard_text()})
+
+    def stream():
+        deadline = time.monotonic() + EVENT_STREAM_SECONDS
+        yield 'retry: 3000\n\n'
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            item = channel.get(timeout=min(EVENT_HEARTBEAT_SECONDS, remaining))
+            yield format_event(*item) if item is not None else ': keepalive\n\n'
+
+    response = Response(stream(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(lambda: event_hub.close(channel))
+    return response
+
+
+def _batch_items(data):
+    """Validate a batch request body and return its list of string items"""
+    items = (data or {}).get('items')
+    if not isinstance(items, list) or not items:
+        raise ValueError('Request must contain a non-empty "items" array')
+    if len(items) > MAX_BATCH_ITEMS:
+        raise ValueError(f'Batch too large: at most {MAX_BATCH_ITEMS} items per request')
+    if not all(isinstance(item, str) and item for item in items):
+        raise ValueError('Every item must be a non-empty string')
+    return items
+
+
+@app.route('/api/encrypt-batch', methods=['POST'])
+def encrypt_batch():
+    """Encrypt an array of passwords in parallel, reporting per-item results"""
+    try:
+        fmt = requested_format()
+        items = _batch_items(request.json)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    with tracing.span('batch'):
+        outcomes = crypto_pool.map_results(lambda item: PasswordManager.encrypt_password(item, fmt), items)
+    results = []
+    for index, (ok, value) in enumerate(outcomes):
+        if ok:
+            results.append({'index': index, 'success': True, 'data': value})
+        else:
+            results.append({'index': index, 'success': False, 'error': f'Encryption failed: {str(value)}'})
+
+    succeeded = sum(1 for result in results if result['success'])
+    return jsonify({
+        'success': True,
+        'format': fmt,
+        'total': len(results),
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'results': results
+    })
+
+
+@app.route('/api/decrypt-batch', methods=['POST'])
+def decrypt_batch():
+    """Decrypt an array of ciphertexts in parallel, reporting per-item results"""
+    try:
+        items = _batch_items(request.json)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    with tracing.span('batch'):
+        outcomes = crypto_pool.map_results(PasswordManager.decrypt_password, items)
+    results = []
+    for index, (ok, value) in enumerate(outcomes):
+        if ok:
+            results.append({'index': index, 'success': True, 'length': len(value), 'masked': '*' * len(value)})
+        else:
+            results.append({'index': index, 'success': False, 'error': f'Decryption failed: {str(value)}'})
+
+    succeeded = sum(1 for result in results if result['success'])
+    return jsonify({
+        'success': True,
+        'total': len(results),
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'results': results
+    })
+
+
 @app.route('/api/sanitize-clipboard', methods=['POST'])
 def sanitize_clipboard():
     """Generate sanitization strings"""
@@ -177,30 +735,360 @@ def sanitize_clipboard():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/entropy-stats', methods=['GET'])
+def entropy_stats():
+    """Report fill level, refill rate and empty events of the entropy pool"""
+    return jsonify(default_pool.stats())
+
+
 @app.route('/api/copy-to-clipboard', methods=['GET'])
 def copy_to_clipboard():
     """Get encrypted password ready for clipboard copy"""
     try:
-        if 'encrypted' not in password_storage:
+        fmt = requested_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        encrypted = get_session_store().get(current_session_id(), 'encrypted')
+        if encrypted is None:
             return jsonify({'error': 'No encrypted password. Encrypt one first.'}), 400
         
-        encrypted = password_storage['encrypted']
         return jsonify({
             'success': True,
-            'data': encrypted,
+            'data': in_format(encrypted, fmt),
+            'format': fmt,
             'message': 'Encrypted password ready to copy. Use "Copy to Clipboard" button.'
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+def _vault_entry_summary(entry):
+    return {'id': entry['id'], 'name': entry.get('name', ''), 'origin': entry.get('origin'),
+            'updated': entry.get('updated')}
+
+
+@app.route('/api/vault/entries', methods=['GET'])
+def list_vault_entries():
+    """List vault entries (without ciphertexts), paged with offset and limit, optionally matching name q"""
+    if not vault_allowed():
+        return jsonify({'error': 'Vault token required'}), 403
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = min(1000, max(1, int(request.args.get('limit', 100))))
+    except ValueError:
+        return jsonify({'error': 'offset and limit must be integers'}), 400
+    query = request.args.get('q', '').strip()
+
+    entries = []
+    with open_vault() as vault:
+        if query:
+            ids = get_site_index(vault).search(query, limit=None)  # all of them, so total counts every match
+        else:
+            ids = vault.ids()
+        for entry_id in ids[offset:offset + limit]:
+            try:
+                entries.append(_vault_entry_summary(vault.get(entry_id)))
+            except VaultError:
+                continue
+    return jsonify({'success': True, 'total': len(ids), 'entries': entries})
+
+
+@app.route('/api/vault/entries', methods=['POST'])
+def save_vault_entry():
+    """Save an encrypted password to the vault (the session's, unless data is given), optionally for an origin"""
+    if not vault_allowed():
+        return jsonify({'error': 'Vault token required'}), 403
+    try:
+        data = request.json or {}
+        name = data.get('name', '')
+        origin = None
+        if data.get('origin'):
+            origin = host_of(data['origin'])
+            if not origin:
+                return jsonify({'error': 'origin must be a URL or host name'}), 400
+        encrypted = data.get('data') or get_session_store().get(current_session_id(), 'encrypted')
+        if not encrypted:
+            return jsonify({'error': 'No encrypted password. Encrypt one first.'}), 400
+
+        with open_vault(write=True) as vault:
+            entry_id = put_indexed(vault, encrypted, name=name, origin=origin)
+        return jsonify({'success': True, 'id': entry_id, 'name': name, 'origin': origin})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/vault/entries/<int:entry_id>', methods=['GET'])
+def get_vault_entry(entry_id):
+    """Get one vault entry including its ciphertext"""
+    if not vault_allowed():
+        return jsonify({'error': 'Vault token required'}), 403
+    try:
+        fmt = requested_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    with open_vault() as vault:
+        try:
+            entry = vault.get(entry_id)
+        except VaultError as e:
+            return jsonify({'error': str(e)}), 404
+    return jsonify(dict(_vault_entry_summary(entry), success=True, data=in_format(entry['ciphertext'], fmt)))
+
+
+@app.route('/api/vault/entries/<int:entry_id>', methods=['DELETE'])
+def delete_vault_entry(entry_id):
+    """Delete a vault entry"""
+    if not vault_allowed():
+        return jsonify({'error': 'Vault token required'}), 403
+    with open_vault(write=True) as vault:
+        try:
+            delete_indexed(vault, entry_id)
+        except VaultError as e:
+            return jsonify({'error': str(e)}), 404
+    return jsonify({'success': True, 'id': entry_id})
+
+
+@app.route('/api/vault/import', methods=['POST'])
+def import_vault_entries():
+    """Import a CSV or JSON credential file from the (possibly chunked) request body"""
+    if not vault_allowed():
+        return jsonify({'error': 'Vault token required'}), 403
+    try:
+        fmt = requested_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    file_type = credential_io.file_type_of(request.args.get('type') or request.content_type)
+    if file_type is None:
+        return jsonify({'error': 'Send a text/csv or application/json body, or pass type=csv|json'}), 400
+
+    # Records are parsed straight off the request stream and the vault is held
+    # only while a batch is written, so other requests get it in between
+    pending = []
+
+    def store(ciphertext, record):
+        pending.append((ciphertext, record))
+
+    def flush():
+        with open_vault(write=True) as vault:
+            for ciphertext, record in pending:
+                put_indexed(vault, ciphertext, name=record['name'], origin=record['origin'], sync=False,
+                            **({'username': record['username']} if record.get('username') else {}))
+            vault.sync()
+        pending.clear()
+
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8-sig', newline='')
+    with tracing.span('batch'):
+        summary = credential_io.import_records(
+            credential_io.read_records(stream, file_type),
+            lambda password: PasswordManager.encrypt_password(password, fmt),
+            crypto_pool, store, batch_size=min(credential_io.DEFAULT_BATCH_SIZE, crypto_pool.max_pending),
+            flush=flush)
+    if 'stopped' in summary:
+        return jsonify(dict(summary, error=f"Import stopped: {summary['stopped']}")), 400
+    return jsonify(dict(summary, success=True))
+
+
+@app.route('/api/vault/export', methods=['GET'])
+def export_vault_entries():
+    """Stream the vault's entries, with their ciphertexts, as a CSV or JSON download"""
+    if not vault_allowed():
+        return jsonify({'error': 'Vault token required'}), 403
+    try:
+        fmt = requested_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    file_type = request.args.get('type', credential_io.CSV).lower()
+    if file_type not in credential_io.FILE_TYPES:
+        return jsonify({'error': 'type must be csv or json'}), 400
+
+    def entries():
+        # A page of entries at a time, so the vault is not held while the client reads
+        start = 1
+        while True:
+            with open_vault() as vault:
+                ids = vault.ids(start=start, limit=credential_io.DEFAULT_BATCH_SIZE)
+                page = []
+                for entry_id in ids:
+                    try:
+                        page.append(vault.get(entry_id))
+                    except VaultError:
+                        continue
+            if not ids:
+                return
+            for entry in page:
+                yield dict(entry, ciphertext=in_format(entry['ciphertext'], fmt))
+            start = ids[-1] + 1
+
+    def stream():
+        yield from credential_io.export_entries(entries(), file_type)
+
+    return Response(stream(), mimetype=credential_io.CONTENT_TYPES[file_type], headers={
+        'Content-Disposition': f'attachment; filename=vault-export.{file_type}'})
+
+
+@app.route('/api/lookup', methods=['GET'])
+def lookup():
+    """Find the vault entries for a site; return their ciphertexts, or with masked=1 decrypt the best match"""
+    if not vault_allowed():
+        return jsonify({'error': 'Vault token required'}), 403
+    host = host_of(request.args.get('origin', ''))
+    if not host:
+        return jsonify({'error': 'origin must be a URL or host name'}), 400
+    masked = request.args.get('masked', '').lower() in ('1', 'true', 'yes')
+    try:
+        fmt = requested_format()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    matches = []
+    with open_vault() as vault:
+        for entry_id in get_site_index(vault).match(host)[:MAX_LOOKUP_RESULTS]:
+            try:
+                matches.append(vault.get(entry_id))
+            except VaultError:
+                continue
+    if not matches:
+        return jsonify({'error': f'No vault entry for {host}'}), 404
+
+    if not masked:
+        return jsonify({
+            'success': True,
+            'host': host,
+            'matches': [dict(_vault_entry_summary(entry), data=in_format(entry['ciphertext'], fmt))
+                        for entry in matches]
+        })
+
+    # Exact host matches come first, so the first entry is the most specific one
+    best = matches[0]
+    try:
+        decrypted = PasswordManager.decrypt_password(best['ciphertext'])
+    except Exception as e:
+        return jsonify({'error': f'Decryption failed: {str(e)}'}), 500
+    get_session_store().set(current_session_id(create=True), 'current', decrypted)
+    return jsonify(dict(
+        _vault_entry_summary(best),
+        success=True,
+        host=host,
+        matches=len(matches),
+        length=len(decrypted),
+        masked='*' * len(decrypted)
+    ))
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Expose request, crypto and component metrics in Prometheus text format"""
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
+
+def sync_allowed():
+    """True if the request carries the configured sync token"""
+    supplied = request.headers.get(vault_sync.TOKEN_HEADER, '')
+    return bool(SYNC_TOKEN) and secrets.compare_digest(supplied.encode(), SYNC_TOKEN.encode())
+
+
+@app.route('/api/sync/summary', methods=['GET'])
+def sync_summary():
+    """Hash and children of one vault hash tree node, or with leaves=1 the entry hashes under it"""
+    if not sync_allowed():
+        return jsonify({'error': 'Sync token required'}), 403
+    prefix = request.args.get('prefix', '').lower()
+    if len(prefix) > vault_sync.DEPTH or any(digit not in vault_sync.DIGITS for digit in prefix):
+        return jsonify({'error': f'prefix must be up to {vault_sync.DEPTH} hex digits'}), 400
+
+    with open_vault() as vault:
+        tree = get_sync_tree(vault)
+    summary = tree.summary(prefix)
+    if request.args.get('leaves', '').lower() in ('1', 'true', 'yes'):
+        if summary['count'] > vault_sync.LEAF_FETCH and len(prefix) < vault_sync.DEPTH:
+            return jsonify({'error': f'More than {vault_sync.LEAF_FETCH} entries; ask for a longer prefix'}), 400
+        summary = dict(summary, entries=tree.entries_under(prefix))
+        summary.pop('children', None)
+    return jsonify(summary)
+
+
+@app.route('/api/sync/pull', methods=['POST'])
+def sync_pull():
+    """The encrypted entries for a list of uids"""
+    if not sync_allowed():
+        return jsonify({'error': 'Sync token required'}), 403
+    uids = (request.get_json(silent=True) or {}).get('uids')
+    if not isinstance(uids, list) or len(uids) > vault_sync.MAX_PULL:
+        return jsonify({'error': f'Request must contain a "uids" array of at most {vault_sync.MAX_PULL}'}), 400
+
+    entries = []
+    with open_vault() as vault:
+        tree = get_sync_tree(vault)
+        for uid in uids:
+            try:
+                entry = vault_sync.export_entry(vault, tree, uid)
+            except VaultError:
+                continue
+            if entry is not None:
+                entries.append(entry)
+    return jsonify({'success': True, 'entries': entries})
+
+
+@app.route('/api/sync/run', methods=['POST'])
+def sync_run():
+    """Pull new and changed entries from another node into this one (admin)"""
+    if not is_admin():
+        return jsonify({'error': 'Admin token required'}), 403
+    peer = (request.get_json(silent=True) or {}).get('peer', '')
+    if urllib.parse.urlsplit(peer).scheme not in ('http', 'https'):
+        return jsonify({'error': 'peer must be an http(s) URL'}), 400
+
+    try:
+        with open_vault(write=True) as vault:
+            stats = vault_sync.pull_changes(vault, get_sync_tree(vault), vault_sync.HttpPeer(peer, SYNC_TOKEN))
+    except vault_sync.SyncError as e:
+        return jsonify({'error': str(e)}), 502
+    return jsonify(dict(stats, success=True, peer=peer))
+
+
+def is_admin():
+    """True if the request carries the configured admin token"""
+    supplied = request.headers.get(ADMIN_HEADER, '')
+    return bool(ADMIN_TOKEN) and secrets.compare_digest(supplied.encode(), ADMIN_TOKEN.encode())
+
+
+@app.route('/api/admin/profile', methods=['POST'])
+def start_profile():
+    """Run the sampling profiler for N seconds and write folded stacks for a flamegraph"""
+    if not is_admin():
+        return jsonify({'error': 'Admin token required'}), 403
+    try:
+        seconds = float((request.get_json(silent=True) or {}).get('seconds', 10))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'seconds must be a number'}), 400
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        return jsonify({'error': f'seconds must be between 0 and {MAX_PROFILE_SECONDS}'}), 400
+
+    output = os.path.join(PROFILE_DIR, f'password-manager-{os.getpid()}-{int(time.time())}.folded')
+    try:
+        profiler.start(seconds, output)
+    except RuntimeError as e:
+        return jsonify({'error': str(e)}), 409
+    return jsonify({'success': True, 'seconds': seconds, 'output': output}), 202
+
+
+@app.route('/api/admin/profile', methods=['GET'])
+def profile_status():
+    """Report whether the profiler is running and where its last output went"""
+    if not is_admin():
+        return jsonify({'error': 'Admin token required'}), 403
+    return jsonify(profiler.stats())
+
+
 @app.route('/api/status', methods=['GET'])
 def status():
     """Get current storage status"""
+    session_id = current_session_id()
+    current = get_session_store().get(session_id, 'current')
     return jsonify({
-        'has_password': 'current' in password_storage,
-        'has_encrypted': 'encrypted' in password_storage,
-        'password_length': len(password_storage.get('current', ''))
+        'has_password': current is not None,
+        'has_encrypted': get_session_store().contains(session_id, 'encrypted'),
+        'password_length': len(current or '')
     })
 
 
@@ -212,10 +1100,11 @@ if __name__ == '__main__':
     print("Open your browser and navigate to: http://localhost:5000")
     print("\nFeatures:")
     print("✓ Generate random passwords")
-    print("✓ Encrypt with GPG AES256")
+    print(f"✓ Encrypt with AES256 ({get_crypto_backend().name} backend)")
     print("✓ Copy to clipboard")
     print("✓ Decrypt from clipboard")
     print("✓ Auto sanitize clipboard with 5 random strings")
+    print("\nThis is the development server; use serve.py for production.")
     print("\n" + "="*60 + "\n")
     
     app.run(debug=True, host='0.0.0.0', port=5000)
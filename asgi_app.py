@@ -0,0 +1,455 @@
+"""
+ASGI variant of the web API, for asyncio servers such as uvicorn:
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+
+The crypto routes (encrypt-password, decrypt-from-clipboard, encrypt-batch,
+decrypt-batch) are served on the event loop.  Their crypto runs in a
+dedicated thread pool through run_in_executor, so a request waiting on gpg
+costs a suspended coroutine instead of a blocked server thread, and one
+process can keep thousands of decrypts queued or in flight.  An
+asyncio.Semaphore caps that number; callers that cannot get a slot within
+CRYPTO_SUBMIT_TIMEOUT get PoolBusy, as with the Flask batch endpoints.
+
+The event stream (GET /api/events) is also native: an idle stream is a
+coroutine waiting for its channel, not a thread blocked in the Flask route.
+
+Every other route is passed through to the Flask app in app.py (on a
+separate small thread pool), so the endpoint contract, session cookie,
+metrics and tracing are shared with the WSGI server.  Their request bodies
+are streamed to Flask as they arrive rather than buffered, so large uploads
+such as POST /api/vault/import take constant memory.
+"""
+
+import asyncio
+import contextvars
+import io
+import json
+import os
+import secrets
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+import app as web
+from event_hub import HubFull, format_event
+import tracing
+from worker_pool import PoolBusy
+
+# Threads running crypto operations, and how many operations may be queued or running
+CRYPTO_THREADS = int(os.environ.get('PASSWORD_MANAGER_ASYNC_CRYPTO_THREADS', 32))
+MAX_CRYPTO_IN_FLIGHT = int(os.environ.get('PASSWORD_MANAGER_ASYNC_MAX_IN_FLIGHT', 4096))
+CRYPTO_SUBMIT_TIMEOUT = 5.0
+
+# Threads for session store access and the routes handed to Flask
+IO_THREADS = int(os.environ.get('PASSWORD_MANAGER_ASYNC_IO_THREADS', 16))
+
+crypto_executor = ThreadPoolExecutor(max_workers=CRYPTO_THREADS, thread_name_prefix='async-crypto')
+io_executor = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix='async-io')
+_crypto_slots = None
+
+
+class Request:
+    """The parts of an ASGI HTTP request the native routes need"""
+
+    def __init__(self, scope, body):
+        self.scope = scope
+        self.method = scope['method']
+        self.path = scope['path']
+        self.body = body
+        self.query = {name: values[0] for name, values in
+                      parse_qs(scope.get('query_string', b'').decode('latin-1')).items()}
+        self.headers = {}
+        for name, value in scope['headers']:
+            self.headers[name.decode('latin-1').lower()] = value.decode('latin-1')
+        self.session_id = None
+        self.new_session = False
+
+    def json(self):
+        if not self.body:
+            raise ValueError('Request body must be JSON')
+        return json.loads(self.body)
+
+    def requested_format(self):
+        """Same negotiation as app.requested_format: ?format= first, then header"""
+        return web.choose_format(self.query.get('format'), self.headers.get(web.FORMAT_HEADER.lower()))
+
+    def current_session_id(self, create=False):
+        """Same lookup as app.current_session_id: cookie first, then header"""
+        if self.session_id is None and not self.new_session:
+            cookie = SimpleCookie(self.headers.get('cookie', ''))
+            morsel = cookie.get(web.SESSION_COOKIE)
+            self.session_id = morsel.value if morsel else self.headers.get(web.SESSION_HEADER.lower())
+        if self.session_id is None and create:
+            self.session_id = secrets.token_urlsafe(16)
+            self.new_session = True
+        return self.session_id
+
+
+async def offload(executor, fn, *args):
+    """Run fn(*args) in executor, carrying the current trace context along"""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(executor, context.run, fn, *args)
+
+
+async def run_crypto(fn, item):
+    """Run one crypto operation in the crypto pool, waiting at most CRYPTO_SUBMIT_TIMEOUT for a slot"""
+    global _crypto_slots
+    if _crypto_slots is None:
+        _crypto_slots = asyncio.Semaphore(MAX_CRYPTO_IN_FLIGHT)
+    try:
+        await asyncio.wait_for(_crypto_slots.acquire(), CRYPTO_SUBMIT_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise PoolBusy(f"Crypto worker pool is full ({MAX_CRYPTO_IN_FLIGHT} operations pending)")
+    try:
+        return await offload(crypto_executor, fn, item)
+    finally:
+        _crypto_slots.release()
+
+
+async def encrypt_password(request):
+    """Encrypt the current password"""
+    try:
+        fmt = request.requested_format()
+    except ValueError as e:
+        return 400, {'error': str(e)}
+    try:
+        session_id = request.current_session_id()
+        password = await offload(io_executor, web.get_session_store().get, session_id, 'current')
+        if password is None:
+            return 400, {'error': 'No password to encrypt. Generate one first.'}
+
+        encrypted = await run_crypto(lambda item: web.PasswordManager.encrypt_password(item, fmt), password)
+        await offload(io_executor, web.get_session_store().set, session_id, 'encrypted', encrypted)
+
+        preview = encrypted[:50] + "..." if len(encrypted) > 50 else encrypted
+        return 200, {'success': True, 'preview': preview, 'length': len(encrypted), 'format': fmt}
+    except Exception as e:
+        return 500, {'error': str(e)}
+
+
+async def decrypt_from_clipboard(request):
+    """Decrypt password from clipboard data"""
+    try:
+        encrypted_str = (request.json() or {}).get('data', '')
+        if not encrypted_str:
+            return 400, {'error': 'No encrypted data provided'}
+
+        decrypted = await run_crypto(web.PasswordManager.decrypt_password, encrypted_str)
+        session_id = request.current_session_id(create=True)
+        await offload(io_executor, web.get_session_store().set, session_id, 'current', decrypted)
+        io_executor.submit(web.push_sanitization_strings, session_id)
+        return 200, {
+            'success': True,
+            'length': len(decrypted),
+            'masked': '*' * len(decrypted),
+            'message': 'Password decrypted! Clipboard being sanitized...'
+        }
+    except Exception as e:
+        return 500, {'error': f'Decryption failed: {str(e)}'}
+
+
+async def decrypt_and_sanitize(request):
+    """Decrypt password from clipboard data and return the sanitization strings in the same response"""
+    try:
+        encrypted_str = (request.json() or {}).get('data', '')
+        if not encrypted_str:
+            return 400, {'error': 'No encrypted data provided'}
+
+        decrypted = await run_crypto(web.PasswordManager.decrypt_password, encrypted_str)
+        await offload(io_executor, web.get_session_store().set, request.current_session_id(create=True),
+                      'current', decrypted)
+        return 200, {
+            'success': True,
+            'length': len(decrypted),
+            'masked': '*' * len(decrypted),
+            'sanitized_strings': web.PasswordManager.sanitize_clipboard_text(),
+            'message': 'Password decrypted! Overwrite the clipboard with the sanitized strings.'
+        }
+    except Exception as e:
+        return 500, {'error': f'Decryption failed: {str(e)}'}
+
+
+async def _run_batch(request, fn, describe):
+    try:
+        items = web._batch_items(request.json())
+    except ValueError as e:
+        return 400, {'error': str(e)}
+
+    with tracing.span('batch'):
+        outcomes = await asyncio.gather(*(run_crypto(fn, item) for item in items), return_exceptions=True)
+
+    results = []
+    for index, value in enumerate(outcomes):
+        if isinstance(value, Exception):
+            results.append({'index': index, 'success': False, 'error': describe(value)})
+        else:
+            results.append(dict({'index': index, 'success': True}, **value))
+
+    succeeded = sum(1 for result in results if result['success'])
+    return 200, {
+        'success': True,
+        'total': len(results),
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'results': results
+    }
+
+
+async def encrypt_batch(request):
+    """Encrypt an array of passwords concurrently, reporting per-item results"""
+    try:
+        fmt = request.requested_format()
+    except ValueError as e:
+        return 400, {'error': str(e)}
+    status, body = await _run_batch(
+        request,
+        lambda item: {'data': web.PasswordManager.encrypt_password(item, fmt)},
+        lambda error: f'Encryption failed: {str(error)}')
+    if status == 200:
+        body['format'] = fmt
+    return status, body
+
+
+async def decrypt_batch(request):
+    """Decrypt an array of ciphertexts concurrently, reporting per-item results"""
+    def decrypt(item):
+        value = web.PasswordManager.decrypt_password(item)
+        return {'length': len(value), 'masked': '*' * len(value)}
+
+    return await _run_batch(request, decrypt, lambda error: f'Decryption failed: {str(error)}')
+
+
+ROUTES = {
+    ('POST', '/api/encrypt-password'): encrypt_password,
+    ('POST', '/api/decrypt-from-clipboard'): decrypt_from_clipboard,
+    ('POST', '/api/decrypt-and-sanitize'): decrypt_and_sanitize,
+    ('POST', '/api/encrypt-batch'): encrypt_batch,
+    ('POST', '/api/decrypt-batch'): decrypt_batch,
+}
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+class BodyStream(io.RawIOBase):
+    """wsgi.input for a Flask thread, reading the request body from the ASGI receive channel"""
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = b''
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while not self._buffer and not self._done:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message['type'] == 'http.disconnect':
+                self._done = True
+                break
+            self._buffer = message.get('body', b'')
+            self._done = not message.get('more_body')
+        count = min(len(target), len(self._buffer))
+        target[:count] = self._buffer[:count]
+        self._buffer = self._buffer[count:]
+        return count
+
+
+def session_headers(request):
+    """Set-Cookie and session id headers for a session created by this request"""
+    if not request.new_session:
+        return []
+    cookie = f'{web.SESSION_COOKIE}={request.session_id}; HttpOnly; Path=/; SameSite=Strict'
+    return [(b'set-cookie', cookie.encode('latin-1')),
+            (web.SESSION_HEADER.lower().encode(), request.session_id.encode('latin-1'))]
+
+
+async def handle_native(handler, request, send):
+    """Run a native route with the same cookie, metrics and tracing behaviour as the Flask hooks"""
+    started = time.perf_counter()
+    trace = tracing.begin(f'{request.method} {request.path}') if web.TRACING_ENABLED else None
+    if trace is not None and request.body:
+        with tracing.span('parse'):
+            try:
+                request.json()
+            except ValueError:
+                pass
+
+    status, payload = await handler(request)
+    with tracing.span('json'):
+        body = (web.app.json.dumps(payload) + '\n').encode('utf-8')
+
+    headers = [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    headers.extend(session_headers(request))
+    if trace is not None:
+        tracing.end()
+        headers.append((b'server-timing', trace.server_timing().encode('latin-1')))
+        if web.trace_writer is not None:
+            web.trace_writer.write(trace.to_dict(route=request.path, method=request.method, status=status))
+
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+    web.http_requests.inc(route=request.path, method=request.method, status=status)
+    web.http_latency.observe(time.perf_counter() - started, route=request.path, method=request.method)
+
+
+async def stream_events(request, receive, send):
+    """GET /api/events: the Flask route's event stream, waiting on the channel instead of a thread"""
+    started = time.perf_counter()
+    session_id = request.current_session_id(create=True)
+    try:
+        channel = web.event_hub.open(session_id)
+    except HubFull as e:
+        body = (json.dumps({'error': str(e)}) + '\n').encode('utf-8')
+        await send({'type': 'http.response.start', 'status': 503,
+                    'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
+        web.http_requests.inc(route=request.path, method=request.method, status=503)
+        return
+    channel.put('sanitize', {'sanitized_strings': web.PasswordManager.sanitize_clipboard_text()})
+
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+    channel.waker = lambda: loop.call_soon_threadsafe(wake.set)
+    disconnected = asyncio.ensure_future(receive())
+    try:
+        headers = [(b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'),
+                   (b'x-accel-buffering', b'no')] + session_headers(request)
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+        web.http_requests.inc(route=request.path, method=request.method, status=200)
+        web.http_latency.observe(time.perf_counter() - started, route=request.path, method=request.method)
+
+        deadline = loop.time() + web.EVENT_STREAM_SECONDS
+        while True:
+            wake.clear()
+            item = channel.get_nowait()
+            if item is not None:
+                await send({'type': 'http.response.body', 'body': format_event(*item).encode('utf-8'),
+                            'more_body': True})
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            waiter = asyncio.ensure_future(wake.wait())
+            done, _ = await asyncio.wait({waiter, disconnected}, timeout=min(web.EVENT_HEARTBEAT_SECONDS, remaining))
+            waiter.cancel()
+            if disconnected in done:
+                if disconnected.result()['type'] == 'http.disconnect':
+                    return
+                disconnected = asyncio.ensure_future(receive())
+            if not done:
+                await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        channel.waker = None
+        web.event_hub.close(channel)
+        disconnected.cancel()
+
+
+STREAMS = {
+    ('GET', '/api/events'): stream_events,
+}
+
+
+def wsgi_environ(scope, body):
+    """Build a WSGI environ for the Flask app from an ASGI HTTP scope; body is a file-like object"""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        key = 'HTTP_' + name
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+async def handle_wsgi(scope, receive, send):
+    """Serve the request with the Flask app, streaming its request and response bodies"""
+    started = []
+    body = io.BufferedReader(BodyStream(receive, asyncio.get_running_loop()))
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [int(status.split(' ', 1)[0]),
+                      [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]]
+
+    iterable = await offload(io_executor, web.app, wsgi_environ(scope, body), start_response)
+    iterator = iter(iterable)
+    try:
+        await send({'type': 'http.response.start', 'status': started[0], 'headers': started[1]})
+        while True:
+            chunk = await offload(io_executor, next, iterator, None)
+            if chunk is None:
+                break
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(iterable, 'close'):
+            await offload(io_executor, iterable.close)
+
+
+def shutdown():
+    """Stop the executors and release the Flask app's resources"""
+    crypto_executor.shutdown(wait=True)
+    io_executor.shutdown(wait=True)
+    web.shutdown()
+
+
+async def app(scope, receive, send):
+    """ASGI entry point"""
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.get_running_loop().run_in_executor(None, shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    stream = STREAMS.get((scope['method'], scope['path']))
+    if stream is not None:
+        await stream(Request(scope, await read_body(receive)), receive, send)
+        return
+    handler = ROUTES.get((scope['method'], scope['path']))
+    if handler is not None:
+        await handle_native(handler, Request(scope, await read_body(receive)), send)
+    else:
+        await handle_wsgi(scope, receive, send)
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the password manager.
+
+    python benchmark.py run [--suite functions,http] [--json results.json]
+                            [--baseline baseline.json] [--threshold 0.25]
+    python benchmark.py kdf [--json results.json]
+    python benchmark.py startup [--runs 10] [--json results.json]
+    python benchmark.py envelope [--json results.json]
+
+run
+    Throughput and p50/p95/p99 latency of the core PasswordManager
+    operations (functions suite) and of the Flask routes through the test
+    client, serially and from concurrent clients (http suite).  With
+    --baseline, each measurement is compared against a previous --json
+    output and the exit status is 1 if any regressed by more than
+    --threshold (a fraction: 0.25 = 25% slower p50 or lower throughput).
+
+kdf
+    Encrypt/decrypt latency of the aead backend at several KDF cost
+    settings, comparing a per-call key derivation (key lifetime 0) with the
+    cached session key.
+
+startup
+    Cold-start cost, each run in a fresh interpreter: process wall time,
+    `import app`, the first request, the first crypto request (which creates
+    the backend), and `import password_manager` for the GUI.
+
+envelope
+    Size and parse cost of ASCII armor against the compact envelope
+    (envelope.py) for each backend: characters on the wire, time to turn the
+    text back into the binary message, and full decrypt latency.
+
+Every run does a warm-up pass first and uses fixed iteration counts, and the
+JSON output records the interpreter, platform and crypto backend so results
+are only compared like for like.  The decrypt cache is disabled unless
+PASSWORD_MANAGER_DECRYPT_CACHE_SIZE is set, so decrypts measure real work.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from crypto_backend import AEADBackend, DEFAULT_PASSPHRASE, GnuPGBackend
+import envelope
+from key_manager import KeyManager
+import openpgp
+
+KDF_SETTINGS = [
+    ('pbkdf2', 100_000),
+    ('pbkdf2', 600_000),
+    ('scrypt', 14),
+    ('scrypt', 15),
+    ('scrypt', 16),
+]
+
+
+def time_calls(fn, iterations):
+    """Run fn iterations times and return per-call latencies in milliseconds"""
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+# Recorded with results; earlier runs rounded the rank half-to-even and read high
+PERCENTILE_METHOD = 'nearest-rank'
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    # Rounded first so float error (0.07 * 100 == 7.000000000000001) cannot push the rank up
+    rank = math.ceil(round(fraction * len(sorted_values), 9))
+    return sorted_values[max(0, min(len(sorted_values) - 1, rank - 1))]
+
+
+def summarize(latencies, elapsed):
+    """Reduce per-call latencies (ms) and wall time (s) to a result record"""
+    ordered = sorted(latencies)
+    return {
+        'iterations': len(ordered),
+        'throughput_ops': len(ordered) / elapsed if elapsed else 0.0,
+        'mean_ms': statistics.fmean(ordered),
+        'p50_ms': percentile(ordered, 0.50),
+        'p95_ms': percentile(ordered, 0.95),
+        'p99_ms': percentile(ordered, 0.99),
+    }
+
+
+def measure(fn, iterations, warmup=5):
+    """Time fn serially after a warm-up pass"""
+    time_calls(fn, warmup)
+    started = time.perf_counter()
+    latencies = time_calls(fn, iterations)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def measure_concurrent(make_fn, iterations, concurrency, warmup=2):
+    """Time iterations calls spread over concurrency threads, each with its own fn from make_fn()"""
+    per_worker = max(1, iterations // concurrency)
+    functions = [make_fn() for _ in range(concurrency)]
+    for fn in functions:
+        time_calls(fn, warmup)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        batches = list(executor.map(lambda fn: time_calls(fn, per_worker), functions))
+    elapsed = time.perf_counter() - started
+    return summarize([latency for batch in batches for latency in batch], elapsed)
+
+
+def load_app():
+    """Import app.py with benchmark-friendly settings"""
+    os.environ.setdefault('PASSWORD_MANAGER_DECRYPT_CACHE_SIZE', '0')
+    os.environ.setdefault('PASSWORD_MANAGER_VAULT', tempfile.mkdtemp(prefix='pm-bench-vault-'))
+    import app
+    return app
+
+
+def bench_functions(app, iterations):
+    manager = app.PasswordManager
+    ciphertext = manager.encrypt_password("benchmark-password-0123")
+    return {
+        'functions.encrypt_password': measure(lambda: manager.encrypt_password("benchmark-password-0123"), iterations),
+        'functions.decrypt_password': measure(lambda: manager.decrypt_password(ciphertext), iterations),
+        'functions.generate_random_password': measure(lambda: manager.generate_random_password(32), iterations * 20),
+        'functions.sanitize_clipboard_text': measure(manager.sanitize_clipboard_text, iterations * 20),
+    }
+
+
+def http_routes(app):
+    """Return {name: factory} where factory() builds a request function bound to a fresh client"""
+    ciphertext = app.PasswordManager.encrypt_password("benchmark-password-0123")
+
+    def client_with_password():
+        client = app.app.test_client()
+        client.post('/api/generate-password', json={'length': 24})
+        return client
+
+    def route(method, path, json_body=None, needs_password=False):
+        def factory():
+            client = client_with_password() if needs_password else app.app.test_client()
+            call = getattr(client, method)
+
+            def request():
+                response = call(path, json=json_body) if json_body is not None else call(path)
+                if response.status_code >= 400:
+                    raise RuntimeError(f"{method.upper()} {path} returned {response.status_code}")
+            return request
+        return factory
+
+    return {
+        'GET /api/status': route('get', '/api/status', needs_password=True),
+        'POST /api/generate-password': route('post', '/api/generate-password', {'length': 24}),
+        'POST /api/encrypt-password': route('post', '/api/encrypt-password', needs_password=True),
+        'POST /api/decrypt-from-clipboard': route('post', '/api/decrypt-from-clipboard', {'data': ciphertext}),
+        'POST /api/sanitize-clipboard': route('post', '/api/sanitize-clipboard', {}),
+    }
+
+
+def bench_http(app, iterations, concurrency):
+    results = {}
+    for name, factory in http_routes(app).items():
+        results[f'http.serial.{name}'] = measure(factory(), iterations)
+        results[f'http.concurrent.{name}'] = measure_concurrent(factory, iterations, concurrency)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print a comparison with a baseline run and return the names that regressed"""
+    regressions = []
+    print(f"\n{'benchmark':<52} {'p50 base':>10} {'p50 now':>10} {'ops/s base':>11} {'ops/s now':>11}")
+    for name, current in sorted(results.items()):
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        slower = current['p50_ms'] > previous['p50_ms'] * (1 + threshold)
+        less_throughput = current['throughput_ops'] < previous['throughput_ops'] * (1 - threshold)
+        flag = "  REGRESSION" if slower or less_throughput else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<52} {previous['p50_ms']:>8.3f}ms {current['p50_ms']:>8.3f}ms "
+              f"{previous['throughput_ops']:>11.1f} {current['throughput_ops']:>11.1f}{flag}")
+    return regressions
+
+
+def print_results(results):
+    print(f"{'benchmark':<52} {'ops/s':>10} {'p50':>10} {'p95':>10} {'p99':>10}")
+    for name, row in sorted(results.items()):
+        print(f"{name:<52} {row['throughput_ops']:>10.1f} {row['p50_ms']:>8.3f}ms "
+              f"{row['p95_ms']:>8.3f}ms {row['p99_ms']:>8.3f}ms")
+
+
+def bench_kdf(iterations):
+    results = []
+    for kdf, cost in KDF_SETTINGS:
+        uncached = AEADBackend(keys=KeyManager(DEFAULT_PASSPHRASE, kdf=kdf, cost=cost, lifetime=0))
+        cached = AEADBackend(keys=KeyManager(DEFAULT_PASSPHRASE, kdf=kdf, cost=cost))
+
+        derive_ms = time_calls(lambda: uncached.encrypt("benchmark-password"), 3)
+        first_ms = time_calls(lambda: cached.encrypt("benchmark-password"), 1)[0]
+        ciphertext = cached.encrypt("benchmark-password")
+        encrypt_ms = time_calls(lambda: cached.encrypt("benchmark-password"), iterations)
+        decrypt_ms = time_calls(lambda: cached.decrypt(ciphertext), iterations)
+
+        results.append({
+            'kdf': kdf,
+            'cost': cost,
+            'per_call_derivation_ms': statistics.median(derive_ms),
+            'first_call_ms': first_ms,
+            'cached_encrypt_ms': statistics.median(encrypt_ms),
+            'cached_decrypt_ms': statistics.median(decrypt_ms),
+        })
+    return results
+
+
+def print_kdf(results):
+    print(f"{'KDF':<8} {'cost':>8} {'uncached':>11} {'first call':>11} {'encrypt':>9} {'decrypt':>9}")
+    for row in results:
+        print(f"{row['kdf']:<8} {row['cost']:>8} {row['per_call_derivation_ms']:>9.2f}ms "
+              f"{row['first_call_ms']:>9.2f}ms {row['cached_encrypt_ms']:>7.3f}ms {row['cached_decrypt_ms']:>7.3f}ms")
+
+
+def bench_envelope(parse_iterations, decrypt_iterations):
+    plaintext = "benchmark-password-0123"
+    backends = [
+        (GnuPGBackend(tempfile.mkdtemp(prefix='pm-bench-gpg-')), openpgp.dearmor),
+        (AEADBackend(), envelope.dearmor_aead),
+    ]
+    results = []
+    for backend, dearmor in backends:
+        armored = backend.encrypt(plaintext)
+        compact = backend.encrypt_compact(plaintext)
+        for fmt, text, parse in ((envelope.ARMOR, armored, dearmor), (envelope.COMPACT, compact, envelope.unpack)):
+            results.append({
+                'backend': backend.name,
+                'format': fmt,
+                'size_chars': len(text),
+                'parse_us': statistics.median(time_calls(lambda: parse(text), parse_iterations)) * 1000,
+                'decrypt_ms': statistics.median(time_calls(lambda: backend.decrypt(text), decrypt_iterations)),
+            })
+    return results
+
+
+def print_envelope(results):
+    print(f"{'backend':<8} {'format':<8} {'size':>6} {'parse':>10} {'decrypt':>10}")
+    for row in results:
+        print(f"{row['backend']:<8} {row['format']:<8} {row['size_chars']:>6} "
+              f"{row['parse_us']:>8.2f}us {row['decrypt_ms']:>8.3f}ms")
+
+
+# Run in a fresh interpreter; each prints one JSON object of timings in milliseconds
+STARTUP_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get('/api/status')
+first_request = time.perf_counter()
+client.post('/api/generate-password', json={'length': 16})
+client.post('/api/encrypt-password')
+first_crypto = time.perf_counter()
+print(json.dumps({
+    'import_app_ms': (imported - started) * 1000,
+    'first_request_ms': (first_request - imported) * 1000,
+    'first_crypto_request_ms': (first_crypto - first_request) * 1000,
+}))
+"""
+
+GUI_STARTUP_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import password_manager
+print(json.dumps({'import_gui_ms': (time.perf_counter() - started) * 1000}))
+"""
+
+
+def run_timed_script(script, env):
+    """Run script in a new interpreter and return its JSON output plus the process wall time"""
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', script], env=env, capture_output=True, text=True, check=True)
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['process_ms'] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def bench_startup(runs):
+    env = dict(os.environ)
+    env.setdefault('PASSWORD_MANAGER_VAULT', tempfile.mkdtemp(prefix='pm-bench-vault-'))
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)),
+                                                      env.get('PYTHONPATH')]))
+    samples = {}
+    for _ in range(runs):
+        for name, value in run_timed_script(STARTUP_SCRIPT, env).items():
+            samples.setdefault('web.' + name, []).append(value)
+        try:
+            gui = run_timed_script(GUI_STARTUP_SCRIPT, env)
+        except subprocess.CalledProcessError:
+            continue  # no tkinter in this interpreter
+        for name, value in gui.items():
+            samples.setdefault('gui.' + name, []).append(value)
+    return {name: {'median_ms': statistics.median(values), 'min_ms': min(values), 'max_ms': max(values)}
+            for name, values in samples.items()}
+
+
+def print_startup(results):
+    print(f"{'measurement':<34} {'median':>10} {'min':>10} {'max':>10}")
+    for name, row in sorted(results.items()):
+        print(f"{name:<34} {row['median_ms']:>8.1f}ms {row['min_ms']:>8.1f}ms {row['max_ms']:>8.1f}ms")
+
+
+def environment(app=None):
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'backend': app.get_crypto_backend().name if app is not None else None,
+        'percentiles': PERCENTILE_METHOD,
+        'timestamp': time.time(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Password manager benchmarks")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subcommands.add_parser('run', help="function and HTTP route benchmarks")
+    run_parser.add_argument('--suite', default='functions,http', help="comma-separated suites to run (functions, http)")
+    run_parser.add_argument('--iterations', type=int, default=50, help="calls per crypto/route measurement")
+    run_parser.add_argument('--concurrency', type=int, default=8, help="client threads for concurrent HTTP runs")
+    run_parser.add_argument('--json', help="write results to this file")
+    run_parser.add_argument('--baseline', help="compare against results previously written with --json")
+    run_parser.add_argument('--threshold', type=float, default=0.25, help="allowed regression as a fraction")
+
+    kdf_parser = subcommands.add_parser('kdf', help="latency at different KDF cost settings")
+    kdf_parser.add_argument('--iterations', type=int, default=200, help="calls per cached measurement")
+    kdf_parser.add_argument('--json', help="also write results to this file")
+
+    startup_parser = subcommands.add_parser('startup', help="import and first-request latency in fresh processes")
+    startup_parser.add_argument('--runs', type=int, default=10, help="fresh interpreters to start")
+    startup_parser.add_argument('--json', help="also write results to this file")
+
+    envelope_parser = subcommands.add_parser('envelope', help="size and parse cost of armored vs compact ciphertexts")
+    envelope_parser.add_argument('--iterations', type=int, default=2000, help="parses per measurement")
+    envelope_parser.add_argument('--decrypts', type=int, default=20, help="decrypts per measurement")
+    envelope_parser.add_argument('--json', help="also write results to this file")
+
+    args = parser.parse_args(argv)
+    status = 0
+
+    if args.command == 'run':
+        app = load_app()
+        suites = set(args.suite.split(','))
+        results = {}
+        if 'functions' in suites:
+            results.update(bench_functions(app, args.iterations))
+        if 'http' in suites:
+            results.update(bench_http(app, args.iterations, args.concurrency))
+        print_results(results)
+        output = {'command': 'run', 'environment': environment(app), 'results': results}
+
+        if args.baseline:
+            with open(args.baseline) as baseline_file:
+                baseline = json.load(baseline_file)
+            if baseline.get('environment', {}).get('backend') != output['environment']['backend']:
+                print("\nWarning: baseline was recorded with a different crypto backend")
+            if baseline.get('environment', {}).get('percentiles') != PERCENTILE_METHOD:
+                print("\nWarning: baseline percentiles were computed with an older, biased rank; re-record it")
+            regressions = compare(results, baseline.get('results', {}), args.threshold)
+            if regressions:
+                print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+                status = 1
+            else:
+                print(f"\nNo regressions beyond {args.threshold:.0%}")
+
+    elif args.command == 'kdf':
+        results = bench_kdf(args.iterations)
+        print_kdf(results)
+        output = {'command': 'kdf', 'environment': environment(), 'results': results}
+
+    elif args.command == 'startup':
+        results = bench_startup(args.runs)
+        print_startup(results)
+        output = {'command': 'startup', 'environment': environment(), 'results': results}
+
+    elif args.command == 'envelope':
+        results = bench_envelope(args.iterations, args.decrypts)
+        print_envelope(results)
+        output = {'command': 'envelope', 'environment': environment(), 'results': results}
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(output, json_file, indent=2)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,10 +5,76 @@
 
 const API_URL = 'http://localhost:5000';
 
+// The server's PASSWORD_MANAGER_VAULT_TOKEN; site lookups are skipped without it
+const VAULT_TOKEN = '';
+
+// Session shared by the event stream and the decrypt requests
+let sessionId = null;
+
+// Sanitization strings pushed ahead of time over the event stream
+let pushedStrings = null;
+
+// Strings to use for the next sanitization (from the stream or a fused response)
+let readyStrings = null;
+
+/**
+ * Keep GET /api/events open. The server pushes a batch of sanitization
+ * strings on connect and after every decrypt, so the right-click path needs
+ * one request and sanitizing needs none.
+ */
+async function connectEvents() {
+    try {
+        const headers = sessionId ? { 'X-Session-Id': sessionId } : {};
+        const response = await fetch(`${API_URL}/api/events`, { headers });
+        if (!response.ok) {
+            throw new Error(`event stream refused (${response.status})`);
+        }
+        sessionId = response.headers.get('X-Session-Id') || sessionId;
+        
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += value;
+            let end;
+            while ((end = buffer.indexOf('\n\n')) !== -1) {
+                handleEvent(buffer.slice(0, end));
+                buffer = buffer.slice(end + 2);
+            }
+        }
+    } catch (error) {
+        console.debug('Event stream closed:', error.message);
+    }
+    
+    pushedStrings = null;
+    setTimeout(connectEvents, 3000);
+}
+
+/**
+ * Handle one server-sent event block
+ */
+function handleEvent(block) {
+    let event = 'message';
+    let data = '';
+    for (const line of block.split('\n')) {
+        if (line.startsWith('event: ')) {
+            event = line.slice(7);
+        } else if (line.startsWith('data: ')) {
+            data += line.slice(6);
+        }
+    }
+    if (event === 'sanitize' && data) {
+        pushedStrings = JSON.parse(data).sanitized_strings;
+    }
+}
+
 // Listen for messages from content scripts
 chrome.runtime.onMessage.addListener((request, sender, sendResponse) => {
     if (request.action === 'decryptFromClipboard') {
-        handleDecryption(sendResponse);
+        handleDecryption(sender, sendResponse);
     } else if (request.action === 'sanitizeClipboard') {
         handleSanitization();
     }
@@ -18,21 +84,68 @@ chrome.runtime.onMessage.addListener((request, sender, sendResponse) => {
 });
 
 /**
- * Handle decryption from clipboard
+ * Ask the server for the vault entry tagged with the page's site.
+ * Resolves to the lookup result, or null if the site has no entry.
+ */
+async function lookupSite(sender) {
+    const origin = sender.origin || (sender.tab && sender.tab.url && new URL(sender.tab.url).origin);
+    if (!origin || !origin.startsWith('http') || !VAULT_TOKEN) {
+        return null;
+    }
+    
+    const headers = { 'X-Vault-Token': VAULT_TOKEN };
+    if (sessionId) {
+        headers['X-Session-Id'] = sessionId;
+    }
+    const response = await fetch(`${API_URL}/api/lookup?origin=${encodeURIComponent(origin)}&masked=1`, { headers });
+    if (response.status === 404) {
+        return null;
+    }
+    
+    const result = await response.json();
+    return result.success ? result : null;
+}
+
+/**
+ * Handle decryption: the vault entry for the page's site if there is one,
+ * otherwise whatever is on the clipboard
  */
-async function handleDecryption(sendResponse) {
+async function handleDecryption(sender, sendResponse) {
     try {
+        try {
+            const match = await lookupSite(sender);
+            if (match) {
+                console.log(`✓ Found vault entry for ${match.host}`);
+                sendResponse({
+                    success: true,
+                    source: 'vault',
+                    masked: match.masked,
+                    length: match.length
+                });
+                return;
+            }
+        } catch (error) {
+            console.debug('Site lookup failed, falling back to clipboard:', error);
+        }
+        
         // Read clipboard
         const clipboardText = await navigator.clipboard.readText();
         
         console.log('📋 Clipboard read, sending to server for decryption...');
         
+        // With strings already pushed over the event stream only the decrypt is
+        // needed; otherwise the fused endpoint returns the strings as well
+        const streamed = pushedStrings !== null;
+        const endpoint = streamed ? 'decrypt-from-clipboard' : 'decrypt-and-sanitize';
+        const headers = { 'Content-Type': 'application/json' };
+        if (sessionId) {
+            headers['X-Session-Id'] = sessionId;
+        }
+        
         // Send to Flask backend
-        const response = await fetch(`${API_URL}/api/decrypt-from-clipboard`, {
+        const response = await fetch(`${API_URL}/api/${endpoint}`, {
             method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
+            headers,
             body: JSON.stringify({ data: clipboardText })
         });
         
@@ -40,8 +153,16 @@ async function handleDecryption(sendResponse) {
         
         if (result.success) {
             console.log('✓ Decryption successful');
+            if (streamed) {
+                // The server pushes the next batch after this decrypt
+                readyStrings = pushedStrings;
+                pushedStrings = null;
+            } else {
+                readyStrings = result.sanitized_strings;
+            }
             sendResponse({
                 success: true,
+                source: 'clipboard',
                 masked: result.masked,
                 length: result.length
             });
@@ -65,32 +186,36 @@ async function handleDecryption(sendResponse) {
  */
 async function handleSanitization() {
     try {
-        // Get sanitization strings from server
-        const response = await fetch(`${API_URL}/api/sanitize-clipboard`, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
+        // Use the strings that came with the decrypt; ask the server only if there are none
+        let strings = readyStrings;
+        readyStrings = null;
+        if (!strings) {
+            const response = await fetch(`${API_URL}/api/sanitize-clipboard`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json'
+                }
+            });
+            
+            const result = await response.json();
+            if (!result.success) {
+                return;
             }
-        });
-        
-        const result = await response.json();
+            strings = result.sanitized_strings;
+        }
         
-        if (result.success) {
-            // Write each sanitization string to clipboard sequentially
-            const strings = result.sanitized_strings;
+        // Write each sanitization string to clipboard sequentially
+        for (let i = 0; i < strings.length; i++) {
+            await navigator.clipboard.writeText(strings[i]);
+            console.log(`✓ Clipboard sanitized (${i + 1}/5)`);
             
-            for (let i = 0; i < strings.length; i++) {
-                await navigator.clipboard.writeText(strings[i]);
-                console.log(`✓ Clipboard sanitized (${i + 1}/5)`);
-                
-                // Small delay between writes
-                if (i < strings.length - 1) {
-                    await sleep(100);
-                }
+            // Small delay between writes
+            if (i < strings.length - 1) {
+                await sleep(100);
             }
-            
-            console.log('✓ Clipboard sanitization complete');
         }
+        
+        console.log('✓ Clipboard sanitization complete');
     } catch (error) {
         console.debug('Sanitization background process completed');
     }
@@ -103,4 +228,6 @@ function sleep(ms) {
     return new Promise(resolve => setTimeout(resolve, ms));
 }
 
+connectEvents();
+
 console.log('🔐 Password Manager Background Service Worker loaded');
@@ -34,12 +34,14 @@ document.addEventListener('contextmenu', async (event) => {
                 target.dispatchEvent(new Event('input', { bubbles: true }));
                 target.dispatchEvent(new Event('change', { bubbles: true }));
                 
-                // Sanitize clipboard
-                chrome.runtime.sendMessage({
-                    action: 'sanitizeClipboard'
-                }).catch(err => {
-                    console.log('Sanitization sent to background');
-                });
+                // Sanitize clipboard (not needed when the password came from the vault)
+                if (response.source !== 'vault') {
+                    chrome.runtime.sendMessage({
+                        action: 'sanitizeClipboard'
+                    }).catch(err => {
+                        console.log('Sanitization sent to background');
+                    });
+                }
                 
                 // Show visual feedback
                 showNotification(`✓ Password decrypted and pasted (${response.length} chars)`);
@@ -0,0 +1,105 @@
+"""
+Background clipboard access for the Tk GUI.
+
+One long-lived thread owns the clipboard.  The GUI queues copy, paste and
+sanitize commands and gets each result back through a dispatch callable that
+runs the callback on the Tk thread, so clipboard I/O (on Linux every
+pyperclip call runs xclip or xsel) never blocks the UI.
+
+pyperclip's clipboard mechanism is determined once, when the thread starts,
+and reused for every command.  A sanitize request made while another is
+still waiting in the queue is folded into it rather than queued again.
+"""
+
+import queue
+import threading
+import time
+
+from entropy_pool import sanitization_strings
+
+
+class ClipboardService:
+    """Single worker thread serving clipboard commands from a queue
+
+    Callbacks are called as dispatch(callback, result, error), where error is
+    None on success.
+    """
+
+    def __init__(self, dispatch, interval=0.1):
+        self.interval = interval
+        self._dispatch = dispatch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._sanitize_callbacks = None
+        self._copy = None
+        self._paste = None
+        self._probe_error = None
+        self.commands = 0
+        self.coalesced = 0
+        self._thread = threading.Thread(target=self._run, name='clipboard', daemon=True)
+        self._thread.start()
+
+    def copy(self, text, on_done=None):
+        """Put text on the clipboard"""
+        self._queue.put((self._do_copy, (text,), [on_done]))
+
+    def paste(self, on_done):
+        """Read the clipboard; on_done receives its text"""
+        self._queue.put((self._do_paste, (), [on_done]))
+
+    def sanitize(self, count=5, length=264, on_done=None):
+        """Overwrite the clipboard count times with random strings"""
+        with self._lock:
+            if self._sanitize_callbacks is not None:
+                self._sanitize_callbacks.append(on_done)
+                self.coalesced += 1
+                return
+            self._sanitize_callbacks = [on_done]
+            callbacks = self._sanitize_callbacks
+        self._queue.put((self._do_sanitize, (count, length), callbacks))
+
+    def stop(self, timeout=None):
+        """Finish the queued commands, then stop the thread"""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        try:
+            import pyperclip
+            self._copy, self._paste = pyperclip.determine_clipboard()
+        except Exception as e:
+            self._probe_error = e
+
+        while True:
+            command = self._queue.get()
+            if command is None:
+                return
+            action, args, callbacks = command
+            self.commands += 1
+            if action == self._do_sanitize:
+                # Requests arriving from here on need a pass of their own
+                with self._lock:
+                    self._sanitize_callbacks = None
+            result, error = None, None
+            try:
+                if self._probe_error is not None:
+                    raise RuntimeError(f"No clipboard available: {self._probe_error}")
+                result = action(*args)
+            except Exception as e:
+                error = e
+            for callback in callbacks:
+                if callback is not None:
+                    self._dispatch(callback, result, error)
+
+    def _do_copy(self, text):
+        self._copy(text)
+
+    def _do_paste(self):
+        return self._paste()
+
+    def _do_sanitize(self, count, length):
+        for index, random_str in enumerate(sanitization_strings(count, length)):
+            if index:
+                time.sleep(self.interval)
+            self._copy(random_str)
+        return count
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Bulk import and export of credentials as CSV or JSON.
+
+    python credential_io.py import FILE [--type csv|json] [--format armor|compact]
+    python credential_io.py export FILE [--type csv|json] [--format armor|compact] [--plaintext]
+
+FILE may be - for stdin/stdout.  The web app exposes the same through
+POST /api/vault/import and GET /api/vault/export.
+
+Records have a name, an origin (or url), an optional username, and either a
+password, which is encrypted on import, or data, a ciphertext stored as is
+(what an export writes).  CSV files need a header row; JSON is an array of
+objects or one object per line.  Column names from common browser exports
+(title, url, login) are accepted.
+
+Input is parsed incrementally and records are encrypted in parallel batches
+on a worker pool, then written to the vault a batch at a time, so memory
+use does not depend on the size of the file.  Exports stream the vault
+entry by entry and contain ciphertexts unless --plaintext is given (CLI only).
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+
+import envelope
+from site_index import host_of
+
+CSV = 'csv'
+JSON = 'json'
+FILE_TYPES = (CSV, JSON)
+
+CONTENT_TYPES = {CSV: 'text/csv', JSON: 'application/json'}
+COLUMNS = ('name', 'origin', 'username', 'data')
+ALIASES = {'title': 'name', 'url': 'origin', 'login': 'username', 'ciphertext': 'data'}
+
+DEFAULT_BATCH_SIZE = 256
+MAX_RECORD_CHARS = 1024 * 1024
+MAX_REPORTED_ERRORS = 100
+READ_SIZE = 64 * 1024
+
+
+class TransferError(ValueError):
+    """Raised for input that cannot be parsed any further"""
+
+
+def file_type_of(name, default=None):
+    """csv or json from a file name, content type or explicit type; default if it says neither"""
+    name = (name or '').lower()
+    if name in FILE_TYPES:
+        return name
+    if name.endswith('.csv') or 'csv' in name:
+        return CSV
+    if name.endswith(('.json', '.ndjson', '.jsonl')) or 'json' in name:
+        return JSON
+    return default
+
+
+def _iter_csv(stream):
+    reader = csv.DictReader(stream)
+    try:
+        for row in reader:
+            yield reader.line_num, row
+    except csv.Error as e:
+        raise TransferError(f"Line {reader.line_num}: {e}")
+
+
+def _iter_json(stream):
+    """Objects from a JSON array or from JSON lines, decoded a value at a time"""
+    decoder = json.JSONDecoder()
+    buffer, position, eof = '', 0, False
+    line, counted = 1, 0  # line is the line number of buffer[counted]
+    in_array = None
+    while True:
+        # Skip whitespace (and commas inside an array), reading more as needed
+        separators = ' \t\r\n,' if in_array else ' \t\r\n'
+        while True:
+            while position < len(buffer) and buffer[position] in separators:
+                position += 1
+            if position < len(buffer) or eof:
+                break
+            line += buffer.count('\n', counted)
+            buffer, position, counted = stream.read(READ_SIZE), 0, 0
+            eof = not buffer
+        if position >= len(buffer):
+            if in_array:
+                raise TransferError("Unterminated JSON array")
+            return
+        if in_array is None:
+            in_array = buffer[position] == '['
+            if in_array:
+                position += 1
+                continue
+        if in_array and buffer[position] == ']':
+            return
+
+        line += buffer.count('\n', counted, position)
+        counted = position
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                break
+            except json.JSONDecodeError as e:
+                if eof or len(buffer) - position > MAX_RECORD_CHARS:
+                    raise TransferError(f"Line {line}: {e.msg}")
+                chunk = stream.read(READ_SIZE)
+                buffer, position, counted, eof = buffer[position:] + chunk, 0, 0, not chunk
+        yield line, value
+        position = end
+
+
+def read_records(stream, file_type):
+    """Yield (line, record) for each record in a text stream; record is a dict or an error message"""
+    rows = _iter_csv(stream) if file_type == CSV else _iter_json(stream)
+    for line, raw in rows:
+        if not isinstance(raw, dict):
+            yield line, "Record must be an object"
+            continue
+        fields = {}
+        for key, value in raw.items():
+            if key is None or value is None:
+                continue
+            key = key.strip().lower()
+            fields[ALIASES.get(key, key)] = value if isinstance(value, str) else str(value)
+
+        origin = host_of(fields.get('origin'))
+        record = {'name': fields.get('name') or origin, 'origin': origin or None}
+        if fields.get('username'):
+            record['username'] = fields['username']
+        if fields.get('password'):
+            record['password'] = fields['password']
+        elif fields.get('data'):
+            try:
+                envelope.to_compact(fields['data'])
+            except envelope.EnvelopeError:
+                yield line, "data is not a recognized ciphertext"
+                continue
+            record['data'] = fields['data']
+        else:
+            yield line, "Record has neither a password nor data"
+            continue
+        yield line, record
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_records(records, encrypt, pool, store, batch_size=DEFAULT_BATCH_SIZE, flush=None):
+    """Encrypt (line, record) pairs in parallel batches and store them; returns a summary dict
+
+    encrypt(password) returns a ciphertext, store(ciphertext, record) saves
+    one entry, and flush(), if given, runs after each batch is stored.  If the
+    input turns out to be malformed, the records read before that point are
+    still stored and summary['stopped'] says why the import ended early.
+    """
+    summary = {'imported': 0, 'failed': 0, 'errors': []}
+
+    def readable():
+        try:
+            yield from records
+        except (TransferError, UnicodeDecodeError) as e:
+            summary['stopped'] = str(e)
+
+    def fail(line, message):
+        summary['failed'] += 1
+        if len(summary['errors']) < MAX_REPORTED_ERRORS:
+            summary['errors'].append({'line': line, 'error': message})
+
+    for batch in _batches(readable(), batch_size):
+        passwords = [record['password'] for _, record in batch if isinstance(record, dict) and 'password' in record]
+        outcomes = iter(pool.map_results(encrypt, passwords))
+
+        for line, record in batch:
+            if not isinstance(record, dict):
+                fail(line, record)
+                continue
+            if 'password' in record:
+                ok, value = next(outcomes)
+                if not ok:
+                    fail(line, f"Encryption failed: {value}")
+                    continue
+                ciphertext = value
+            else:
+                ciphertext = record['data']
+            store(ciphertext, record)
+            summary['imported'] += 1
+        if flush is not None:
+            flush()
+    return summary
+
+
+def export_entries(entries, file_type, decrypt=None, pool=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Yield text chunks of a CSV or JSON dump of vault entries
+
+    Entries carry their ciphertext as data; with decrypt (and a pool to run
+    it on) they carry the decrypted password instead.
+    """
+    secret = 'password' if decrypt is not None else 'data'
+    columns = COLUMNS[:-1] + (secret,)
+    first = True
+    if file_type == CSV:
+        header = io.StringIO()
+        csv.writer(header).writerow(columns)
+        yield header.getvalue()
+    else:
+        yield '['
+
+    for batch in _batches(entries, batch_size):
+        if decrypt is not None:
+            secrets = pool.map_results(decrypt, [entry['ciphertext'] for entry in batch])
+        else:
+            secrets = [(True, entry['ciphertext']) for entry in batch]
+
+        chunk = io.StringIO()
+        writer = csv.writer(chunk) if file_type == CSV else None
+        for entry, (ok, value) in zip(batch, secrets):
+            if not ok:
+                raise TransferError(f"Could not decrypt entry {entry['id']}: {value}")
+            row = [entry.get('name', ''), entry.get('origin') or '', entry.get('username') or '', value]
+            if writer is not None:
+                writer.writerow(row)
+            else:
+                chunk.write(('\n' if first else ',\n') + json.dumps(dict(zip(columns, row))))
+                first = False
+        yield chunk.getvalue()
+
+    if file_type == JSON:
+        yield '\n]\n'
+
+
+def main(argv=None):
+    import app
+    from vault import Vault, VaultError
+
+    parser = argparse.ArgumentParser(description="Import or export credentials as CSV or JSON")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = subcommands.add_parser('import', help="add the records of a CSV or JSON file to the vault")
+    import_parser.add_argument('file', help="file to read, - for stdin")
+    import_parser.add_argument('--format', default=app.CIPHERTEXT_FORMAT, choices=envelope.FORMATS,
+                               help="ciphertext format to store")
+    import_parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                               help="records encrypted in parallel per batch")
+
+    export_parser = subcommands.add_parser('export', help="write the vault to a CSV or JSON file")
+    export_parser.add_argument('file', help="file to write, - for stdout")
+    export_parser.add_argument('--format', default=app.CIPHERTEXT_FORMAT, choices=envelope.FORMATS,
+                               help="ciphertext format to write")
+    export_parser.add_argument('--plaintext', action='store_true',
+                               help="write decrypted passwords instead of ciphertexts")
+
+    for subparser in (import_parser, export_parser):
+        subparser.add_argument('--type', choices=FILE_TYPES, help="file type (default: from the file name, else csv)")
+        subparser.add_argument('--vault', default=app.VAULT_PATH, help="vault directory")
+    args = parser.parse_args(argv)
+
+    file_type = args.type or file_type_of(args.file, CSV)
+    batch_size = min(getattr(args, 'batch_size', DEFAULT_BATCH_SIZE), app.crypto_pool.max_pending)
+    try:
+        with Vault(args.vault, lock_timeout=app.VAULT_LOCK_TIMEOUT) as vault:
+            if args.command == 'import':
+                def store(ciphertext, record):
+                    metadata = {key: record[key] for key in ('origin', 'username') if record.get(key)}
+                    vault.put(ciphertext, name=record['name'], **metadata)
+
+                stream = (io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+                          if args.file == '-' else open(args.file, encoding='utf-8-sig', newline=''))
+                with stream:
+                    summary = import_records(
+                        read_records(stream, file_type),
+                        lambda password: app.PasswordManager.encrypt_password(password, args.format),
+                        app.crypto_pool, store, batch_size=batch_size, flush=vault.sync)
+                for error in summary['errors']:
+                    print(f"line {error['line']}: {error['error']}", file=sys.stderr)
+                print(f"Imported {summary['imported']} records, {summary['failed']} failed")
+                if 'stopped' in summary:
+                    raise TransferError(f"Import stopped: {summary['stopped']}")
+                return 1 if summary['failed'] else 0
+
+            entries = (dict(entry, ciphertext=app.in_format(entry['ciphertext'], args.format))
+                       for entry in vault.iter_entries())
+            decrypt = app.PasswordManager.decrypt_password if args.plaintext else None
+            # Owner-only, since the file may hold plaintext passwords
+            stream = sys.stdout if args.file == '-' else open(
+                args.file, 'w', newline='', opener=lambda path, flags: os.open(path, flags, 0o600))
+            try:
+                for chunk in export_entries(entries, file_type, decrypt, app.crypto_pool, batch_size):
+                    stream.write(chunk)
+            finally:
+                if stream is not sys.stdout:
+                    stream.close()
+            print(f"Exported {len(vault)} entries", file=sys.stderr)
+            return 0
+    except (TransferError, VaultError, OSError) as e:
+        print(f"credential_io: {e}", file=sys.stderr)
+        return 2
+    finally:
+        app.shutdown()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
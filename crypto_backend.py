@@ -0,0 +1,244 @@
+"""
+Pluggable encryption backends for the password manager.
+
+GnuPGBackend keeps the original behaviour of shelling out to `gpg` for every
+operation.  AEADBackend does the work in-process with AES-256-GCM, avoiding a
+fork/exec per call, and can still decrypt the armored OpenPGP messages the
+GnuPG backend produced.  Its keys come from a KeyManager (key_manager.py), so
+the passphrase KDF runs once per session rather than once per call.
+
+The backend is chosen with the PASSWORD_MANAGER_BACKEND environment variable
+("gnupg" or "aead") or by passing a name to get_backend(), and the passphrase
+with PASSWORD_MANAGER_PASSPHRASE (rekey.py rotates a vault to a new one).
+
+Both backends can also return the compact envelope (envelope.py) instead of
+ASCII armor, and both decrypt either form.
+"""
+
+import os
+import struct
+
+import envelope
+import key_manager
+
+DEFAULT_PASSPHRASE = 'password_manager_default_key'
+DEFAULT_BACKEND = 'gnupg'
+BACKEND_ENV_VAR = 'PASSWORD_MANAGER_BACKEND'
+PASSPHRASE_ENV_VAR = 'PASSWORD_MANAGER_PASSPHRASE'
+
+
+class CryptoError(Exception):
+    """Raised when a backend fails to encrypt or decrypt
+
+    status is a short, low-cardinality reason (gpg's status line for the
+    gnupg backend) suitable for grouping failures in metrics.
+    """
+
+    def __init__(self, message, status='error'):
+        super().__init__(message)
+        self.status = status
+
+
+class CryptoBackend:
+    """Interface shared by all encryption backends"""
+
+    name = None
+
+    def encrypt(self, plaintext):
+        """Encrypt a string and return an ASCII-safe ciphertext string"""
+        raise NotImplementedError
+
+    def encrypt_compact(self, plaintext):
+        """Encrypt a string and return it in the compact envelope"""
+        try:
+            return envelope.to_compact(self.encrypt(plaintext))
+        except envelope.EnvelopeError as e:
+            raise CryptoError(f"Encryption failed: {e}", status='malformed message')
+
+    def decrypt(self, ciphertext):
+        """Decrypt a ciphertext string produced by any supported backend"""
+        raise NotImplementedError
+
+
+def _unpack(text):
+    try:
+        return envelope.unpack(text)
+    except envelope.EnvelopeError as e:
+        raise CryptoError(f"Decryption failed: {e}", status='malformed message')
+
+
+class GnuPGBackend(CryptoBackend):
+    """Symmetric AES256 encryption through the gpg binary (one process per call)"""
+
+    name = 'gnupg'
+
+    def __init__(self, gnupghome, passphrase=DEFAULT_PASSPHRASE, s2k_count=None):
+        import gnupg
+
+        self.gpg = gnupg.GPG(gnupghome=gnupghome)
+        self.passphrase = passphrase
+        # gpg re-runs its S2K on every call; the iteration count is its only cost knob
+        self.extra_args = ['--s2k-count', str(s2k_count)] if s2k_count else None
+
+    def encrypt(self, plaintext):
+        encrypted_data = self.gpg.encrypt(
+            plaintext,
+            recipients=None,
+            symmetric='AES256',
+            always_trust=True,
+            passphrase=self.passphrase,
+            extra_args=self.extra_args
+        )
+
+        if not encrypted_data.ok:
+            raise CryptoError(f"Encryption failed: {encrypted_data.status}", status=encrypted_data.status)
+
+        return str(encrypted_data)
+
+    def decrypt(self, ciphertext):
+        if envelope.is_compact(ciphertext):
+            kind, message = _unpack(ciphertext)
+            if kind != envelope.KIND_OPENPGP:
+                raise CryptoError("Decryption failed: the gnupg backend cannot read aead messages",
+                                  status='unsupported message')
+            ciphertext = message  # gpg reads binary OpenPGP as well as armor
+        decrypted_data = self.gpg.decrypt(
+            ciphertext,
+            always_trust=True,
+            passphrase=self.passphrase
+        )
+
+        if not decrypted_data.ok:
+            raise CryptoError(f"Decryption failed: {decrypted_data.status}", status=decrypted_data.status)
+
+        return str(decrypted_data)
+
+
+class AEADBackend(CryptoBackend):
+    """In-process AES-256-GCM encryption with a passphrase-derived key
+
+    Messages are armored like OpenPGP but with their own header line.  The
+    binary payload is:
+
+        version (1) | kdf id (1) | kdf cost (4) | salt (16) | nonce (12) | ciphertext+tag
+
+    with everything before the ciphertext authenticated as associated data.
+    The salt is the key manager's session salt, so messages encrypted in the
+    same session share one derived key.
+    """
+
+    name = 'aead'
+
+    ARMOR_BEGIN = envelope.AEAD_ARMOR_BEGIN
+    ARMOR_END = envelope.AEAD_ARMOR_END
+    VERSION = 1
+    HEADER = struct.Struct(">BBI16s12s")
+
+    def __init__(self, passphrase=DEFAULT_PASSPHRASE, gnupghome=None, keys=None):
+        try:
+            from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        except ImportError:
+            raise CryptoError("The aead backend requires the 'cryptography' package")
+
+        self._aesgcm = AESGCM
+        self.keys = keys or key_manager.from_environment(passphrase)
+        self.gnupghome = gnupghome
+        self._legacy_backend = None
+
+    def encrypt(self, plaintext):
+        return envelope.armor_aead(self._seal(plaintext))
+
+    def encrypt_compact(self, plaintext):
+        return envelope.pack(envelope.KIND_AEAD, self._seal(plaintext))
+
+    def _seal(self, plaintext):
+        try:
+            kdf, cost, salt, key = self.keys.session_key()
+        except RuntimeError as e:
+            raise CryptoError(f"Encryption failed: {e}", status='locked')
+        nonce = os.urandom(12)
+        header = self.HEADER.pack(self.VERSION, kdf, cost, salt, nonce)
+        return header + self._aesgcm(key).encrypt(nonce, plaintext.encode('utf-8'), header)
+
+    def decrypt(self, ciphertext):
+        import openpgp
+
+        text = ciphertext.strip()
+        if envelope.is_compact(text):
+            kind, message = _unpack(text)
+            if kind == envelope.KIND_AEAD:
+                return self._decrypt_native(message)
+            return self._decrypt_openpgp(message)
+        if text.startswith(self.ARMOR_BEGIN):
+            try:
+                return self._decrypt_native(envelope.dearmor_aead(text))
+            except envelope.EnvelopeError as e:
+                raise CryptoError(f"Decryption failed: {e}", status='malformed message')
+        if openpgp.is_armored(text):
+            return self._decrypt_openpgp(text)
+        raise CryptoError("Decryption failed: unrecognized message format", status='unrecognized format')
+
+    def _decrypt_native(self, data):
+        from cryptography.exceptions import InvalidTag
+
+        if len(data) < self.HEADER.size + 16:
+            raise CryptoError("Decryption failed: truncated message", status='malformed message')
+
+        header = data[:self.HEADER.size]
+        version, kdf, cost, salt, nonce = self.HEADER.unpack(header)
+        if version != self.VERSION:
+            raise CryptoError(f"Decryption failed: unsupported message version {version}",
+                              status='unsupported message')
+
+        try:
+            key = self.keys.key_for(kdf, cost, salt)
+        except (ValueError, RuntimeError) as e:
+            raise CryptoError(f"Decryption failed: {e}", status='bad key parameters')
+        try:
+            plaintext = self._aesgcm(key).decrypt(nonce, data[self.HEADER.size:], header)
+        except InvalidTag:
+            raise CryptoError("Decryption failed: bad passphrase or corrupted message", status='bad passphrase')
+        return plaintext.decode('utf-8', errors='replace')
+
+    def _decrypt_openpgp(self, message):
+        """Decrypt an armored or binary OpenPGP message"""
+        import openpgp
+
+        try:
+            # python-gnupg decodes results as latin-1; match it for legacy data
+            return openpgp.decrypt_message(message, s2k_key=self.keys.s2k_key).decode('latin-1')
+        except openpgp.UnsupportedMessage:
+            if self.gnupghome is None:
+                raise CryptoError("Decryption failed: unsupported OpenPGP message", status='unsupported message')
+        except openpgp.BadPassphrase as e:
+            raise CryptoError(f"Decryption failed: {e}", status='bad passphrase')
+        except Exception as e:
+            raise CryptoError(f"Decryption failed: {e}", status='malformed message')
+
+        # Fall back to the gpg binary for OpenPGP features we don't parse
+        if self._legacy_backend is None:
+            self._legacy_backend = GnuPGBackend(self.gnupghome, self.keys.passphrase())
+        return self._legacy_backend.decrypt(message if isinstance(message, str) else openpgp.armor(message))
+
+
+BACKENDS = {
+    GnuPGBackend.name: GnuPGBackend,
+    AEADBackend.name: AEADBackend,
+}
+
+
+def get_backend(name=None, gnupghome=None, passphrase=None, keys=None):
+    """Create the named backend, defaulting to $PASSWORD_MANAGER_BACKEND or gnupg"""
+    name = (name or os.environ.get(BACKEND_ENV_VAR) or DEFAULT_BACKEND).lower()
+    if passphrase is None:
+        passphrase = os.environ.get(PASSPHRASE_ENV_VAR) or DEFAULT_PASSPHRASE
+
+    if name == GnuPGBackend.name:
+        if gnupghome is None:
+            raise CryptoError("The gnupg backend requires a gnupghome directory")
+        s2k_count = os.environ.get('PASSWORD_MANAGER_GPG_S2K_COUNT')
+        return GnuPGBackend(gnupghome, passphrase, s2k_count=int(s2k_count) if s2k_count else None)
+    if name == AEADBackend.name:
+        return AEADBackend(passphrase, gnupghome=gnupghome, keys=keys)
+
+    raise CryptoError(f"Unknown crypto backend '{name}'. Choose from: {', '.join(BACKENDS)}")
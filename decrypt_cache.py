@@ -0,0 +1,123 @@
+"""
+Short-lived cache of decryption results keyed by a ciphertext digest.
+
+The browser extension re-sends the same armored ciphertext on every
+right-click; caching the plaintext for a few seconds skips the repeated
+decrypt and S2K key derivation.  Keys are keyed BLAKE2b digests (the key is
+random per process) so the cache never holds the ciphertext itself, and
+plaintexts live in bytearrays that are zeroed when an entry is evicted,
+expires or is cleared.
+
+A cache with max_entries=0 or ttl=0 is disabled: lookups always miss and
+nothing is stored.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+def _wipe(buffer):
+    buffer[:] = b"\x00" * len(buffer)
+
+
+class DecryptCache:
+    """Bounded LRU + TTL map from ciphertext digest to plaintext"""
+
+    def __init__(self, max_entries=128, ttl=30, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._digest_key = os.urandom(32)
+        self._entries = OrderedDict()
+        self._expiry = deque()  # (expires, key) in insertion order, which is expiry order
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.ttl > 0
+
+    def _key(self, ciphertext):
+        data = ciphertext.strip().encode('utf-8')
+        return hashlib.blake2b(data, key=self._digest_key, digest_size=32).digest()
+
+    def _evict(self, key):
+        expires, buffer = self._entries.pop(key)
+        _wipe(buffer)
+        self.evictions += 1
+
+    def get(self, ciphertext):
+        """Return the cached plaintext for ciphertext, or None on a miss"""
+        if not self.enabled:
+            self.misses += 1
+            return None
+
+        key = self._key(ciphertext)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= self._clock():
+                self._evict(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1].decode('utf-8')
+
+    def put(self, ciphertext, plaintext):
+        """Remember plaintext for ciphertext until the TTL runs out"""
+        if not self.enabled:
+            return
+
+        key = self._key(ciphertext)
+        buffer = bytearray(plaintext.encode('utf-8'))
+        with self._lock:
+            self._purge_expired()
+            if key in self._entries:
+                self._evict(key)
+            expires = self._clock() + self.ttl
+            self._entries[key] = (expires, buffer)
+            self._expiry.append((expires, key))
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries)))
+
+    def _purge_expired(self):
+        now = self._clock()
+        while self._expiry and self._expiry[0][0] <= now:
+            expires, key = self._expiry.popleft()
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == expires:  # not evicted or replaced since
+                self._evict(key)
+
+    def purge_expired(self):
+        """Wipe and drop entries whose TTL has run out"""
+        with self._lock:
+            self._purge_expired()
+
+    def clear(self):
+        """Wipe and drop every cached plaintext"""
+        with self._lock:
+            for _, buffer in self._entries.values():
+                _wipe(buffer)
+            self._entries.clear()
+            self._expiry.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Return hit/miss/eviction counters and the current size"""
+        return {
+            'enabled': self.enabled,
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
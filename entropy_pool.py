@@ -0,0 +1,134 @@
+"""
+Background-refilled pool of random bytes.
+
+A daemon thread keeps a ring buffer topped up from os.urandom so request
+handlers (password generation, clipboard sanitization strings) can take the
+random material they need with one slice copy instead of generating it on
+the request path.  Bytes are zeroed as they are handed out.  When the buffer
+cannot satisfy a read the caller falls back to os.urandom directly and the
+pool counts it as an empty event.
+"""
+
+import os
+import threading
+import time
+
+from password_generator import DEFAULT_ALPHABET, SANITIZE_ALPHABET, PasswordGenerator
+
+
+class EntropyPool:
+    """Ring buffer of random bytes refilled by a background thread"""
+
+    def __init__(self, capacity=1024 * 1024, low_watermark=0.5, refill_chunk=64 * 1024):
+        self.capacity = capacity
+        self.refill_chunk = refill_chunk
+        self._low_watermark = int(capacity * low_watermark)
+        self._buffer = bytearray(capacity)
+        self._start = 0
+        self._available = 0
+        self._lock = threading.Lock()
+        self._refill_needed = threading.Event()
+        self._thread = None
+        self._stopped = False
+
+        self.reads = 0
+        self.empty_events = 0
+        self.bytes_served = 0
+        self.bytes_refilled = 0
+        self._refill_seconds = 0.0
+
+    def start(self):
+        """Start the refill thread (idempotent)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name='entropy-pool', daemon=True)
+            self._thread.start()
+        self._refill_needed.set()
+
+    def stop(self):
+        """Stop the refill thread and wipe the buffer"""
+        self._stopped = True
+        self._refill_needed.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            self._buffer[:] = bytes(self.capacity)
+            self._available = 0
+
+    def _run(self):
+        while not self._stopped:
+            self._refill_needed.wait()
+            self._refill_needed.clear()
+            while not self._stopped and self._available < self.capacity:
+                started = time.perf_counter()
+                # Only this thread adds bytes, so free space can only grow meanwhile
+                count = min(self.capacity - self._available, self.refill_chunk)
+                chunk = os.urandom(count)
+                with self._lock:
+                    end = (self._start + self._available) % self.capacity
+                    first = min(count, self.capacity - end)
+                    self._buffer[end:end + first] = chunk[:first]
+                    self._buffer[:count - first] = chunk[first:]
+                    self._available += count
+                self.bytes_refilled += count
+                self._refill_seconds += time.perf_counter() - started
+
+    def read(self, count):
+        """Return count random bytes, from the buffer when it holds enough"""
+        if self._thread is None:
+            self.start()
+
+        with self._lock:
+            self.reads += 1
+            if count > self._available:
+                # Oversized reads could never be served; only count real shortfalls
+                if count <= self._low_watermark:
+                    self.empty_events += 1
+                data = None
+            else:
+                first = min(count, self.capacity - self._start)
+                data = bytes(self._buffer[self._start:self._start + first]) + bytes(self._buffer[:count - first])
+                self._buffer[self._start:self._start + first] = bytes(first)
+                self._buffer[:count - first] = bytes(count - first)
+                self._start = (self._start + count) % self.capacity
+                self._available -= count
+                self.bytes_served += count
+            low = self._available < self._low_watermark
+
+        if low:
+            self._refill_needed.set()
+        if data is None:
+            data = os.urandom(count)
+        return data
+
+    @property
+    def available(self):
+        """Bytes currently buffered"""
+        return self._available
+
+    def stats(self):
+        """Return fill level, refill rate and empty-pool counters"""
+        return {
+            'capacity': self.capacity,
+            'available': self._available,
+            'reads': self.reads,
+            'empty_events': self.empty_events,
+            'bytes_served': self.bytes_served,
+            'bytes_refilled': self.bytes_refilled,
+            'refill_rate_bytes_per_sec': self.bytes_refilled / self._refill_seconds if self._refill_seconds else 0.0,
+        }
+
+
+default_pool = EntropyPool()
+
+# Generators whose randomness comes from the shared pool
+password_generator = PasswordGenerator(DEFAULT_ALPHABET, source=default_pool.read)
+sanitize_generator = PasswordGenerator(SANITIZE_ALPHABET, source=default_pool.read)
+
+
+def sanitization_strings(count=5, length=264):
+    """Return count random strings for overwriting the clipboard"""
+    return list(sanitize_generator.generate_many(count, length))
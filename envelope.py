@@ -0,0 +1,116 @@
+"""
+Compact ciphertext envelope.
+
+Backends produce ASCII-armored messages: BEGIN/END lines, line-wrapped
+base64 and (for OpenPGP) a CRC, about 1.4x the size of the binary message.
+The compact envelope carries the same binary message as a single
+unpadded base64url token:
+
+    "pm." + base64url(version (1) | kind (1) | message)
+
+kind says what the message is: KIND_OPENPGP for a binary OpenPGP message
+(gnupg backend), KIND_AEAD for the aead backend's header+ciphertext.  The
+two forms hold identical bytes, so converting between them needs no key,
+and every backend's decrypt accepts either.
+"""
+
+import base64
+import binascii
+
+ARMOR = 'armor'
+COMPACT = 'compact'
+FORMATS = (ARMOR, COMPACT)
+
+PREFIX = 'pm.'
+VERSION = 1
+KIND_OPENPGP = 1
+KIND_AEAD = 2
+
+AEAD_ARMOR_BEGIN = "-----BEGIN PASSWORD MANAGER MESSAGE-----"
+AEAD_ARMOR_END = "-----END PASSWORD MANAGER MESSAGE-----"
+
+
+class EnvelopeError(ValueError):
+    """Raised for a malformed compact envelope or an unrecognized message"""
+
+
+def is_compact(text):
+    return text.lstrip().startswith(PREFIX)
+
+
+def detect(text):
+    """ARMOR or COMPACT, whichever form text is in"""
+    return COMPACT if is_compact(text) else ARMOR
+
+
+def pack(kind, message):
+    """Wrap a binary message in a compact envelope"""
+    return PREFIX + base64.urlsafe_b64encode(bytes((VERSION, kind)) + message).rstrip(b'=').decode('ascii')
+
+
+def unpack(text):
+    """Return (kind, binary message) from a compact envelope"""
+    token = text.strip()[len(PREFIX):]
+    try:
+        data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+    except (binascii.Error, ValueError):
+        raise EnvelopeError("Invalid base64url in compact message")
+    if len(data) < 3:
+        raise EnvelopeError("Truncated compact message")
+    if data[0] != VERSION:
+        raise EnvelopeError(f"Unsupported compact message version {data[0]}")
+    if data[1] not in (KIND_OPENPGP, KIND_AEAD):
+        raise EnvelopeError(f"Unknown compact message kind {data[1]}")
+    return data[1], data[2:]
+
+
+def armor_aead(message):
+    """ASCII armor for an aead backend message"""
+    body = base64.b64encode(message).decode('ascii')
+    lines = [body[i:i + 64] for i in range(0, len(body), 64)]
+    return "\n".join([AEAD_ARMOR_BEGIN, ""] + lines + [AEAD_ARMOR_END, ""])
+
+
+def dearmor_aead(text):
+    """Binary message from an aead backend armor"""
+    lines = text.strip().splitlines()
+    if lines[-1].strip() != AEAD_ARMOR_END:
+        raise EnvelopeError("Truncated message")
+    try:
+        return base64.b64decode("".join(lines[1:-1]), validate=True)
+    except ValueError:
+        raise EnvelopeError("Invalid base64 in armored message")
+
+
+def to_compact(text):
+    """Convert an armored message to a compact envelope (compact input is returned as is)"""
+    import openpgp
+
+    text = text.strip()
+    if is_compact(text):
+        return text
+    if text.startswith(AEAD_ARMOR_BEGIN):
+        return pack(KIND_AEAD, dearmor_aead(text))
+    if openpgp.is_armored(text):
+        try:
+            return pack(KIND_OPENPGP, openpgp.dearmor(text))
+        except openpgp.OpenPGPError as e:
+            raise EnvelopeError(str(e))
+    raise EnvelopeError("Unrecognized message format")
+
+
+def to_armor(text):
+    """Convert a compact envelope to the armored message it holds (armored input is returned as is)"""
+    import openpgp
+
+    if not is_compact(text):
+        return text
+    kind, message = unpack(text)
+    if kind == KIND_AEAD:
+        return armor_aead(message)
+    return openpgp.armor(message)
+
+
+def convert(text, fmt):
+    """text in the given format (ARMOR or COMPACT)"""
+    return to_compact(text) if fmt == COMPACT else to_armor(text)
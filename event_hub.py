@@ -0,0 +1,103 @@
+"""
+Server-sent event channels for clients that keep a connection open.
+
+The browser extension's background worker holds one GET /api/events stream
+per session.  Instead of asking for sanitization strings after every
+decrypt, it gets the next batch pushed down the open stream ahead of time,
+so the right-click hot path is a single request.
+
+Channels live in the process that serves the stream.  With several worker
+processes an event published by another worker is not seen; clients then
+fall back to the fused /api/decrypt-and-sanitize endpoint.
+"""
+
+import json
+import threading
+from collections import deque
+
+
+class HubFull(Exception):
+    """Raised when the process already serves its maximum number of streams"""
+
+
+def format_event(event, data):
+    """Encode one event in text/event-stream format"""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class Channel:
+    """Events waiting to be written to one open stream
+
+    Only the newest max_events are kept if the client falls behind.  waker,
+    if set, is called (from the publishing thread) after each put, for
+    streams that wait on something other than get().
+    """
+
+    def __init__(self, session_id, max_events=16):
+        self.session_id = session_id
+        self.waker = None
+        self._events = deque(maxlen=max_events)
+        self._ready = threading.Condition()
+
+    def put(self, event, data):
+        with self._ready:
+            self._events.append((event, data))
+            self._ready.notify()
+        if self.waker is not None:
+            self.waker()
+
+    def get(self, timeout=None):
+        """Next (event, data), waiting up to timeout seconds; None on timeout"""
+        with self._ready:
+            if not self._events:
+                self._ready.wait(timeout)
+            return self._events.popleft() if self._events else None
+
+    def get_nowait(self):
+        with self._ready:
+            return self._events.popleft() if self._events else None
+
+
+class EventHub:
+    """Open channels by session id"""
+
+    def __init__(self, max_channels=64):
+        self.max_channels = max_channels
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._count = 0
+        self.published = 0
+
+    def __len__(self):
+        return self._count
+
+    def open(self, session_id):
+        """Register a channel for session_id; raises HubFull at max_channels"""
+        with self._lock:
+            if self._count >= self.max_channels:
+                raise HubFull(f"Too many open event streams ({self.max_channels})")
+            channel = Channel(session_id)
+            self._channels.setdefault(session_id, []).append(channel)
+            self._count += 1
+            return channel
+
+    def close(self, channel):
+        with self._lock:
+            channels = self._channels.get(channel.session_id, [])
+            if channel in channels:
+                channels.remove(channel)
+                self._count -= 1
+                if not channels:
+                    del self._channels[channel.session_id]
+
+    def has_channel(self, session_id):
+        return session_id in self._channels
+
+    def publish(self, session_id, event, data):
+        """Queue an event on every open channel of the session; returns how many got it"""
+        with self._lock:
+            channels = list(self._channels.get(session_id, ()))
+        for channel in channels:
+            channel.put(event, data)
+        self.published += len(channels)
+        return len(channels)
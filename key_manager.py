@@ -0,0 +1,196 @@
+"""
+Session key handling for the in-process crypto backend.
+
+Deriving a key from the passphrase is deliberately slow, so instead of
+running the KDF on every encrypt/decrypt the KeyManager derives the key once
+per unlocked session and keeps it in memory for a configurable lifetime.
+
+* Encryption uses one session salt: the key is derived the first time it is
+  needed and reused until the lifetime runs out, after which a fresh salt
+  and key are derived.
+* Decryption looks keys up by the (kdf, cost, salt) recorded in each
+  message, so a message pays for the KDF only the first time its session
+  salt is seen.  The header is chosen by whoever sent the message, so its
+  cost may not exceed the larger of the configured and the default cost for
+  that KDF.
+* OpenPGP S2K keys for legacy gpg messages are cached the same way.
+
+Keys are held in bytearrays and zeroed when they expire or on lock().  The
+KDF runs outside the manager's lock, so a slow derivation does not hold up
+calls whose keys are cached; concurrent calls needing the same key wait for
+one derivation.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+KDF_PBKDF2_SHA256 = 1
+KDF_SCRYPT = 2
+
+KDF_NAMES = {'pbkdf2': KDF_PBKDF2_SHA256, 'scrypt': KDF_SCRYPT}
+
+# pbkdf2: iteration count; scrypt: log2(N) with r=8, p=1
+DEFAULT_COSTS = {KDF_PBKDF2_SHA256: 600_000, KDF_SCRYPT: 15}
+
+DEFAULT_KDF = 'scrypt'
+DEFAULT_LIFETIME = 900
+
+
+def derive_key(passphrase, kdf, cost, salt, length=32):
+    """Run the KDF identified by kdf/cost over passphrase and salt"""
+    if kdf == KDF_PBKDF2_SHA256:
+        if not 1000 <= cost <= 10_000_000:
+            raise ValueError(f"pbkdf2 cost must be between 1000 and 10000000, got {cost}")
+        return hashlib.pbkdf2_hmac('sha256', passphrase, salt, cost, dklen=length)
+    if kdf == KDF_SCRYPT:
+        if not 10 <= cost <= 22:
+            raise ValueError(f"scrypt cost must be between 10 and 22, got {cost}")
+        n = 1 << cost
+        return hashlib.scrypt(passphrase, salt=salt, n=n, r=8, p=1, maxmem=2 * 128 * 8 * n, dklen=length)
+    raise ValueError(f"Unknown KDF id {kdf}")
+
+
+def _wipe(buffer):
+    buffer[:] = bytes(len(buffer))
+
+
+class KeyManager:
+    """Derives and caches passphrase keys for the lifetime of an unlocked session"""
+
+    def __init__(self, passphrase=None, kdf=DEFAULT_KDF, cost=None, lifetime=DEFAULT_LIFETIME,
+                 max_cached=64, clock=time.monotonic):
+        if kdf not in KDF_NAMES:
+            raise ValueError(f"Unknown KDF '{kdf}'. Choose from: {', '.join(KDF_NAMES)}")
+        self.kdf = KDF_NAMES[kdf]
+        self.cost = cost if cost is not None else DEFAULT_COSTS[self.kdf]
+        self.lifetime = lifetime
+        self.max_cached = max_cached
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()
+        self._pending = {}     # cache key -> Future of a derivation in progress
+        self._generation = 0   # bumped by lock(), so stale derivations are not cached
+        self._session = None
+        self._passphrase = None
+        self.derivations = 0
+        if passphrase is not None:
+            self.unlock(passphrase)
+
+    @property
+    def unlocked(self):
+        return self._passphrase is not None
+
+    def unlock(self, passphrase):
+        """Start a session with passphrase, dropping keys from any previous one"""
+        self.lock()
+        if isinstance(passphrase, str):
+            passphrase = passphrase.encode('utf-8')
+        with self._lock:
+            self._passphrase = bytearray(passphrase)
+
+    def lock(self):
+        """Forget the passphrase and wipe every cached key"""
+        with self._lock:
+            for _, key in self._keys.values():
+                _wipe(key)
+            self._keys.clear()
+            self._pending.clear()
+            self._generation += 1
+            self._session = None
+            if self._passphrase is not None:
+                _wipe(self._passphrase)
+                self._passphrase = None
+
+    def _cached(self, cache_key, derive):
+        """Return a cached key, or derive it (once, outside the lock) and cache it"""
+        with self._lock:
+            if self._passphrase is None:
+                raise RuntimeError("Key manager is locked")
+            now = self._clock()
+            entry = self._keys.get(cache_key)
+            if entry is not None and entry[0] > now:
+                self._keys.move_to_end(cache_key)
+                return bytes(entry[1])
+            if entry is not None:
+                _wipe(self._keys.pop(cache_key)[1])
+
+            pending = self._pending.get(cache_key)
+            if pending is None:
+                pending = self._pending[cache_key] = Future()
+                passphrase = bytes(self._passphrase)
+                generation = self._generation
+            else:
+                passphrase = None
+        if passphrase is None:
+            return pending.result()
+
+        try:
+            key = derive(passphrase)
+        except BaseException as e:
+            with self._lock:
+                if self._pending.get(cache_key) is pending:
+                    del self._pending[cache_key]
+            pending.set_exception(e)
+            raise
+        with self._lock:
+            if self._pending.get(cache_key) is pending:
+                del self._pending[cache_key]
+            self.derivations += 1
+            if generation == self._generation:
+                self._keys[cache_key] = (self._clock() + self.lifetime, bytearray(key))
+                while len(self._keys) > self.max_cached:
+                    _wipe(self._keys.popitem(last=False)[1][1])
+        pending.set_result(key)
+        return key
+
+    def session_key(self):
+        """Return (kdf, cost, salt, key) for encrypting new messages this session"""
+        with self._lock:
+            if self._session is None or self._session[0] <= self._clock():
+                self._session = (self._clock() + self.lifetime, os.urandom(16))
+            salt = self._session[1]
+        key = self._cached(('aead', self.kdf, self.cost, salt),
+                           lambda passphrase: derive_key(passphrase, self.kdf, self.cost, salt))
+        return self.kdf, self.cost, salt, key
+
+    def max_cost(self, kdf):
+        """Highest cost accepted from a message header for kdf"""
+        if kdf not in DEFAULT_COSTS:
+            raise ValueError(f"Unknown KDF id {kdf}")
+        return max(DEFAULT_COSTS[kdf], self.cost if kdf == self.kdf else 0)
+
+    def key_for(self, kdf, cost, salt):
+        """Return the key for a message encrypted with the given KDF parameters"""
+        if cost > self.max_cost(kdf):
+            raise ValueError(f"KDF cost {cost} exceeds the allowed {self.max_cost(kdf)}")
+        return self._cached(('aead', kdf, cost, salt),
+                            lambda passphrase: derive_key(passphrase, kdf, cost, salt))
+
+    def s2k_key(self, spec, key_size):
+        """Return the key for an OpenPGP S2K specifier (see openpgp.s2k_derive)"""
+        import openpgp
+
+        return self._cached(('s2k', bytes(spec), key_size),
+                            lambda passphrase: openpgp.s2k_derive(passphrase, spec, key_size))
+
+    def passphrase(self):
+        """Return the unlocked passphrase (for handing to gpg)"""
+        with self._lock:
+            if self._passphrase is None:
+                raise RuntimeError("Key manager is locked")
+            return bytes(self._passphrase).decode('utf-8')
+
+
+def from_environment(passphrase):
+    """Build a KeyManager configured by PASSWORD_MANAGER_KDF / _KDF_COST / _KEY_LIFETIME"""
+    cost = os.environ.get('PASSWORD_MANAGER_KDF_COST')
+    return KeyManager(
+        passphrase,
+        kdf=os.environ.get('PASSWORD_MANAGER_KDF', DEFAULT_KDF),
+        cost=int(cost) if cost else None,
+        lifetime=float(os.environ.get('PASSWORD_MANAGER_KEY_LIFETIME', DEFAULT_LIFETIME)),
+    )
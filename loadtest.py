@@ -0,0 +1,543 @@
+#!/usr/bin/env python3
+"""
+Open-loop load test of a running password manager server.
+
+    python loadtest.py run [--url http://127.0.0.1:5000] [--rate 50] [--duration 30]
+                           [--mix clipboard=5,fused=2,generate=3] [--json results.json]
+                           [--baseline baseline.json] [--threshold 0.25]
+    python loadtest.py sweep [--start 10] [--factor 1.5] [--max-rate 2000]
+                             [--step-duration 15] [--slo-ms 250] [--json results.json]
+
+Each arrival is one user flow, replayed as the browser sends it:
+
+clipboard   POST /api/decrypt-from-clipboard, then POST /api/sanitize-clipboard
+            (the extension's decrypt followed by its clipboard sanitization)
+fused       POST /api/decrypt-and-sanitize (the extension without an event stream)
+generate    POST /api/generate-password, then POST /api/encrypt-password
+            (templates/index.html)
+
+Every flow is a new session.  The decrypts use ciphertexts the server itself
+encrypted at startup, so the target may use either backend and passphrase.
+
+Arrivals are open loop: they follow a Poisson process at --rate flows per
+second whether or not earlier flows have finished, as independent users
+would, and latency is measured from each flow's scheduled start, so time a
+request spends queued behind a slow server is counted.  At most
+--max-in-flight flows run at once; arrivals beyond that are counted as
+dropped errors instead of being delayed.
+
+run
+    One fixed arrival rate: throughput, p50/p95/p99 latency per flow and per
+    route, and the error rate.  With --baseline, exits 1 if throughput fell
+    or p99 latency rose by more than --threshold against a previous --json.
+
+sweep
+    Steps the arrival rate up by --factor until the server saturates: it
+    completes less than 90% of the offered flows, more than --max-error-rate
+    of them fail, or p99 exceeds --slo-ms.  Reports the highest rate it
+    sustained.  With --baseline, exits 1 if that rate fell by more than
+    --threshold.
+
+--serve gunicorn|asgi starts serve.py or uvicorn on a free local port with
+an empty temporary vault for the duration of the test instead of using
+--url.  The load generator is a single Python process: if its dispatch lag
+is reported as high, it, not the server, was the limit, and the figures are
+a lower bound.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark import environment, percentile
+
+SESSION_HEADER = 'X-Session-Id'
+CIPHERTEXT = object()  # step body placeholder: {'data': one of the prepared ciphertexts}
+
+FLOWS = {
+    'clipboard': (
+        ('POST', '/api/decrypt-from-clipboard', CIPHERTEXT),
+        ('POST', '/api/sanitize-clipboard', None),
+    ),
+    'fused': (
+        ('POST', '/api/decrypt-and-sanitize', CIPHERTEXT),
+    ),
+    'generate': (
+        ('POST', '/api/generate-password', {'length': 24}),
+        ('POST', '/api/encrypt-password', None),
+    ),
+}
+DEFAULT_MIX = 'clipboard=5,fused=2,generate=3'
+DROPPED = 'dropped (too many in flight)'
+SATURATION_COMPLETION = 0.9
+HIGH_DISPATCH_LAG_MS = 10.0
+
+
+class LoadTestError(Exception):
+    """Raised when the target cannot be prepared or the arguments are unusable"""
+
+
+def parse_mix(text):
+    """{flow: weight} from 'clipboard=5,generate=3'"""
+    mix = {}
+    for part in filter(None, (part.strip() for part in text.split(','))):
+        name, _, weight = part.partition('=')
+        if name not in FLOWS:
+            raise LoadTestError(f"Unknown flow {name!r} (choose from {', '.join(FLOWS)})")
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise LoadTestError(f"Bad weight in {part!r}")
+    if not mix or sum(mix.values()) <= 0:
+        raise LoadTestError("The mix needs at least one flow with a positive weight")
+    return mix
+
+
+class Client:
+    """JSON requests to the target over one keep-alive connection per thread"""
+
+    def __init__(self, base_url, timeout=30.0):
+        parsed = urllib.parse.urlsplit(base_url)
+        if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+            raise LoadTestError(f"Not an http(s) URL: {base_url}")
+        self.connection_class = http.client.HTTPSConnection if parsed.scheme == 'https' else http.client.HTTPConnection
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self.connection_class(self.host, self.port, timeout=self.timeout)
+            self._local.reused = False
+        return connection
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def request(self, method, path, body=None, session_id=None):
+        """Return (status, session id header, parsed JSON body or None)"""
+        headers = {'Content-Type': 'application/json'}
+        if session_id:
+            headers[SESSION_HEADER] = session_id
+        payload = json.dumps(body).encode('utf-8') if body is not None else b''
+        while True:
+            connection = self._connection()
+            reused = self._local.reused
+            try:
+                connection.request(method, path, body=payload, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                self.close()
+                if reused:
+                    continue  # the server closed an idle keep-alive connection; retry on a new one
+                raise
+            except Exception:
+                self.close()
+                raise
+            self._local.reused = True
+            if response.will_close:
+                self.close()
+            try:
+                parsed = json.loads(data) if data else None
+            except ValueError:
+                parsed = None
+            return response.status, response.getheader(SESSION_HEADER), parsed
+
+
+def prepare_ciphertexts(client, count):
+    """Have the server encrypt count passwords, so decrypts work with its backend and passphrase"""
+    ciphertexts = []
+    for _ in range(count):
+        status, session_id, _ = client.request('POST', '/api/generate-password', {'length': 24})
+        if status == 200:
+            status, _, _ = client.request('POST', '/api/encrypt-password', session_id=session_id)
+        if status == 200:
+            status, _, body = client.request('GET', '/api/get-encrypted', session_id=session_id)
+        if status != 200:
+            raise LoadTestError(f"Could not prepare ciphertexts: HTTP {status}")
+        ciphertexts.append(body['data'])
+    return ciphertexts
+
+
+def latency_summary(latencies):
+    ordered = sorted(latencies)
+    if not ordered:
+        return {'count': 0}
+    return {
+        'count': len(ordered),
+        'mean_ms': sum(ordered) / len(ordered),
+        'p50_ms': percentile(ordered, 0.50),
+        'p95_ms': percentile(ordered, 0.95),
+        'p99_ms': percentile(ordered, 0.99),
+        'max_ms': ordered[-1],
+    }
+
+
+class LoadRun:
+    """One open-loop run at a fixed arrival rate"""
+
+    def __init__(self, client, mix, rate, duration, ciphertexts, warmup=2.0, max_in_flight=256, seed=None):
+        if rate <= 0 or duration <= 0:
+            raise LoadTestError("Rate and duration must be positive")
+        self.client = client
+        self.mix = mix
+        self.rate = rate
+        self.duration = duration
+        self.warmup = warmup
+        self.ciphertexts = ciphertexts
+        self.max_in_flight = max_in_flight
+        self.random = random.Random(seed)
+        self.stopped = False
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._flows = []       # (flow, scheduled, finished, error) for flows arriving after the warm-up
+        self._requests = []    # (route, latency ms, error) for those flows' requests
+        self._completed = []   # finish time of every successful flow, warm-up included
+        self._lag = []         # dispatch lag in ms
+
+    def stop(self, *_signal_args):
+        """End the run early; flows already started are still waited for"""
+        self.stopped = True
+
+    def _body(self, body):
+        if body is CIPHERTEXT:
+            return {'data': self.random.choice(self.ciphertexts)}
+        return body
+
+    def _run_flow(self, flow, scheduled, measured):
+        session_id = None
+        requests = []
+        error = None
+        try:
+            for method, path, body in FLOWS[flow]:
+                started = time.perf_counter()
+                try:
+                    status, returned_session, _ = self.client.request(method, path, self._body(body), session_id)
+                except Exception as e:
+                    error = type(e).__name__
+                else:
+                    session_id = session_id or returned_session
+                    if status >= 400:
+                        error = f"HTTP {status}"
+                requests.append((f"{method} {path}", (time.perf_counter() - started) * 1000, error))
+                if error:
+                    break
+        finally:
+            finished = time.perf_counter()
+            with self._lock:
+                self._in_flight -= 1
+                if error is None:
+                    self._completed.append(finished)
+                if measured:
+                    self._flows.append((flow, scheduled, finished, error))
+                    self._requests.extend(requests)
+
+    def run(self):
+        """Offer flows at the configured rate; returns the result record"""
+        names = list(self.mix)
+        weights = [self.mix[name] for name in names]
+        executor = ThreadPoolExecutor(max_workers=self.max_in_flight)
+        started = time.perf_counter() + 0.05
+        measure_from = started + self.warmup
+        end = measure_from + self.duration
+        scheduled = started
+        try:
+            while scheduled < end and not self.stopped:
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                measured = scheduled >= measure_from
+                flow = self.random.choices(names, weights)[0]
+                with self._lock:
+                    dropped = self._in_flight >= self.max_in_flight
+                    if not dropped:
+                        self._in_flight += 1
+                    if measured:
+                        self._lag.append((time.perf_counter() - scheduled) * 1000)
+                        if dropped:
+                            self._flows.append((flow, scheduled, scheduled, DROPPED))
+                if not dropped:
+                    executor.submit(self._run_flow, flow, scheduled, measured)
+                scheduled += self.random.expovariate(self.rate)
+        finally:
+            executor.shutdown(wait=True)
+        measured_seconds = min(end, scheduled) - measure_from
+        return self._result(measure_from, max(measured_seconds, 1e-9))
+
+    def _result(self, measure_from, seconds):
+        flows = self._flows
+        failed = [error for _, _, _, error in flows if error]
+        errors = {}
+        for error in failed:
+            errors[error] = errors.get(error, 0) + 1
+        completed = sum(1 for finished in self._completed if measure_from <= finished <= measure_from + seconds)
+        requests_done = sum(1 for _, _, error in self._requests if error is None)
+
+        by_flow = {}
+        for flow in self.mix:
+            latencies = [(finished - scheduled) * 1000 for name, scheduled, finished, error in flows
+                         if name == flow and error is None]
+            by_flow[flow] = latency_summary(latencies)
+        routes = {}
+        for route, latency, error in self._requests:
+            routes.setdefault(route, ([], [0]))
+            if error is None:
+                routes[route][0].append(latency)
+            else:
+                routes[route][1][0] += 1
+
+        lag = sorted(self._lag)
+        return {
+            'offered_rate': self.rate,
+            'seconds': seconds,
+            'arrivals': len(flows),
+            'failed': len(failed),
+            'error_rate': len(failed) / len(flows) if flows else 0.0,
+            'errors': errors,
+            'throughput_flows': completed / seconds,
+            'throughput_requests': requests_done / seconds,
+            'latency': latency_summary([(finished - scheduled) * 1000
+                                        for _, scheduled, finished, error in flows if error is None]),
+            'flows': by_flow,
+            'routes': {route: dict(latency_summary(latencies), errors=error_count[0])
+                       for route, (latencies, error_count) in sorted(routes.items())},
+            'dispatch_lag_p99_ms': percentile(lag, 0.99) if lag else 0.0,
+        }
+
+
+def saturation(result, max_error_rate, slo_ms=None):
+    """Why the run shows the server saturated, or None if it kept up"""
+    if result['throughput_flows'] < result['offered_rate'] * SATURATION_COMPLETION:
+        return f"completed {result['throughput_flows']:.1f} of {result['offered_rate']:.1f} flows/s"
+    if result['error_rate'] > max_error_rate:
+        return f"error rate {result['error_rate']:.1%}"
+    if slo_ms is not None and result['latency'].get('p99_ms', 0.0) > slo_ms:
+        return f"p99 {result['latency']['p99_ms']:.1f}ms over {slo_ms:g}ms"
+    return None
+
+
+def print_result(result):
+    latency = result['latency']
+    print(f"offered {result['offered_rate']:.1f} flows/s, completed {result['throughput_flows']:.1f} flows/s "
+          f"({result['throughput_requests']:.1f} requests/s), errors {result['error_rate']:.2%} "
+          f"of {result['arrivals']}")
+    print(f"\n{'flow / route':<38} {'count':>7} {'p50':>10} {'p95':>10} {'p99':>10} {'errors':>7}")
+    rows = [('all flows', latency, result['failed'])]
+    rows += [(f"flow {name}", row, None) for name, row in result['flows'].items()]
+    rows += [(route, row, row['errors']) for route, row in result['routes'].items()]
+    for name, row, errors in rows:
+        if not row['count']:
+            print(f"{name:<38} {0:>7}")
+            continue
+        print(f"{name:<38} {row['count']:>7} {row['p50_ms']:>8.1f}ms {row['p95_ms']:>8.1f}ms "
+              f"{row['p99_ms']:>8.1f}ms {'' if errors is None else errors:>7}")
+    for error, count in sorted(result['errors'].items()):
+        print(f"  {count} x {error}")
+    warn_if_generator_bound(result)
+
+
+def warn_if_generator_bound(result):
+    if result['dispatch_lag_p99_ms'] > HIGH_DISPATCH_LAG_MS:
+        print(f"Warning: the load generator fell behind (dispatch lag p99 {result['dispatch_lag_p99_ms']:.1f}ms); "
+              "figures are a lower bound")
+
+
+def sweep(make_run, start, factor, max_rate, max_error_rate, slo_ms=None, out=sys.stdout):
+    """Raise the rate until saturation; returns {'sustained_rate', 'saturated_at', 'reason', 'steps'}"""
+    if factor <= 1:
+        raise LoadTestError("--factor must be greater than 1")
+    steps = []
+    sustained = None
+    rate = start
+    print(f"{'offered':>9} {'completed':>10} {'p50':>10} {'p99':>10} {'errors':>8}", file=out)
+    while rate <= max_rate:
+        run = make_run(rate)
+        result = run.run()
+        reason = saturation(result, max_error_rate, slo_ms)
+        steps.append(result)
+        latency = result['latency']
+        print(f"{rate:>9.1f} {result['throughput_flows']:>10.1f} {latency.get('p50_ms', 0.0):>8.1f}ms "
+              f"{latency.get('p99_ms', 0.0):>8.1f}ms {result['error_rate']:>8.2%}"
+              f"{'  saturated: ' + reason if reason else ''}", file=out, flush=True)
+        if run.stopped:
+            return {'sustained_rate': sustained, 'saturated_at': None, 'reason': 'interrupted', 'steps': steps}
+        if reason:
+            return {'sustained_rate': sustained, 'saturated_at': rate, 'reason': reason, 'steps': steps}
+        sustained = rate
+        rate *= factor
+    return {'sustained_rate': sustained, 'saturated_at': None, 'reason': f'not saturated at {max_rate:g} flows/s',
+            'steps': steps}
+
+
+def compare(output, baseline, threshold):
+    """Print a comparison with a baseline run and return the measurements that regressed"""
+    regressions = []
+    if output['command'] == 'sweep':
+        checks = [('sustained flows/s', output['results']['sustained_rate'] or 0.0,
+                   baseline['results'].get('sustained_rate') or 0.0, True)]
+    else:
+        checks = [('completed flows/s', output['results']['throughput_flows'],
+                   baseline['results']['throughput_flows'], True),
+                  ('p99 ms', output['results']['latency'].get('p99_ms', 0.0),
+                   baseline['results']['latency'].get('p99_ms', 0.0), False)]
+    print(f"\n{'measurement':<20} {'baseline':>10} {'now':>10}")
+    for name, now, base, higher_is_better in checks:
+        worse = now < base * (1 - threshold) if higher_is_better else now > base * (1 + threshold)
+        if worse:
+            regressions.append(name)
+        print(f"{name:<20} {base:>10.1f} {now:>10.1f}{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def start_server(kind, timeout=60.0):
+    """Start serve.py (gunicorn) or uvicorn on a free port with a temporary vault; returns (process, url, vault dir)"""
+    port = free_port()
+    here = os.path.dirname(os.path.abspath(__file__))
+    vault_dir = tempfile.mkdtemp(prefix='pm-loadtest-vault-')
+    env = dict(os.environ, PASSWORD_MANAGER_VAULT=vault_dir)
+    if kind == 'gunicorn':
+        command = [sys.executable, os.path.join(here, 'serve.py'), '--bind', f'127.0.0.1:{port}']
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'asgi_app:app', '--host', '127.0.0.1', '--port', str(port),
+                   '--log-level', 'warning']
+    process = subprocess.Popen(command, cwd=here, env=env, stdout=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            break
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process, url, vault_dir
+        except OSError:
+            time.sleep(0.2)
+    stop_server(process, vault_dir)
+    raise LoadTestError(f"The {kind} server did not start")
+
+
+def stop_server(process, vault_dir):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    shutil.rmtree(vault_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Open-loop load test of a password manager server")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subcommands.add_parser('run', help="load at one arrival rate")
+    run_parser.add_argument('--rate', type=float, default=50.0, help="flows started per second")
+    run_parser.add_argument('--duration', type=float, default=30.0, help="seconds measured after the warm-up")
+
+    sweep_parser = subcommands.add_parser('sweep', help="raise the rate until the server saturates")
+    sweep_parser.add_argument('--start', type=float, default=10.0, help="first rate in flows per second")
+    sweep_parser.add_argument('--factor', type=float, default=1.5, help="rate multiplier between steps")
+    sweep_parser.add_argument('--max-rate', type=float, default=2000.0, help="highest rate to try")
+    sweep_parser.add_argument('--step-duration', type=float, default=15.0, help="seconds measured per step")
+    sweep_parser.add_argument('--slo-ms', type=float, help="also saturated when p99 flow latency exceeds this")
+    sweep_parser.add_argument('--max-error-rate', type=float, default=0.01, help="also saturated above this")
+
+    for subparser in (run_parser, sweep_parser):
+        subparser.add_argument('--url', default='http://127.0.0.1:5000', help="server to load")
+        subparser.add_argument('--serve', choices=('gunicorn', 'asgi'),
+                               help="start a local server with an empty vault instead of using --url")
+        subparser.add_argument('--mix', default=DEFAULT_MIX, help=f"flow weights (flows: {', '.join(FLOWS)})")
+        subparser.add_argument('--warmup', type=float, default=2.0, help="seconds of load before measuring")
+        subparser.add_argument('--max-in-flight', type=int, default=256, help="concurrent flows before dropping")
+        subparser.add_argument('--ciphertexts', type=int, default=16, help="distinct ciphertexts to decrypt")
+        subparser.add_argument('--timeout', type=float, default=30.0, help="per-request timeout in seconds")
+        subparser.add_argument('--seed', type=int, default=1, help="random seed for arrivals and the mix")
+        subparser.add_argument('--json', help="write results to this file")
+        subparser.add_argument('--baseline', help="compare against results previously written with --json")
+        subparser.add_argument('--threshold', type=float, default=0.25, help="allowed regression as a fraction")
+    args = parser.parse_args(argv)
+
+    server = None
+    status = 0
+    try:
+        mix = parse_mix(args.mix)
+        url = args.url
+        if args.serve:
+            server = start_server(args.serve)
+            url = server[1]
+        client = Client(url, timeout=args.timeout)
+        ciphertexts = prepare_ciphertexts(client, args.ciphertexts)
+
+        def make_run(rate, duration):
+            run = LoadRun(client, mix, rate, duration, ciphertexts, warmup=args.warmup,
+                          max_in_flight=args.max_in_flight, seed=args.seed)
+            # Ctrl-C ends the run early and still reports it
+            signal.signal(signal.SIGINT, run.stop)
+            return run
+
+        if args.command == 'run':
+            results = make_run(args.rate, args.duration).run()
+            print_result(results)
+        else:
+            results = sweep(lambda rate: make_run(rate, args.step_duration), args.start, args.factor,
+                            args.max_rate, args.max_error_rate, args.slo_ms)
+            print(f"\nSustained {results['sustained_rate'] or 0:.1f} flows/s ({results['reason']})")
+            if results['steps']:
+                warn_if_generator_bound(results['steps'][-1])
+        output = {'command': args.command, 'environment': dict(environment(), target=args.serve or url),
+                  'mix': mix, 'results': results}
+    except (LoadTestError, OSError) as e:
+        print(f"loadtest: {e}", file=sys.stderr)
+        return 2
+    finally:
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        if server is not None:
+            stop_server(server[0], server[2])
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline.get('command') != args.command:
+            print(f"loadtest: {args.baseline} is a {baseline.get('command')} result, not {args.command}",
+                  file=sys.stderr)
+            return 2
+        if baseline.get('mix') != mix:
+            print("\nWarning: baseline was recorded with a different flow mix")
+        regressions = compare(output, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} measurement(s) regressed by more than {args.threshold:.0%}")
+            status = 1
+        else:
+            print(f"\nNo regressions beyond {args.threshold:.0%}")
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(output, json_file, indent=2)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
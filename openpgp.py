@@ -0,0 +1,267 @@
+"""
+Minimal in-process reader for passphrase-encrypted OpenPGP messages.
+
+Covers what `gpg --symmetric` produces: an ASCII-armored message holding a
+symmetric-key session packet (iterated+salted S2K) and a symmetrically
+encrypted integrity protected data packet, optionally compressed.  Anything
+else raises UnsupportedMessage so callers can fall back to the gpg binary.
+"""
+
+import base64
+import bz2
+import hashlib
+import zlib
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms
+
+try:
+    from cryptography.hazmat.decrepit.ciphers.modes import CFB
+except ImportError:  # cryptography < 43
+    from cryptography.hazmat.primitives.ciphers.modes import CFB
+
+
+ARMOR_BEGIN = "-----BEGIN PGP MESSAGE-----"
+ARMOR_END = "-----END PGP MESSAGE-----"
+
+# OpenPGP symmetric algorithm id -> key size in bytes (AES only)
+CIPHER_KEY_SIZES = {7: 16, 8: 24, 9: 32}
+
+# OpenPGP hash algorithm id -> hashlib name
+HASH_ALGORITHMS = {1: "md5", 2: "sha1", 3: "ripemd160", 8: "sha256", 9: "sha384", 10: "sha512", 11: "sha224"}
+
+TAG_SKESK = 3
+TAG_COMPRESSED = 8
+TAG_LITERAL = 11
+TAG_SEIPD = 18
+TAG_MDC = 19
+
+
+class OpenPGPError(Exception):
+    """Raised when an OpenPGP message is malformed or fails to decrypt"""
+
+
+class BadPassphrase(OpenPGPError):
+    """Raised when the passphrase does not decrypt the message"""
+
+
+class UnsupportedMessage(OpenPGPError):
+    """Raised for valid OpenPGP features this reader does not implement"""
+
+
+def is_armored(text):
+    """Return True if text looks like an ASCII-armored OpenPGP message"""
+    return text.lstrip().startswith(ARMOR_BEGIN)
+
+
+def _crc24(data):
+    crc = 0xB704CE
+    for byte in data:
+        crc ^= byte << 16
+        for _ in range(8):
+            crc <<= 1
+            if crc & 0x1000000:
+                crc ^= 0x1864CFB
+    return crc & 0xFFFFFF
+
+
+def armor(data):
+    """ASCII-armor a binary OpenPGP message, with its CRC24 checksum"""
+    body = base64.b64encode(data).decode("ascii")
+    checksum = base64.b64encode(_crc24(data).to_bytes(3, "big")).decode("ascii")
+    lines = [body[i:i + 64] for i in range(0, len(body), 64)]
+    return "\n".join([ARMOR_BEGIN, ""] + lines + ["=" + checksum, ARMOR_END, ""])
+
+
+def dearmor(text):
+    """Strip ASCII armor and return the binary OpenPGP message"""
+    lines = [line.strip() for line in text.strip().splitlines()]
+    try:
+        start = lines.index(ARMOR_BEGIN)
+        end = lines.index(ARMOR_END, start)
+    except ValueError:
+        raise OpenPGPError("Not an ASCII-armored PGP message")
+
+    body = lines[start + 1:end]
+    # Armor headers ("Version: ...") end at the first blank line
+    if "" in body:
+        body = body[body.index("") + 1:]
+
+    checksum = None
+    if body and body[-1].startswith("="):
+        checksum = body.pop()[1:]
+
+    try:
+        data = base64.b64decode("".join(body), validate=True)
+    except ValueError:
+        raise OpenPGPError("Invalid base64 in armored message")
+
+    if checksum and int.from_bytes(base64.b64decode(checksum), "big") != _crc24(data):
+        raise OpenPGPError("Armor checksum mismatch")
+    return data
+
+
+def _read_length(data, pos):
+    """Decode a new-format body length, returning (length, new_pos, partial)"""
+    first = data[pos]
+    if first < 192:
+        return first, pos + 1, False
+    if first < 224:
+        return ((first - 192) << 8) + data[pos + 1] + 192, pos + 2, False
+    if first == 255:
+        return int.from_bytes(data[pos + 1:pos + 5], "big"), pos + 5, False
+    return 1 << (first & 0x1F), pos + 1, True
+
+
+def iter_packets(data):
+    """Yield (tag, body) for each packet in a binary OpenPGP stream"""
+    pos = 0
+    while pos < len(data):
+        ctb = data[pos]
+        pos += 1
+        if not ctb & 0x80:
+            raise OpenPGPError("Invalid packet header")
+
+        if ctb & 0x40:
+            tag = ctb & 0x3F
+            chunks = []
+            while True:
+                length, pos, partial = _read_length(data, pos)
+                chunks.append(data[pos:pos + length])
+                pos += length
+                if not partial:
+                    break
+            body = b"".join(chunks)
+        else:
+            tag = (ctb >> 2) & 0x0F
+            length_type = ctb & 0x03
+            if length_type == 3:
+                body = data[pos:]
+            else:
+                size = 1 << length_type
+                length = int.from_bytes(data[pos:pos + size], "big")
+                pos += size
+                body = data[pos:pos + length]
+            pos += len(body)
+
+        yield tag, body
+
+
+def s2k_derive(passphrase, spec, key_size):
+    """Derive a key from passphrase per an OpenPGP S2K specifier (RFC 4880 3.7)"""
+    mode = spec[0]
+    hash_name = HASH_ALGORITHMS.get(spec[1])
+    if hash_name is None:
+        raise UnsupportedMessage(f"Unsupported S2K hash algorithm {spec[1]}")
+
+    if mode == 0:
+        salt, count = b"", 0
+    elif mode == 1:
+        salt, count = spec[2:10], 0
+    elif mode == 3:
+        salt = spec[2:10]
+        count = (16 + (spec[10] & 15)) << ((spec[10] >> 4) + 6)
+    else:
+        raise UnsupportedMessage(f"Unsupported S2K mode {mode}")
+
+    material = salt + passphrase
+    count = max(count, len(material))
+    # Pre-build a large repeated block so the iteration runs inside hashlib
+    block = material * max(1, (1 << 16) // len(material))
+
+    key = b""
+    preload = 0
+    while len(key) < key_size:
+        digest = hashlib.new(hash_name)
+        digest.update(b"\x00" * preload)
+        remaining = count
+        while remaining >= len(block):
+            digest.update(block)
+            remaining -= len(block)
+        digest.update(block[:remaining])
+        key += digest.digest()
+        preload += 1
+    return key[:key_size]
+
+
+def _cfb_decrypt(key, data):
+    decryptor = Cipher(algorithms.AES(key), CFB(b"\x00" * 16)).decryptor()
+    return decryptor.update(data) + decryptor.finalize()
+
+
+def _literal_data(packets):
+    for tag, body in packets:
+        if tag == TAG_COMPRESSED:
+            algorithm = body[0]
+            if algorithm == 0:
+                inflated = body[1:]
+            elif algorithm == 1:
+                inflated = zlib.decompress(body[1:], -15)
+            elif algorithm == 2:
+                inflated = zlib.decompress(body[1:])
+            elif algorithm == 3:
+                inflated = bz2.decompress(body[1:])
+            else:
+                raise UnsupportedMessage(f"Unsupported compression algorithm {algorithm}")
+            return _literal_data(iter_packets(inflated))
+        if tag == TAG_LITERAL:
+            name_length = body[1]
+            return body[2 + name_length + 4:]
+    raise OpenPGPError("No literal data packet found")
+
+
+def decrypt_message(armored, passphrase=None, s2k_key=None):
+    """Decrypt an armored (or binary) `gpg --symmetric` message and return the plaintext bytes
+
+    Pass either the passphrase or an s2k_key(spec, key_size) callable that
+    derives (and may cache) the key for an S2K specifier.
+    """
+    if s2k_key is None:
+        if isinstance(passphrase, str):
+            passphrase = passphrase.encode("utf-8")
+        s2k_key = lambda spec, key_size: s2k_derive(passphrase, spec, key_size)
+
+    skesk = None
+    data = armored if isinstance(armored, bytes) else dearmor(armored)
+    for tag, body in iter_packets(data):
+        if tag == TAG_SKESK:
+            skesk = body
+        elif tag == TAG_SEIPD:
+            break
+        else:
+            raise UnsupportedMessage(f"Unsupported packet tag {tag}")
+    else:
+        raise OpenPGPError("No encrypted data packet found")
+
+    if skesk is None:
+        raise UnsupportedMessage("Message is not passphrase-encrypted")
+    if skesk[0] != 4:
+        raise UnsupportedMessage(f"Unsupported symmetric-key packet version {skesk[0]}")
+
+    algorithm = skesk[1]
+    spec_length = {0: 2, 1: 10, 3: 11}.get(skesk[2])
+    if algorithm not in CIPHER_KEY_SIZES or spec_length is None:
+        raise UnsupportedMessage("Unsupported cipher or S2K specifier")
+
+    key = s2k_key(skesk[2:2 + spec_length], CIPHER_KEY_SIZES[algorithm])
+    encrypted_session_key = skesk[2 + spec_length:]
+    if encrypted_session_key:
+        session = _cfb_decrypt(key, encrypted_session_key)
+        algorithm, key = session[0], session[1:]
+        if CIPHER_KEY_SIZES.get(algorithm) != len(key):
+            raise BadPassphrase("Bad passphrase")
+
+    if body[0] != 1:
+        raise UnsupportedMessage(f"Unsupported encrypted data packet version {body[0]}")
+
+    plaintext = _cfb_decrypt(key, body[1:])
+    if plaintext[14:16] != plaintext[16:18]:
+        raise BadPassphrase("Bad passphrase")
+
+    # Modification detection code: SHA-1 over prefix, data and MDC header
+    mdc_header = bytes([0xC0 | TAG_MDC, 20])
+    if len(plaintext) < 40 or plaintext[-22:-20] != mdc_header:
+        raise OpenPGPError("Missing modification detection code")
+    if hashlib.sha1(plaintext[:-20]).digest() != plaintext[-20:]:
+        raise OpenPGPError("Modification detection code mismatch")
+
+    return _literal_data(iter_packets(plaintext[18:-22]))
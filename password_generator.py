@@ -0,0 +1,67 @@
+"""
+Fast cryptographically secure password generation.
+
+Random bytes are drawn in large blocks (from os.urandom or another byte
+source such as the shared entropy pool) and mapped onto the alphabet with a
+single bytes.translate() call per block.  Bytes at or above the largest
+multiple of the alphabet size are deleted in the same call (rejection
+sampling), so every character is uniformly distributed and no per-character
+Python code runs.
+"""
+
+import os
+import string
+
+DEFAULT_ALPHABET = string.ascii_uppercase + string.ascii_lowercase + string.digits + "!@#"
+SANITIZE_ALPHABET = string.ascii_letters + string.digits + string.punctuation
+
+
+class PasswordGenerator:
+    """Uniform random strings over a configurable single-byte alphabet"""
+
+    def __init__(self, alphabet=DEFAULT_ALPHABET, block_size=64 * 1024, source=os.urandom):
+        if len(set(alphabet)) != len(alphabet):
+            raise ValueError("Alphabet must not contain duplicate characters")
+        if not 2 <= len(alphabet) <= 256:
+            raise ValueError("Alphabet must contain between 2 and 256 characters")
+        try:
+            encoded = alphabet.encode('latin-1')
+        except UnicodeEncodeError:
+            raise ValueError("Alphabet must only contain single-byte (latin-1) characters")
+
+        size = len(encoded)
+        limit = 256 - 256 % size
+        self.alphabet = alphabet
+        self.block_size = block_size
+        self._source = source
+        self._table = bytes(encoded[value % size] if value < limit else 0 for value in range(256))
+        self._rejected = bytes(range(limit, 256))
+
+    def random_bytes(self, count):
+        """Return count random alphabet characters as latin-1 bytes"""
+        chunks = []
+        remaining = count
+        while remaining > 0:
+            # Ask for a little extra so one draw usually covers the rejections
+            block = self._source(min(self.block_size, remaining + remaining // 4 + 16))
+            accepted = block.translate(self._table, self._rejected)
+            chunks.append(accepted[:remaining])
+            remaining -= len(chunks[-1])
+        return b"".join(chunks)
+
+    def generate(self, length):
+        """Return one random password of the given length"""
+        return self.random_bytes(length).decode('latin-1')
+
+    def generate_many(self, count, length):
+        """Yield count passwords of the given length, drawing randomness in bulk"""
+        per_block = max(1, self.block_size // length)
+        while count > 0:
+            batch = min(count, per_block)
+            data = self.random_bytes(batch * length).decode('latin-1')
+            for offset in range(0, batch * length, length):
+                yield data[offset:offset + length]
+            count -= batch
+
+
+default_generator = PasswordGenerator()
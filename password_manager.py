@@ -1,31 +1,70 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-import random
-import string
-import pyperclip
-import gnupg
 import os
+import queue
 import threading
-import time
-import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from clipboard_service import ClipboardService
+from crypto_backend import CryptoError, get_backend
+from entropy_pool import password_generator
+from vault import Vault, VaultError
+from virtual_list import VirtualList
+
+# How often the Tk thread runs callbacks handed over by background threads
+UI_POLL_MS = 50
+
+# Threads running encrypt/decrypt for the GUI
+CRYPTO_WORKERS = 2
+
+# Vault entries handed to the entry list per batch while the vault loads
+LOAD_BATCH = 1000
+
+# Pause after the last keystroke before the search filter runs
+SEARCH_DELAY_MS = 150
 
 class PasswordManagerApp:
-    def __init__(self, root):
+    def __init__(self, root, backend_name=None, vault_path=None):
         self.root = root
         self.root.title("Password Manager")
         self.root.geometry("600x500")
         self.root.configure(bg="#f0f0f0")
         
-        # Initialize GPG with gnupg home
+        # Crypto backend: "gnupg" (default) or "aead", see crypto_backend.py.
+        # Created on first encrypt/decrypt so the window opens without waiting for gpg.
         self.gpg_home = os.path.expanduser("~/.password_manager_gpg")
-        if not os.path.exists(self.gpg_home):
-            os.makedirs(self.gpg_home, mode=0o700)
+        self.backend_name = backend_name
+        self._backend = None
+        self._backend_lock = threading.Lock()
         
-        self.gpg = gnupg.GPG(gnupghome=self.gpg_home)
+        # Entry list rows: row key -> {"name", "entry_id"}, in display order.
+        # Vault entries use "v<id>", entries not yet saved use "n<counter>".
+        self.rows = {}
+        self.order = []
+        self.search_names = {}
+        self.new_rows = 0
         
-        # Dictionary to store passwords and their encrypted versions
+        # Plaintext passwords generated or decrypted this session, by row key
         self.password_storage = {}
         
+        # Ciphertexts stay in the vault until a row needs one; row key -> ciphertext
+        self.ciphertexts = {}
+        
+        self.vault = Vault(vault_path or os.environ.get(
+            "PASSWORD_MANAGER_VAULT", os.path.expanduser("~/.password_manager_vault")))
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.closing = False
+        
+        # Background threads hand results to the Tk thread through this queue
+        self.ui_calls = queue.Queue()
+        self.root.after(UI_POLL_MS, self.run_ui_calls)
+        self.clipboard = ClipboardService(self.call_in_ui)
+        
+        # Crypto runs off the Tk thread; row key -> (job token, future) of its latest job
+        self.crypto_executor = ThreadPoolExecutor(max_workers=CRYPTO_WORKERS, thread_name_prefix="gui-crypto")
+        self.row_jobs = {}
+        self.row_status = {}
+        
         # Main frame
         main_frame = ttk.Frame(root, padding="10")
         main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
@@ -34,75 +73,286 @@ class PasswordManagerApp:
         root.columnconfigure(0, weight=1)
         root.rowconfigure(0, weight=1)
         main_frame.columnconfigure(1, weight=1)
+        main_frame.rowconfigure(2, weight=1)
         
         # Title
         title_label = ttk.Label(main_frame, text="Password Manager", font=("Arial", 16, "bold"))
-        title_label.grid(row=0, column=0, columnspan=3, pady=10)
+        title_label.grid(row=0, column=0, columnspan=2, pady=10)
         
-        # Password entries
-        self.entries = []
-        self.encrypted_labels = []
+        # Search box, filtering the list by entry name as you type
+        ttk.Label(main_frame, text="Search:", font=("Arial", 10)).grid(row=1, column=0, sticky=tk.W, pady=5)
+        self.search_var = tk.StringVar()
+        self.search_entry = ttk.Entry(main_frame, textvariable=self.search_var)
+        self.search_entry.grid(row=1, column=1, sticky=(tk.W, tk.E), padx=5, pady=5)
+        self.search_var.trace_add("write", self.on_search_changed)
+        self.search_query = ""
+        self.search_pending = None
+        self.filtered = []
         
-        for i in range(5):
-            row = i + 1
-            
-            # Label for entry number
-            label = ttk.Label(main_frame, text=f"Password {i+1}:", font=("Arial", 10))
-            label.grid(row=row, column=0, sticky=tk.W, pady=5)
-            
-            # Password entry frame
-            entry_frame = ttk.Frame(main_frame)
-            entry_frame.grid(row=row, column=1, sticky=(tk.W, tk.E), padx=5, pady=5)
-            entry_frame.columnconfigure(0, weight=1)
-            
-            # Password entry
-            password_entry = ttk.Entry(entry_frame, show="*", width=30)
-            password_entry.grid(row=0, column=0, sticky=(tk.W, tk.E))
-            
-            # Bind right-click to decrypt and paste
-            password_entry.bind("<Button-3>", lambda e, idx=i: self.on_right_click(e, idx))
-            
-            self.entries.append(password_entry)
-            
-            # Create Random Password button
-            gen_btn = ttk.Button(
-                entry_frame,
-                text="Create Random",
-                command=lambda idx=i: self.generate_random_password(idx)
-            )
-            gen_btn.grid(row=0, column=1, padx=5)
-            
-            # Button frame for encrypt and clipboard
-            btn_frame = ttk.Frame(main_frame)
-            btn_frame.grid(row=row, column=2, sticky=tk.E, padx=5, pady=5)
-            
-            # Encrypt button
-            encrypt_btn = ttk.Button(
-                btn_frame,
-                text="Encrypt",
-                command=lambda idx=i: self.encrypt_password(idx)
-            )
-            encrypt_btn.grid(row=0, column=0, padx=2)
-            
-            # Clipboard button
-            clipboard_btn = ttk.Button(
-                btn_frame,
-                text="Clipboard",
-                command=lambda idx=i: self.copy_to_clipboard(idx)
-            )
-            clipboard_btn.grid(row=0, column=1, padx=2)
-            
-            # Encrypted label
-            encrypted_label = ttk.Label(main_frame, text="Not encrypted", foreground="gray", font=("Arial", 8))
-            encrypted_label.grid(row=row+5, column=0, columnspan=3, sticky=tk.W, pady=2)
-            self.encrypted_labels.append(encrypted_label)
+        # Entry list; only the rows in view exist as Treeview items
+        self.entry_list = VirtualList(main_frame, [
+            ("name", "Name", 260),
+            ("password", "Password", 120),
+            ("state", "Status", 140),
+        ], self.row_values)
+        self.entry_list.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), pady=5)
+        self.entry_list.bind_select(self.show_details)
+        
+        # Bind right-click to decrypt and paste into the row under the pointer
+        self.entry_list.tree.bind("<Button-3>", self.on_right_click)
+        # Typing in the list continues the search
+        self.entry_list.tree.bind("<Key>", self.type_ahead)
+        
+        # Buttons acting on the selected entry
+        btn_frame = ttk.Frame(main_frame)
+        btn_frame.grid(row=3, column=0, columnspan=2, sticky=tk.W, pady=5)
+        ttk.Button(btn_frame, text="New Entry", command=self.new_entry).grid(row=0, column=0, padx=2)
+        ttk.Button(btn_frame, text="Create Random", command=self.generate_random_password).grid(row=0, column=1, padx=2)
+        ttk.Button(btn_frame, text="Encrypt", command=self.encrypt_password).grid(row=0, column=2, padx=2)
+        ttk.Button(btn_frame, text="Clipboard", command=self.copy_to_clipboard).grid(row=0, column=3, padx=2)
+        
+        # Busy indicator while any encrypt/decrypt runs
+        self.progress = ttk.Progressbar(btn_frame, mode="indeterminate", length=60)
+        self.progress.grid(row=0, column=4, padx=5)
+        self.progress.grid_remove()
+        
+        # Encrypted label for the selected entry
+        self.encrypted_label = ttk.Label(main_frame, text="Not encrypted", foreground="gray", font=("Arial", 8))
+        self.encrypted_label.grid(row=4, column=0, columnspan=2, sticky=tk.W, pady=2)
         
         # Status label
         self.status_label = ttk.Label(main_frame, text="Ready", foreground="green", font=("Arial", 9))
-        self.status_label.grid(row=11, column=0, columnspan=3, pady=10)
+        self.status_label.grid(row=5, column=0, columnspan=2, pady=10)
+        
+        # Entry names are read in the background; the window is usable straight away
+        self.loader = threading.Thread(target=self.load_from_vault, name="vault-loader", daemon=True)
+        self.loader.start()
+    
+    @property
+    def backend(self):
+        """The crypto backend, initialized once on first use"""
+        if self._backend is None:
+            with self._backend_lock:
+                if self._backend is None:
+                    if not os.path.exists(self.gpg_home):
+                        os.makedirs(self.gpg_home, mode=0o700)
+                    self._backend = get_backend(self.backend_name, gnupghome=self.gpg_home)
+        return self._backend
+    
+    def call_in_ui(self, callback, *args):
+        """Run callback(*args) on the Tk thread; safe to call from any thread"""
+        self.ui_calls.put((callback, args))
+    
+    def run_ui_calls(self):
+        """Run the callbacks queued by background threads, then poll again"""
+        while True:
+            try:
+                callback, args = self.ui_calls.get_nowait()
+            except queue.Empty:
+                break
+            callback(*args)
+        self.root.after(UI_POLL_MS, self.run_ui_calls)
+    
+    def run_row_job(self, key, description, work, on_success, on_error):
+        """Run work() on the crypto executor for row key, replacing any job still pending for the row
+
+        on_success(result) or on_error(exception) runs on the Tk thread, and only
+        if no newer job has been started for the row in the meantime.
+        """
+        self.cancel_row_job(key)
+        token = object()
+        future = self.crypto_executor.submit(work)
+        self.row_jobs[key] = (token, future)
+        self.row_status[key] = f"{description}..."
+        self.entry_list.refresh(key)
+        self.progress.grid()
+        self.progress.start(15)
+        self.status_label.config(text=f"{description} {self.rows[key]['name']}...")
+        future.add_done_callback(
+            lambda done: self.call_in_ui(self.finish_row_job, key, token, done, on_success, on_error))
+    
+    def finish_row_job(self, key, token, future, on_success, on_error):
+        current = self.row_jobs.get(key)
+        if current is None or current[0] is not token:
+            return  # superseded by a newer job for this row
+        self.forget_row_job(key)
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            on_error(error)
+        else:
+            on_success(future.result())
+    
+    def cancel_row_job(self, key):
+        """Forget the row's pending job; it is cancelled if it has not started yet"""
+        job = self.row_jobs.get(key)
+        if job is not None:
+            job[1].cancel()
+            self.forget_row_job(key)
+    
+    def forget_row_job(self, key):
+        del self.row_jobs[key]
+        self.row_status.pop(key, None)
+        self.entry_list.refresh(key)
+        if not self.row_jobs:
+            self.progress.stop()
+            self.progress.grid_remove()
+    
+    def load_from_vault(self):
+        """Read entry names saved in previous sessions, in batches (runs on the loader thread)
+
+        Only names and metadata are read; ciphertext() reads a ciphertext when a row needs it.
+        """
+        try:
+            ids = self.vault.ids()
+            batch = []
+            for entry_id in ids:
+                if self.closing:
+                    return
+                try:
+                    entry = self.vault.metadata(entry_id)
+                except VaultError:
+                    continue  # deleted since ids() was taken
+                name = entry.get("name") or f"Entry {entry_id}"
+                batch.append((f"v{entry_id}", entry_id, name))
+                if len(batch) >= LOAD_BATCH:
+                    self.call_in_ui(self.add_loaded_rows, batch, len(ids))
+                    batch = []
+            self.call_in_ui(self.add_loaded_rows, batch, len(ids))
+            self.call_in_ui(self.update_status, f"{len(ids)} entries loaded")
+        except Exception as e:
+            if not self.closing:
+                self.call_in_ui(self.update_status, f"Could not load vault: {e}")
+    
+    def add_loaded_rows(self, batch, total):
+        """Append a batch of vault entries to the list"""
+        query = self.search_query
+        for key, entry_id, name in batch:
+            self.rows[key] = {"name": name, "entry_id": entry_id}
+            self.search_names[key] = name.casefold()
+            self.order.append(key)
+            if query in self.search_names[key]:
+                self.filtered.append(key)
+        self.entry_list.set_keys(self.filtered)
+        if len(self.order) < total:
+            self.status_label.config(text=f"Loading vault... {len(self.order)}/{total} entries")
+    
+    def add_row(self, name):
+        """Add an entry that is not saved in the vault yet and select it"""
+        self.new_rows += 1
+        key = f"n{self.new_rows}"
+        self.rows[key] = {"name": name, "entry_id": None}
+        self.search_names[key] = name.casefold()
+        self.order.append(key)
+        if self.search_query in self.search_names[key]:
+            self.filtered.append(key)
+            self.entry_list.set_keys(self.filtered)
+        else:
+            self.search_var.set("")
+            self.apply_search()
+        self.entry_list.select(key)
+        return key
     
-    def generate_random_password(self, idx):
-        """Generate a random password"""
+    def row_values(self, key):
+        """Column values for a row of the entry list"""
+        row = self.rows[key]
+        password = self.password_storage.get(key)
+        if key in self.row_status:
+            state = self.row_status[key]
+        elif row["entry_id"] is not None:
+            state = "Encrypted"
+        else:
+            state = "Not encrypted"
+        return (row["name"], "*" * len(password) if password else "", state)
+    
+    def ciphertext(self, key):
+        """The row's ciphertext, read from the vault on first use; None if not encrypted"""
+        if key not in self.ciphertexts:
+            entry_id = self.rows[key]["entry_id"]
+            if entry_id is None:
+                return None
+            try:
+                self.ciphertexts[key] = self.vault.get(entry_id)["ciphertext"]
+            except VaultError:
+                return None
+        return self.ciphertexts[key]
+    
+    def show_details(self, key):
+        """Show the selected entry's ciphertext"""
+        encrypted_str = self.ciphertext(key) if key is not None else None
+        if encrypted_str is None:
+            self.encrypted_label.config(text="Not encrypted")
+        else:
+            encrypted_display = encrypted_str[:50] + "..." if len(encrypted_str) > 50 else encrypted_str
+            self.encrypted_label.config(text=f"Encrypted: {encrypted_display}")
+    
+    def on_search_changed(self, *args):
+        """Filter the list shortly after the search text stops changing"""
+        if self.search_pending is not None:
+            self.root.after_cancel(self.search_pending)
+        self.search_pending = self.root.after(SEARCH_DELAY_MS, self.apply_search)
+    
+    def apply_search(self):
+        """Show the entries whose name contains the search text"""
+        if self.search_pending is not None:
+            self.root.after_cancel(self.search_pending)
+            self.search_pending = None
+        query = self.search_var.get().casefold()
+        # Extending the query can only narrow the matches, so only those are searched again
+        candidates = self.filtered if query.startswith(self.search_query) else self.order
+        self.filtered = [key for key in candidates if query in self.search_names[key]]
+        self.search_query = query
+        self.entry_list.set_keys(self.filtered)
+        if self.filtered and self.entry_list.selected not in self.filtered:
+            self.entry_list.select(self.filtered[0])
+    
+    def type_ahead(self, event):
+        """Send characters typed in the list to the search box"""
+        if event.char and event.char.isprintable() and not event.state & 0x4:
+            self.search_entry.focus_set()
+            self.search_entry.insert(tk.END, event.char)
+            return "break"
+    
+    def selected_row(self):
+        """Key of the selected entry; shows an error if there is none"""
+        key = self.entry_list.selected
+        if key is None or key not in self.filtered:
+            messagebox.showerror("Error", "Select an entry first")
+            return None
+        return key
+    
+    def new_entry(self):
+        """Ask for a name and add an empty entry"""
+        dialog = tk.Toplevel(self.root)
+        dialog.title("New Entry")
+        dialog.geometry("300x100")
+        dialog.transient(self.root)
+        dialog.grab_set()
+        
+        ttk.Label(dialog, text="Enter entry name:").pack(pady=10)
+        name_entry = ttk.Entry(dialog, width=30)
+        name_entry.insert(0, f"Password {len(self.rows) + 1}")
+        name_entry.pack(pady=5)
+        name_entry.focus()
+        
+        def create_entry():
+            name = name_entry.get().strip()
+            if not name:
+                messagebox.showerror("Error", "Name must not be empty")
+                return
+            self.add_row(name)
+            self.update_status(f"{name} added")
+            dialog.destroy()
+        
+        ttk.Button(dialog, text="Add", command=create_entry).pack(pady=10)
+    
+    def generate_random_password(self):
+        """Generate a random password for the selected entry, or a new one if none is selected"""
+        key = self.entry_list.selected
+        if key is None or key not in self.filtered:
+            key = self.add_row(f"Password {len(self.rows) + 1}")
+        
         # Create a dialog to get password length
         dialog = tk.Toplevel(self.root)
         dialog.title("Password Length")
@@ -123,124 +373,147 @@ class PasswordManagerApp:
                     return
                 
                 # Generate password with uppercase, lowercase, numbers, and symbols
-                characters = string.ascii_uppercase + string.ascii_lowercase + string.digits + "!@#"
-                password = ''.join(random.choice(characters) for _ in range(length))
-                
-                # Store the original password
-                self.password_storage[idx] = password
+                password = password_generator.generate(length)
                 
-                # Display as stars
-                self.entries[idx].delete(0, tk.END)
-                self.entries[idx].insert(0, "*" * length)
+                # Store the original password; an encrypt/decrypt still running for the row is now stale
+                self.cancel_row_job(key)
+                self.password_storage[key] = password
+                self.entry_list.refresh(key)
                 
-                self.update_status(f"Password {idx+1} generated ({length} characters)")
+                self.update_status(f"{self.rows[key]['name']} generated ({length} characters)")
                 dialog.destroy()
             except ValueError:
                 messagebox.showerror("Error", "Please enter a valid number")
         
         ttk.Button(dialog, text="Generate", command=create_password).pack(pady=10)
     
-    def encrypt_password(self, idx):
-        """Encrypt the password using GPG"""
-        if idx not in self.password_storage:
+    def encrypt_password(self):
+        """Encrypt the selected entry's password using GPG"""
+        key = self.selected_row()
+        if key is None:
+            return
+        if key not in self.password_storage:
             messagebox.showerror("Error", "No password to encrypt. Generate one first.")
             return
         
-        password = self.password_storage[idx]
-        
-        # Encrypt with symmetric encryption (no passphrase needed for this app)
-        # Using a fixed passphrase for consistency
-        encrypted_data = self.gpg.encrypt(
-            password,
-            recipients=None,
-            symmetric='AES256',
-            always_trust=True,
-            passphrase='password_manager_default_key'
-        )
+        password = self.password_storage[key]
+        row = self.rows[key]
         
-        if not encrypted_data.ok:
-            messagebox.showerror("Error", f"Encryption failed: {encrypted_data.status}")
-            return
-        
-        encrypted_str = str(encrypted_data)
-        self.password_storage[f"{idx}_encrypted"] = encrypted_str
+        def encrypted(encrypted_str):
+            # Keep metadata other clients stored with the entry
+            metadata = {}
+            if row["entry_id"] is not None:
+                try:
+                    metadata = self.vault.metadata(row["entry_id"])
+                except VaultError:
+                    pass
+                for field in ("id", "name", "ciphertext", "updated"):
+                    metadata.pop(field, None)
+            row["entry_id"] = self.vault.put(encrypted_str, name=row["name"], entry_id=row["entry_id"], **metadata)
+            self.ciphertexts[key] = encrypted_str
+            
+            self.entry_list.refresh(key)
+            if self.entry_list.selected == key:
+                self.show_details(key)
+            
+            self.update_status(f"{row['name']} encrypted")
         
-        # Update label to show encrypted status
-        encrypted_display = encrypted_str[:50] + "..." if len(encrypted_str) > 50 else encrypted_str
-        self.encrypted_labels[idx].config(text=f"Encrypted: {encrypted_display}")
+        def failed(error):
+            self.update_status(f"{row['name']} not encrypted")
+            messagebox.showerror("Error", str(error))
         
-        self.update_status(f"Password {idx+1} encrypted")
+        # Encrypt with symmetric encryption using the fixed default passphrase
+        self.run_row_job(key, "Encrypting", lambda: self.backend.encrypt(password), encrypted, failed)
     
-    def copy_to_clipboard(self, idx):
-        """Copy encrypted password to clipboard"""
-        if f"{idx}_encrypted" not in self.password_storage:
+    def copy_to_clipboard(self):
+        """Copy the selected entry's encrypted password to clipboard"""
+        key = self.selected_row()
+        if key is None:
+            return
+        encrypted_str = self.ciphertext(key)
+        if encrypted_str is None:
             messagebox.showerror("Error", "Password must be encrypted first")
             return
+        name = self.rows[key]["name"]
         
-        encrypted_str = self.password_storage[f"{idx}_encrypted"]
-        pyperclip.copy(encrypted_str)
+        def copied(_, error):
+            if error is not None:
+                messagebox.showerror("Error", f"Could not write clipboard: {error}")
+            else:
+                self.update_status(f"{name} encrypted key copied to clipboard")
         
-        self.update_status(f"Password {idx+1} encrypted key copied to clipboard")
+        self.clipboard.copy(encrypted_str, copied)
     
-    def on_right_click(self, event, idx):
+    def on_right_click(self, event):
         """Handle right-click to decrypt and paste from clipboard"""
-        # Get encrypted data from clipboard
-        try:
-            clipboard_data = pyperclip.paste()
-        except:
-            messagebox.showerror("Error", "Could not read clipboard")
+        key = self.entry_list.key_at(event.y)
+        if key is None:
             return
-        
-        # Decrypt the data using the same passphrase
-        decrypted_data = self.gpg.decrypt(
-            clipboard_data,
-            always_trust=True,
-            passphrase='password_manager_default_key'
-        )
-        
-        if not decrypted_data.ok:
-            messagebox.showerror("Error", "Decryption failed. Clipboard may not contain valid encrypted data")
+        self.entry_list.select(key)
+        self.clipboard.paste(lambda clipboard_data, error: self.paste_decrypted(key, clipboard_data, error))
+    
+    def paste_decrypted(self, key, clipboard_data, error):
+        """Decrypt the clipboard contents read for a right-click into row key"""
+        if error is not None:
+            messagebox.showerror("Error", "Could not read clipboard")
             return
+        name = self.rows[key]["name"]
         
-        password = str(decrypted_data)
-        
-        # Display as stars
-        self.entries[idx].delete(0, tk.END)
-        self.entries[idx].insert(0, "*" * len(password))
-        
-        # Store the decrypted password
-        self.password_storage[idx] = password
+        def decrypted(password):
+            # Store the decrypted password; the list shows it as stars
+            self.password_storage[key] = password
+            self.entry_list.refresh(key)
+            
+            self.update_status(f"{name} decrypted and pasted")
+            
+            # Start the clipboard replacement process
+            self.replace_clipboard_content()
         
-        self.update_status(f"Password {idx+1} decrypted and pasted")
+        def failed(error):
+            self.update_status(f"{name} not decrypted")
+            if isinstance(error, CryptoError):
+                messagebox.showerror("Error", "Decryption failed. Clipboard may not contain valid encrypted data")
+            else:
+                messagebox.showerror("Error", str(error))
         
-        # Start the clipboard replacement process
-        self.replace_clipboard_content()
+        # Decrypt the data using the same passphrase
+        self.run_row_job(key, "Decrypting", lambda: self.backend.decrypt(clipboard_data), decrypted, failed)
     
     def replace_clipboard_content(self):
         """Replace clipboard with random 264-character strings 5 times"""
-        def do_replacement():
-            for i in range(5):
-                # Generate random string of 264 characters
-                random_str = ''.join(
-                    random.choice(string.ascii_letters + string.digits + string.punctuation)
-                    for _ in range(264)
-                )
-                pyperclip.copy(random_str)
-                time.sleep(0.1)  # Brief delay between replacements
-            
-            self.update_status("Clipboard sanitized (5 times)")
+        def sanitized(_, error):
+            if error is not None:
+                self.update_status(f"Clipboard sanitization failed: {error}")
+            else:
+                self.update_status("Clipboard sanitized (5 times)")
         
-        # Run in a separate thread to not block the GUI
-        thread = threading.Thread(target=do_replacement, daemon=True)
-        thread.start()
+        # Runs on the clipboard thread; quick repeated requests share one pass
+        self.clipboard.sanitize(5, 264, sanitized)
     
     def update_status(self, message):
         """Update status label"""
         self.status_label.config(text=message)
         self.root.after(3000, lambda: self.status_label.config(text="Ready"))
+    
+    def on_close(self):
+        """Drop pending crypto, finish clipboard work and flush the vault before the window closes"""
+        self.closing = True
+        self.row_jobs.clear()
+        self.crypto_executor.shutdown(wait=False, cancel_futures=True)
+        self.clipboard.stop(timeout=2)
+        self.loader.join(timeout=2)
+        self.vault.close()
+        self.root.destroy()
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Password Manager GUI")
+    parser.add_argument("--backend", choices=["gnupg", "aead"], help="crypto backend (default: $PASSWORD_MANAGER_BACKEND or gnupg)")
+    parser.add_argument("--vault", help="vault directory (default: $PASSWORD_MANAGER_VAULT or ~/.password_manager_vault)")
+    args = parser.parse_args()
+
     root = tk.Tk()
-    app = PasswordManagerApp(root)
+    app = PasswordManagerApp(root, backend_name=args.backend, vault_path=args.vault)
     root.mainloop()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Re-encrypt every vault entry under a new passphrase.
+
+    PASSWORD_MANAGER_PASSPHRASE=old PASSWORD_MANAGER_NEW_PASSPHRASE=new \\
+        python rekey.py [--vault PATH] [--backend gnupg|aead] [--to-backend aead]
+                        [--workers N] [--checkpoint FILE] [--progress 5]
+
+Entries stream through decrypt (old passphrase) -> encrypt (new passphrase)
+on a pool of worker threads and are written back in id order, keeping their
+name, metadata and ciphertext format (armor or compact).  --to-backend
+re-encrypts with a different backend, e.g. moving gnupg entries to aead
+while rotating.  At most
+--window entries are read ahead, and ids are fetched from the vault index a
+page at a time, so memory stays flat however large the vault is.
+
+Progress is checkpointed (after the vault is synced) to a small JSON file
+recording the highest id below which every entry is done.  An interrupted
+run (Ctrl-C, SIGTERM, crash) started again with the same passphrases resumes
+after that id; entries past it that were already re-keyed are recognized by
+decrypting with the new passphrase and skipped.  The checkpoint also holds a
+check value encrypted with the new passphrase, so resuming with a different
+one is refused.  It is removed once the run completes.
+
+The vault is held open for the whole run, so stop the servers first (or
+expect their vault requests to wait), and start them again with
+PASSWORD_MANAGER_PASSPHRASE set to the new passphrase.  If the new
+passphrase is not in the environment it is prompted for.
+
+Entries that cannot be decrypted with either passphrase are left as they
+are and listed at the end; the exit status is then 1.
+"""
+
+import argparse
+import getpass
+import json
+import os
+import signal
+import sys
+import time
+from collections import deque
+
+from crypto_backend import BACKEND_ENV_VAR, CryptoError, PASSPHRASE_ENV_VAR, get_backend
+import envelope
+from vault import Vault, VaultError
+from worker_pool import CryptoWorkerPool, DEFAULT_WORKERS
+
+NEW_PASSPHRASE_ENV_VAR = 'PASSWORD_MANAGER_NEW_PASSPHRASE'
+CHECKPOINT_NAME = 'rekey.checkpoint'
+CHECK_PLAINTEXT = 'password-manager-rekey-check'
+ID_PAGE_SIZE = 1000
+MAX_LISTED_FAILURES = 100
+
+
+class RekeyError(Exception):
+    """Raised when a re-key run cannot start or resume"""
+
+
+class Checkpoint:
+    """Resume point of a re-key run, written atomically to a JSON file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.done_through = 0
+        self.rekeyed = 0
+        self.skipped = 0
+        self.failed = []
+        self.failed_count = 0
+        self.check = None
+
+    def load(self):
+        """Read the file if there is one; returns whether a previous run is being resumed"""
+        try:
+            with open(self.path) as checkpoint_file:
+                state = json.load(checkpoint_file)
+        except FileNotFoundError:
+            return False
+        except ValueError as e:
+            raise RekeyError(f"Unreadable checkpoint {self.path}: {e}")
+        self.done_through = state['done_through']
+        self.rekeyed = state['rekeyed']
+        self.skipped = state['skipped']
+        self.failed = state['failed']
+        self.failed_count = state['failed_count']
+        self.check = state['check']
+        return True
+
+    def save(self):
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as checkpoint_file:
+            json.dump({
+                'done_through': self.done_through,
+                'rekeyed': self.rekeyed,
+                'skipped': self.skipped,
+                'failed': self.failed,
+                'failed_count': self.failed_count,
+                'check': self.check,
+                'saved': time.time(),
+            }, checkpoint_file)
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temporary, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Rekeyer:
+    """Streams vault entries from the old passphrase to the new one"""
+
+    def __init__(self, vault, old_backend, new_backend, checkpoint, workers=DEFAULT_WORKERS,
+                 window=None, checkpoint_every=1000, checkpoint_seconds=5.0, progress_seconds=5.0,
+                 out=sys.stderr):
+        self.vault = vault
+        self.old_backend = old_backend
+        self.new_backend = new_backend
+        self.checkpoint = checkpoint
+        self.window = window or workers * 4
+        self.pool = CryptoWorkerPool(workers=workers, max_pending=self.window, submit_timeout=None)
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_seconds = checkpoint_seconds
+        self.progress_seconds = progress_seconds
+        self.out = out
+        self.processed = 0
+        self.stopped = False
+
+    def stop(self, *_signal_args):
+        """Ask run() to finish the entries in flight, checkpoint and return (safe from a signal handler)"""
+        self.stopped = True
+
+    def reencrypt(self, ciphertext):
+        """Return the ciphertext under the new passphrase in the same format, or None if it already is"""
+        fmt = envelope.detect(ciphertext)
+        try:
+            plaintext = self.old_backend.decrypt(ciphertext)
+        except CryptoError:
+            # Re-keyed before an interruption, after the last checkpoint
+            self.new_backend.decrypt(ciphertext)
+            return None
+        if fmt == envelope.COMPACT:
+            return self.new_backend.encrypt_compact(plaintext)
+        return self.new_backend.encrypt(plaintext)
+
+    def _pending_entries(self):
+        """Entries after the checkpoint, in id order, read a page of ids at a time"""
+        start = self.checkpoint.done_through + 1
+        while True:
+            ids = self.vault.ids(start=start, limit=ID_PAGE_SIZE)
+            if not ids:
+                return
+            for entry_id in ids:
+                try:
+                    yield self.vault.get(entry_id)
+                except VaultError:
+                    continue  # deleted meanwhile
+            start = ids[-1] + 1
+
+    def _finish(self, entry, future):
+        checkpoint = self.checkpoint
+        try:
+            ciphertext = future.result()
+        except CryptoError:
+            checkpoint.failed_count += 1
+            if len(checkpoint.failed) < MAX_LISTED_FAILURES:
+                checkpoint.failed.append(entry['id'])
+        else:
+            if ciphertext is None:
+                checkpoint.skipped += 1
+            else:
+                metadata = {key: value for key, value in entry.items()
+                            if key not in ('id', 'name', 'ciphertext', 'updated')}
+                self.vault.put(ciphertext, name=entry.get('name', ''), entry_id=entry['id'], **metadata)
+                checkpoint.rekeyed += 1
+        checkpoint.done_through = entry['id']
+        self.processed += 1
+
+    def _save(self):
+        self.vault.sync()
+        self.checkpoint.save()
+
+    def _report(self, started, total):
+        elapsed = time.monotonic() - started
+        rate = self.processed / elapsed if elapsed else 0.0
+        done = self.checkpoint.rekeyed + self.checkpoint.skipped + self.checkpoint.failed_count
+        print(f"{done}/{total} entries ({rate:.1f} entries/s, {self.checkpoint.failed_count} failed)",
+              file=self.out, flush=True)
+        return rate
+
+    def run(self):
+        """Re-key everything after the checkpoint; returns the throughput in entries per second"""
+        if self.checkpoint.check is None:
+            self.checkpoint.check = self.new_backend.encrypt(CHECK_PLAINTEXT)
+        else:
+            try:
+                matches = self.new_backend.decrypt(self.checkpoint.check) == CHECK_PLAINTEXT
+            except CryptoError:
+                matches = False
+            if not matches:
+                raise RekeyError("The checkpoint was written for a different new passphrase")
+
+        total = len(self.vault)
+        started = last_save = last_report = time.monotonic()
+        saved_at = self.processed
+        pending = deque()
+        try:
+            for entry in self._pending_entries():
+                if self.stopped:
+                    break
+                pending.append((entry, self.pool.submit(self.reencrypt, entry['ciphertext'])))
+                while pending and (len(pending) >= self.window or pending[0][1].done()):
+                    self._finish(*pending.popleft())
+
+                now = time.monotonic()
+                if self.processed - saved_at >= self.checkpoint_every or now - last_save >= self.checkpoint_seconds:
+                    self._save()
+                    saved_at, last_save = self.processed, now
+                if now - last_report >= self.progress_seconds:
+                    self._report(started, total)
+                    last_report = now
+            while pending:
+                self._finish(*pending.popleft())
+        finally:
+            self.pool.shutdown(wait=False)
+        self._save()
+        return self._report(started, total)
+
+
+def new_passphrase():
+    passphrase = os.environ.get(NEW_PASSPHRASE_ENV_VAR)
+    if passphrase:
+        return passphrase
+    if not sys.stdin.isatty():
+        raise RekeyError(f"Set {NEW_PASSPHRASE_ENV_VAR} or run from a terminal to be prompted")
+    passphrase = getpass.getpass("New passphrase: ")
+    if not passphrase or passphrase != getpass.getpass("Repeat new passphrase: "):
+        raise RekeyError("Passphrases are empty or do not match")
+    return passphrase
+
+
+def main(argv=None):
+    import app
+
+    parser = argparse.ArgumentParser(description="Re-encrypt the vault under a new passphrase")
+    parser.add_argument('--vault', default=app.VAULT_PATH, help="vault directory")
+    parser.add_argument('--backend', help="crypto backend (default: $PASSWORD_MANAGER_BACKEND or gnupg)")
+    parser.add_argument('--to-backend', help="backend to re-encrypt with (default: --backend)")
+    parser.add_argument('--gnupghome', default=app.GPG_HOME, help="GPG home for the gnupg backend")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="parallel crypto workers")
+    parser.add_argument('--window', type=int, help="entries in flight (default: 4 per worker)")
+    parser.add_argument('--checkpoint', help=f"checkpoint file (default: {CHECKPOINT_NAME} in the vault)")
+    parser.add_argument('--checkpoint-every', type=int, default=1000, help="entries between checkpoints")
+    parser.add_argument('--progress', type=float, default=5.0, help="seconds between progress lines")
+    args = parser.parse_args(argv)
+
+    checkpoint = Checkpoint(args.checkpoint or os.path.join(args.vault, CHECKPOINT_NAME))
+    try:
+        os.makedirs(args.gnupghome, mode=0o700, exist_ok=True)
+        old_backend = get_backend(args.backend, gnupghome=args.gnupghome)
+        new_backend = get_backend(args.to_backend or args.backend, gnupghome=args.gnupghome,
+                                  passphrase=new_passphrase())
+        if checkpoint.load():
+            print(f"Resuming after entry {checkpoint.done_through}", file=sys.stderr)
+
+        with Vault(args.vault, lock_timeout=app.VAULT_LOCK_TIMEOUT) as vault:
+            rekeyer = Rekeyer(vault, old_backend, new_backend, checkpoint, workers=args.workers,
+                              window=args.window, checkpoint_every=args.checkpoint_every,
+                              progress_seconds=args.progress)
+            # Ctrl-C and SIGTERM stop the run at a checkpoint
+            signal.signal(signal.SIGINT, rekeyer.stop)
+            signal.signal(signal.SIGTERM, rekeyer.stop)
+            rate = rekeyer.run()
+    except (RekeyError, CryptoError, VaultError) as e:
+        print(f"rekey: {e}", file=sys.stderr)
+        return 2
+
+    if rekeyer.stopped:
+        print(f"Interrupted; checkpoint saved after entry {checkpoint.done_through}. "
+              "Run again with the same passphrases to resume.", file=sys.stderr)
+        return 130
+
+    print(f"Re-keyed {checkpoint.rekeyed} entries, {checkpoint.skipped} already current, "
+          f"{checkpoint.failed_count} failed ({rate:.1f} entries/s this run)")
+    if checkpoint.failed_count:
+        print(f"Could not decrypt entries {checkpoint.failed}"
+              f"{' (and more)' if checkpoint.failed_count > len(checkpoint.failed) else ''}", file=sys.stderr)
+        checkpoint.remove()
+        return 1
+    checkpoint.remove()
+    if new_backend.name != old_backend.name:
+        print(f"Restart the servers with {PASSPHRASE_ENV_VAR} set to the new passphrase "
+              f"and {BACKEND_ENV_VAR}={new_backend.name}.")
+    else:
+        print(f"Restart the servers with {PASSPHRASE_ENV_VAR} set to the new passphrase.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,298 @@
+"""
+Session-keyed, lock-striped in-memory secret store.
+
+Sessions are spread over a fixed number of shards by hashing the session id.
+Each shard has its own lock and an OrderedDict kept in least-recently-used
+order, so lookups, updates and evictions are all O(1) and requests for
+different sessions rarely contend on the same lock.
+
+Sessions idle for longer than `ttl` seconds expire, and each shard evicts its
+least recently used sessions once it exceeds its share of `max_sessions` or
+`max_bytes`.
+
+SharedSessionStore offers the same interface backed by an SQLite database,
+so several server processes can share sessions.  Values are encrypted with
+AES-GCM under a key shared by those processes, and the database is meant to
+live on a memory-backed file system such as /dev/shm.  Triggers keep the
+session count and byte total in a one-row table, so enforcing the caps does
+not scan the sessions.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class _Session:
+    __slots__ = ('values', 'last_access', 'size')
+
+    def __init__(self, now):
+        self.values = {}
+        self.last_access = now
+        self.size = 0
+
+
+def _value_size(value):
+    return len(value) if isinstance(value, (str, bytes, bytearray)) else 0
+
+
+class _Shard:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = OrderedDict()
+        self.size = 0
+
+
+class SessionStore:
+    """Per-session key/value store with lock striping, idle TTL and LRU caps"""
+
+    def __init__(self, shards=16, ttl=900, max_sessions=10000, max_bytes=64 * 1024 * 1024, clock=time.monotonic):
+        self.ttl = ttl
+        self._shards = [_Shard() for _ in range(shards)]
+        self._max_sessions = max(1, max_sessions // shards)
+        self._max_bytes = max(1, max_bytes // shards)
+        self._clock = clock
+        self.evictions = 0
+
+    def _shard(self, session_id):
+        return self._shards[hash(session_id) % len(self._shards)]
+
+    def _lookup(self, shard, session_id, now):
+        """Return the live session (refreshing its LRU position) or None; shard lock held"""
+        session = shard.sessions.get(session_id)
+        if session is None:
+            return None
+        if now - session.last_access > self.ttl:
+            self._drop(shard, session_id)
+            return None
+        session.last_access = now
+        shard.sessions.move_to_end(session_id)
+        return session
+
+    def _drop(self, shard, session_id):
+        session = shard.sessions.pop(session_id)
+        shard.size -= session.size
+        self.evictions += 1
+
+    def _evict(self, shard, now):
+        """Expire idle sessions and enforce the shard caps; shard lock held"""
+        sessions = shard.sessions
+        while sessions:
+            oldest_id, oldest = next(iter(sessions.items()))
+            expired = now - oldest.last_access > self.ttl
+            if not (expired or len(sessions) > self._max_sessions or shard.size > self._max_bytes):
+                break
+            self._drop(shard, oldest_id)
+
+    def get(self, session_id, key, default=None):
+        """Return the value stored under key for the session"""
+        shard = self._shard(session_id)
+        with shard.lock:
+            session = self._lookup(shard, session_id, self._clock())
+            if session is None:
+                return default
+            return session.values.get(key, default)
+
+    def contains(self, session_id, key):
+        """Return True if the session has a value under key"""
+        shard = self._shard(session_id)
+        with shard.lock:
+            session = self._lookup(shard, session_id, self._clock())
+            return session is not None and key in session.values
+
+    def set(self, session_id, key, value):
+        """Store value under key for the session, creating the session if needed"""
+        shard = self._shard(session_id)
+        now = self._clock()
+        with shard.lock:
+            session = self._lookup(shard, session_id, now)
+            if session is None:
+                session = shard.sessions[session_id] = _Session(now)
+
+            delta = _value_size(value) - _value_size(session.values.get(key))
+            session.values[key] = value
+            session.size += delta
+            shard.size += delta
+            self._evict(shard, now)
+
+    def delete(self, session_id):
+        """Forget everything stored for the session"""
+        shard = self._shard(session_id)
+        with shard.lock:
+            session = shard.sessions.pop(session_id, None)
+            if session is not None:
+                shard.size -= session.size
+
+    def purge_expired(self):
+        """Drop idle sessions from every shard; returns the number removed"""
+        before = self.evictions
+        now = self._clock()
+        for shard in self._shards:
+            with shard.lock:
+                self._evict(shard, now)
+        return self.evictions - before
+
+    def __len__(self):
+        return sum(len(shard.sessions) for shard in self._shards)
+
+    @property
+    def size_bytes(self):
+        """Approximate bytes of stored string values across all sessions"""
+        return sum(shard.size for shard in self._shards)
+
+
+class SharedSessionStore:
+    """SessionStore interface over an SQLite file shared between processes; values must be strings"""
+
+    def __init__(self, path, key, ttl=900, max_sessions=10000, max_bytes=64 * 1024 * 1024,
+                 timeout=5.0, clock=time.time):
+        try:
+            from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        except ImportError:
+            raise RuntimeError("SharedSessionStore requires the 'cryptography' package")
+        self.path = path
+        self.ttl = ttl
+        self._aead = AESGCM(key)
+        self._max_sessions = max(1, max_sessions)
+        self._max_bytes = max(1, max_bytes)
+        self._timeout = timeout
+        self._clock = clock
+        self._local = threading.local()
+        self.evictions = 0
+
+        with self._transaction() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS sessions ("
+                       "id TEXT PRIMARY KEY, last_access REAL NOT NULL, size INTEGER NOT NULL DEFAULT 0)")
+            db.execute("CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)")
+            db.execute("CREATE TABLE IF NOT EXISTS session_values ("
+                       "session_id TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                       "PRIMARY KEY (session_id, key))")
+            db.execute("CREATE TABLE IF NOT EXISTS totals ("
+                       "id INTEGER PRIMARY KEY CHECK (id = 0), sessions INTEGER NOT NULL, size INTEGER NOT NULL)")
+            db.execute("INSERT OR IGNORE INTO totals SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM sessions")
+            db.execute("CREATE TRIGGER IF NOT EXISTS sessions_insert AFTER INSERT ON sessions BEGIN "
+                       "UPDATE totals SET sessions = sessions + 1, size = size + NEW.size; END")
+            db.execute("CREATE TRIGGER IF NOT EXISTS sessions_delete AFTER DELETE ON sessions BEGIN "
+                       "UPDATE totals SET sessions = sessions - 1, size = size - OLD.size; END")
+            db.execute("CREATE TRIGGER IF NOT EXISTS sessions_resize AFTER UPDATE OF size ON sessions BEGIN "
+                       "UPDATE totals SET size = size + NEW.size - OLD.size; END")
+
+    def _connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=self._timeout, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=OFF")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        """Yield the connection inside BEGIN IMMEDIATE ... COMMIT, rolling back on errors"""
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+
+    def _seal(self, session_id, key, value):
+        nonce = os.urandom(12)
+        return nonce + self._aead.encrypt(nonce, value.encode('utf-8'), f'{session_id}\0{key}'.encode('utf-8'))
+
+    def _open(self, session_id, key, blob):
+        return self._aead.decrypt(blob[:12], blob[12:], f'{session_id}\0{key}'.encode('utf-8')).decode('utf-8')
+
+    def _drop(self, db, session_ids):
+        for session_id in session_ids:
+            db.execute("DELETE FROM session_values WHERE session_id = ?", (session_id,))
+            db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        self.evictions += len(session_ids)
+
+    def _touch(self, db, session_id, now):
+        """Refresh the session's idle timer; returns False (dropping it) if it has expired"""
+        if db.execute("UPDATE sessions SET last_access = ? WHERE id = ? AND last_access >= ?",
+                      (now, session_id, now - self.ttl)).rowcount:
+            return True
+        expired = [row[0] for row in db.execute("SELECT id FROM sessions WHERE id = ?", (session_id,))]
+        self._drop(db, expired)
+        return False
+
+    def _evict(self, db, now):
+        """Expire idle sessions and enforce the caps, oldest first"""
+        expired = [row[0] for row in db.execute("SELECT id FROM sessions WHERE last_access < ?", (now - self.ttl,))]
+        self._drop(db, expired)
+        count, size = db.execute("SELECT sessions, size FROM totals").fetchone()
+        if count <= self._max_sessions and size <= self._max_bytes:
+            return
+        victims = []
+        for session_id, session_size in db.execute("SELECT id, size FROM sessions ORDER BY last_access"):
+            if count <= self._max_sessions and size <= self._max_bytes:
+                break
+            victims.append(session_id)
+            count -= 1
+            size -= session_size
+        self._drop(db, victims)
+
+    def get(self, session_id, key, default=None):
+        """Return the value stored under key for the session"""
+        if session_id is None:
+            return default
+        with self._transaction() as db:
+            if not self._touch(db, session_id, self._clock()):
+                return default
+            row = db.execute("SELECT value FROM session_values WHERE session_id = ? AND key = ?",
+                             (session_id, key)).fetchone()
+        return default if row is None else self._open(session_id, key, row[0])
+
+    def contains(self, session_id, key):
+        """Return True if the session has a value under key"""
+        if session_id is None:
+            return False
+        with self._transaction() as db:
+            if not self._touch(db, session_id, self._clock()):
+                return False
+            return db.execute("SELECT 1 FROM session_values WHERE session_id = ? AND key = ?",
+                              (session_id, key)).fetchone() is not None
+
+    def set(self, session_id, key, value):
+        """Store value under key for the session, creating the session if needed"""
+        blob = self._seal(session_id, key, value)
+        now = self._clock()
+        with self._transaction() as db:
+            if not self._touch(db, session_id, now):
+                db.execute("INSERT INTO sessions (id, last_access, size) VALUES (?, ?, 0)", (session_id, now))
+            row = db.execute("SELECT size FROM session_values WHERE session_id = ? AND key = ?",
+                             (session_id, key)).fetchone()
+            delta = len(value) - (row[0] if row else 0)
+            db.execute("INSERT OR REPLACE INTO session_values (session_id, key, value, size) VALUES (?, ?, ?, ?)",
+                       (session_id, key, blob, len(value)))
+            db.execute("UPDATE sessions SET size = size + ? WHERE id = ?", (delta, session_id))
+            self._evict(db, now)
+
+    def delete(self, session_id):
+        """Forget everything stored for the session"""
+        with self._transaction() as db:
+            db.execute("DELETE FROM session_values WHERE session_id = ?", (session_id,))
+            db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def purge_expired(self):
+        """Drop idle sessions; returns the number removed"""
+        before = self.evictions
+        with self._transaction() as db:
+            self._evict(db, self._clock())
+        return self.evictions - before
+
+    def __len__(self):
+        return self._connection().execute("SELECT sessions FROM totals").fetchone()[0]
+
+    @property
+    def size_bytes(self):
+        """Approximate bytes of stored string values across all sessions"""
+        return self._connection().execute("SELECT size FROM totals").fetchone()[0]
+
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Production server for the password manager web app.
+
+    python serve.py [--bind 0.0.0.0:5000] [--workers N] [--threads N]
+                    [--timeout 60] [--graceful-timeout 30]
+
+Runs app.py under gunicorn with preforked worker processes, each handling
+requests on a pool of threads.  Defaults come from PASSWORD_MANAGER_BIND,
+PASSWORD_MANAGER_WORKERS, PASSWORD_MANAGER_THREADS and
+PASSWORD_MANAGER_GRACEFUL_TIMEOUT.
+
+* The app is imported in each worker after the fork, so the GPG home, crypto
+  backend, stores and background threads are initialized once per worker
+  (threads do not survive fork()).
+* Sessions are kept in an SQLite database on a memory-backed file system that
+  every worker opens, encrypted with a key the master generates at startup,
+  so any worker can answer any request.  With more than one worker each one
+  keeps the vault open in shared mode and locks it per request.
+* Each GET /api/events stream holds a request thread, so a worker serves at
+  most --threads - 1 of them and always has a thread left for API calls.
+  Events only reach streams on the worker that handled the decrypt, so with
+  more than one worker streams are refused (503) and clients use the fused
+  /api/decrypt-and-sanitize endpoint; use one worker or asgi_app.py for the
+  push channel.
+* On SIGTERM or SIGINT workers stop accepting connections, finish in-flight
+  requests (up to the graceful timeout), then flush and close the vault and
+  stop their thread pools.  The shared session database is removed when the
+  master exits.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+from gunicorn.app.base import BaseApplication
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def shared_directory():
+    """Private directory for state shared by the workers, in memory where possible"""
+    parent = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    return tempfile.mkdtemp(prefix='password-manager-', dir=parent)
+
+
+def event_stream_limit(workers, threads):
+    """Event streams each worker may hold open (see the module docstring)"""
+    if workers > 1:
+        return 0
+    limit = threads - 1
+    configured = os.environ.get('PASSWORD_MANAGER_MAX_EVENT_STREAMS')
+    return min(limit, int(configured)) if configured else limit
+
+
+def post_fork(server, worker):
+    server.log.info("Worker %s forked; initializing app", worker.pid)
+
+
+def worker_exit(server, worker):
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        app_module.shutdown()
+
+
+class PasswordManagerServer(BaseApplication):
+    """gunicorn application that loads app.py inside each worker"""
+
+    def __init__(self, options, shared_dir):
+        self.options = options
+        self.shared_dir = shared_dir
+        super().__init__()
+
+    def load_config(self):
+        for name, value in self.options.items():
+            self.cfg.set(name, value)
+        self.cfg.set('post_fork', post_fork)
+        self.cfg.set('worker_exit', worker_exit)
+        self.cfg.set('on_exit', lambda server: shutil.rmtree(self.shared_dir, ignore_errors=True))
+
+    def load(self):
+        import app
+        return app.app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the password manager web app with gunicorn")
+    parser.add_argument('--bind', default=os.environ.get('PASSWORD_MANAGER_BIND', '0.0.0.0:5000'),
+                        help="address to listen on (host:port)")
+    parser.add_argument('--workers', type=int,
+                        default=int(os.environ.get('PASSWORD_MANAGER_WORKERS', default_workers())),
+                        help="worker processes")
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('PASSWORD_MANAGER_THREADS', 4)),
+                        help="request threads per worker")
+    parser.add_argument('--timeout', type=int, default=60,
+                        help="seconds a worker may be silent before it is restarted")
+    parser.add_argument('--graceful-timeout', type=int,
+                        default=int(os.environ.get('PASSWORD_MANAGER_GRACEFUL_TIMEOUT', 30)),
+                        help="seconds workers get to finish in-flight requests on shutdown")
+    args = parser.parse_args(argv)
+
+    if args.workers < 1 or args.threads < 1:
+        parser.error("--workers and --threads must be at least 1")
+
+    shared_dir = shared_directory()
+    os.environ['PASSWORD_MANAGER_SESSION_DB'] = os.path.join(shared_dir, 'sessions.db')
+    os.environ['PASSWORD_MANAGER_SESSION_KEY'] = os.urandom(32).hex()
+    if args.workers > 1:
+        os.environ['PASSWORD_MANAGER_VAULT_SHARED'] = '1'
+    streams = event_stream_limit(args.workers, args.threads)
+    os.environ['PASSWORD_MANAGER_MAX_EVENT_STREAMS'] = str(streams)
+
+    options = {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+        'preload_app': False,
+    }
+    print(f"Serving on {args.bind} with {args.workers} worker(s) x {args.threads} thread(s), "
+          f"{streams} event stream(s) per worker")
+    PasswordManagerServer(options, shared_dir).run()
+
+
+if __name__ == '__main__':
+    main()
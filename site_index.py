@@ -0,0 +1,156 @@
+"""
+In-memory index of vault entries by site and by name.
+
+Entries can be tagged with the origin they belong to (stored as the
+lower-cased host name in the entry's "origin" field).  The index maps each
+host to the entries tagged with it, so the credentials for a page are found
+with a few dictionary lookups instead of a scan of the vault:
+
+* exact: "login.example.com" finds entries tagged "login.example.com";
+* suffix: it also finds entries tagged "example.com", by looking up each
+  parent domain in turn (one lookup per label, never the bare TLD).
+
+Name search matches names that start with the query, using a sorted list and
+bisect, and, for queries of three characters or more, names that contain the
+query, by intersecting the entries sharing each of the query's trigrams.
+
+The index holds names and hosts only, never ciphertexts.
+"""
+
+import bisect
+import ipaddress
+import threading
+from urllib.parse import urlsplit
+
+
+def host_of(origin):
+    """Lower-cased host of an origin, URL or bare host name ('' if it has none)"""
+    origin = (origin or '').strip()
+    if not origin:
+        return ''
+    if '://' not in origin:
+        origin = '//' + origin
+    try:
+        host = urlsplit(origin).hostname or ''
+    except ValueError:
+        return ''
+    return host.rstrip('.')
+
+
+def parent_domains(host):
+    """host followed by each parent domain with at least two labels"""
+    try:
+        ipaddress.ip_address(host)
+        return [host]
+    except ValueError:
+        pass
+    labels = host.split('.')
+    return ['.'.join(labels[i:]) for i in range(max(1, len(labels) - 1))]
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SiteIndex:
+    """Host and name lookups over vault entries"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}       # entry id -> (folded name, host)
+        self._hosts = {}         # host -> set of entry ids
+        self._trigrams = {}      # trigram -> set of entry ids
+        self._names = []         # sorted (folded name, entry id)
+        self.version = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, entries, version=None):
+        """Index every entry dict (id, name, origin) from an iterable, replacing the current contents"""
+        with self._lock:
+            self._entries.clear()
+            self._hosts.clear()
+            self._trigrams.clear()
+            self._names = []
+            for entry in entries:
+                self._names.append(self._add(entry['id'], entry.get('name', ''), entry.get('origin')))
+            self._names.sort()
+            self.version = version
+
+    def add(self, entry_id, name='', origin=None):
+        """Index an entry, replacing what was indexed for entry_id before"""
+        with self._lock:
+            self._remove(entry_id)
+            bisect.insort(self._names, self._add(entry_id, name, origin))
+
+    def remove(self, entry_id):
+        with self._lock:
+            self._remove(entry_id)
+
+    def match(self, origin):
+        """Entry ids for the origin's host, exact matches first, then by parent domain"""
+        host = host_of(origin)
+        if not host:
+            return []
+        matches = []
+        with self._lock:
+            for domain in parent_domains(host):
+                matches.extend(sorted(self._hosts.get(domain, ())))
+        return matches
+
+    def search(self, query, limit=100):
+        """Entry ids whose name starts with the query, then ids whose name contains it (all if limit is None)"""
+        query = query.casefold()
+        with self._lock:
+            if limit is None:
+                limit = len(self._entries)
+            position = bisect.bisect_left(self._names, (query,))
+            found = []
+            while position < len(self._names) and len(found) < limit:
+                name, entry_id = self._names[position]
+                if not name.startswith(query):
+                    break
+                found.append(entry_id)
+                position += 1
+
+            if len(query) >= 3 and len(found) < limit:
+                candidates = None
+                for trigram in sorted(trigrams(query), key=lambda t: len(self._trigrams.get(t, ()))):
+                    ids = self._trigrams.get(trigram)
+                    if not ids:
+                        return found
+                    candidates = set(ids) if candidates is None else candidates & ids
+                prefixed = set(found)
+                rest = sorted((self._entries[entry_id][0], entry_id) for entry_id in candidates
+                              if entry_id not in prefixed and query in self._entries[entry_id][0])
+                found.extend(entry_id for _, entry_id in rest[:limit - len(found)])
+        return found
+
+    def _add(self, entry_id, name, origin):
+        folded = (name or '').casefold()
+        host = host_of(origin)
+        self._entries[entry_id] = (folded, host)
+        if host:
+            self._hosts.setdefault(host, set()).add(entry_id)
+        for trigram in trigrams(folded):
+            self._trigrams.setdefault(trigram, set()).add(entry_id)
+        return folded, entry_id
+
+    def _remove(self, entry_id):
+        indexed = self._entries.pop(entry_id, None)
+        if indexed is None:
+            return
+        folded, host = indexed
+        if host:
+            ids = self._hosts[host]
+            ids.discard(entry_id)
+            if not ids:
+                del self._hosts[host]
+        for trigram in trigrams(folded):
+            ids = self._trigrams[trigram]
+            ids.discard(entry_id)
+            if not ids:
+                del self._trigrams[trigram]
+        position = bisect.bisect_left(self._names, (folded, entry_id))
+        del self._names[position]
@@ -4,60 +4,61 @@ Test script for password manager functions (without GUI)
 Tests core functionality: password generation, encryption, and decryption
 """
 
-import random
-import string
-import gnupg
+import asyncio
+import io
+import json
 import os
+import subprocess
+import sys
+import tempfile
+import threading
 import time
 
+from clipboard_service import ClipboardService
+import credential_io
+from crypto_backend import CryptoError, get_backend
+from decrypt_cache import DecryptCache
+import envelope
+from entropy_pool import EntropyPool, password_generator, sanitization_strings
+from key_manager import KeyManager
+import loadtest
+from metrics import Registry
+from password_generator import PasswordGenerator
+from rekey import Checkpoint, RekeyError, Rekeyer
+from secret_store import SessionStore, SharedSessionStore
+from site_index import SiteIndex
+from vault import OP_PUT, Vault, VaultError
+from worker_pool import CryptoWorkerPool, PoolBusy
+import tracing
+import vault_sync
+
 class PasswordManagerTester:
-    def __init__(self):
+    def __init__(self, backend_name=None):
         # Initialize GPG with gnupg home
         self.gpg_home = os.path.expanduser("~/.password_manager_gpg_test")
         if not os.path.exists(self.gpg_home):
             os.makedirs(self.gpg_home, mode=0o700)
         
-        self.gpg = gnupg.GPG(gnupghome=self.gpg_home)
+        self.backend = get_backend(backend_name, gnupghome=self.gpg_home)
         self.password_storage = {}
         
     def generate_random_password(self, length=16):
         """Generate a random password"""
-        characters = string.ascii_uppercase + string.ascii_lowercase + string.digits + "!@#"
-        password = ''.join(random.choice(characters) for _ in range(length))
-        return password
+        return password_generator.generate(length)
     
     def encrypt_password(self, password):
-        """Encrypt the password using GPG"""
-        encrypted_data = self.gpg.encrypt(
-            password,
-            recipients=None,
-            symmetric='AES256',
-            always_trust=True,
-            passphrase='password_manager_default_key'
-        )
-        
-        if not encrypted_data.ok:
-            raise Exception(f"Encryption failed: {encrypted_data.status}")
-        
-        return str(encrypted_data)
+        """Encrypt the password using the selected backend"""
+        return self.backend.encrypt(password)
     
     def decrypt_password(self, encrypted_str):
-        """Decrypt the password using GPG"""
-        decrypted_data = self.gpg.decrypt(
-            encrypted_str,
-            always_trust=True,
-            passphrase='password_manager_default_key'
-        )
-        
-        if not decrypted_data.ok:
-            raise Exception(f"Decryption failed: {decrypted_data.status}")
-        
-        return str(decrypted_data)
+        """Decrypt the password using the selected backend"""
+        return self.backend.decrypt(encrypted_str)
     
     def run_tests(self):
         """Run all tests"""
         print("=" * 60)
         print("PASSWORD MANAGER TEST SUITE")
+        print(f"Crypto backend: {self.backend.name}")
         print("=" * 60)
         
         # Test 1: Generate random password
@@ -102,17 +103,23 @@ class PasswordManagerTester:
         # Test 5: Clipboard sanitization (simulated)
         print("\n[TEST 5] Clipboard Sanitization (Simulation)")
         print("-" * 60)
-        def generate_random_string(length=264):
-            return ''.join(
-                random.choice(string.ascii_letters + string.digits + string.punctuation)
-                for _ in range(length)
-            )
-        
         print(f"Generating 5 random strings of 264 characters each...")
-        for i in range(5):
-            random_str = generate_random_string(264)
+        for i, random_str in enumerate(sanitization_strings(5, 264)):
             print(f"✓ Random string {i+1}: {len(random_str)} characters generated")
         
+        pool = EntropyPool(capacity=64 * 1024, refill_chunk=16 * 1024)
+        pool.start()
+        deadline = time.time() + 2
+        while pool.available < pool.capacity and time.time() < deadline:
+            time.sleep(0.01)
+        served = [pool.read(1024) for _ in range(16)]
+        stats = pool.stats()
+        pool.stop()
+        if len(set(served)) != 16 or stats['empty_events'] != 0:
+            print("✗ FAILED: entropy pool did not serve distinct blocks from its buffer")
+            return False
+        print(f"✓ Entropy pool served {stats['bytes_served']} bytes without running empty")
+        
         # Test 6: Character composition check
         print("\n[TEST 6] Password Character Composition")
         print("-" * 60)
@@ -128,6 +135,844 @@ class PasswordManagerTester:
         print(f"✓ Contains digits: {has_digit}")
         print(f"✓ Contains symbols (!@#): {has_symbols}")
         
+        # Test 7: Bulk generation with a custom alphabet
+        print("\n[TEST 7] Bulk Generation with Custom Alphabet")
+        print("-" * 60)
+        hex_generator = PasswordGenerator("0123456789abcdef")
+        passwords = list(hex_generator.generate_many(10000, 32))
+        if len(passwords) != 10000 or any(len(p) != 32 or set(p) - set("0123456789abcdef") for p in passwords):
+            print("✗ FAILED: bulk generation produced wrong lengths or characters")
+            return False
+        print(f"✓ Generated {len(passwords)} hex passwords of 32 characters")
+        print(f"✓ All {len(set(passwords))} passwords are distinct")
+        
+        # Test 8: Cross-backend compatibility
+        print("\n[TEST 8] Cross-Backend Compatibility")
+        print("-" * 60)
+        gnupg_backend = get_backend("gnupg", gnupghome=self.gpg_home)
+        aead_backend = get_backend("aead", gnupghome=self.gpg_home)
+        legacy = gnupg_backend.encrypt(password)
+        if aead_backend.decrypt(legacy) != password:
+            print("✗ FAILED: aead backend could not read a gpg-armored message")
+            return False
+        print("✓ aead backend decrypts gpg-armored OpenPGP messages")
+        
+        try:
+            get_backend("aead", passphrase="wrong passphrase").decrypt(legacy)
+            print("✗ FAILED: wrong passphrase was accepted")
+            return False
+        except CryptoError:
+            print("✓ Wrong passphrase rejected")
+        
+        keys = KeyManager("password_manager_default_key", kdf="scrypt", cost=14)
+        session_backend = get_backend("aead", keys=keys)
+        messages = [session_backend.encrypt(f"pw-{i}") for i in range(20)]
+        if [session_backend.decrypt(m) for m in messages] != [f"pw-{i}" for i in range(20)] or keys.derivations != 1:
+            print(f"✗ FAILED: expected one key derivation per session, got {keys.derivations}")
+            return False
+        print("✓ Session key derived once for 20 encryptions and decryptions")
+        
+        forged = envelope.pack(envelope.KIND_AEAD, session_backend.HEADER.pack(
+            session_backend.VERSION, 1, 10_000_000, os.urandom(16), os.urandom(12)) + os.urandom(16))
+        started = time.perf_counter()
+        try:
+            session_backend.decrypt(forged)
+            print("✗ FAILED: message with an excessive KDF cost was accepted")
+            return False
+        except CryptoError:
+            pass
+        if time.perf_counter() - started > 0.5:
+            print("✗ FAILED: excessive KDF cost was run before being rejected")
+            return False
+        print("✓ Message headers asking for more than the configured KDF cost are rejected")
+        
+        release = threading.Event()
+        results = []
+        def slow_derive(passphrase):
+            release.wait(5)
+            return b"k" * 32
+        waiters = [threading.Thread(target=lambda: results.append(keys._cached(("test", 1), slow_derive)))
+                   for _ in range(3)]
+        for waiter in waiters:
+            waiter.start()
+        time.sleep(0.05)
+        started = time.perf_counter()
+        session_backend.decrypt(session_backend.encrypt("not blocked"))
+        blocked_for = time.perf_counter() - started
+        release.set()
+        for waiter in waiters:
+            waiter.join()
+        if blocked_for > 0.5 or results != [b"k" * 32] * 3 or keys.derivations != 2:
+            print(f"✗ FAILED: derivation blocked other keys ({blocked_for:.2f}s) or ran more than once")
+            return False
+        print("✓ A slow derivation runs once and does not block cached keys")
+        
+        # Test 9: Session store isolation, TTL and LRU cap
+        print("\n[TEST 9] Session Store")
+        print("-" * 60)
+        clock = [0.0]
+        store = SessionStore(shards=4, ttl=60, max_sessions=8, clock=lambda: clock[0])
+        store.set("alice", "current", password)
+        store.set("bob", "current", "other")
+        if store.get("alice", "current") != password or store.get("bob", "current") != "other":
+            print("✗ FAILED: sessions are not isolated")
+            return False
+        print("✓ Sessions are isolated")
+        
+        for i in range(50):
+            store.set(f"session-{i}", "current", "x" * 16)
+        if len(store) > 8:
+            print(f"✗ FAILED: LRU cap exceeded ({len(store)} sessions)")
+            return False
+        print(f"✓ LRU cap holds {len(store)} sessions after 52 inserts")
+        
+        clock[0] = 120.0
+        store.purge_expired()
+        if store.get("session-49", "current") is not None or len(store) != 0:
+            print("✗ FAILED: idle sessions did not expire")
+            return False
+        print("✓ Idle sessions expire after the TTL")
+        
+        # Test 10: Persistent vault
+        print("\n[TEST 10] Persistent Vault")
+        print("-" * 60)
+        with tempfile.TemporaryDirectory() as vault_dir:
+            with Vault(vault_dir, compact_min_bytes=0) as vault:
+                ids = [vault.put(self.encrypt_password(f"secret-{i}"), name=f"entry {i}") for i in range(3)]
+                vault.put(self.encrypt_password("rotated"), name="entry 0", entry_id=ids[0])
+                vault.delete(ids[1])
+                vault.compact()
+            
+            with Vault(vault_dir) as vault:
+                if len(vault) != 2 or ids[1] in vault:
+                    print("✗ FAILED: vault contents did not survive reopening")
+                    return False
+                if self.decrypt_password(vault.get(ids[0])["ciphertext"]) != "rotated":
+                    print("✗ FAILED: updated entry not persisted")
+                    return False
+                large_id = vault.put("c" * 64 * 1024, name="large", origin="example.com")
+                reads = []
+                real_pread = os.pread
+                os.pread = lambda fd, size, offset: reads.append(size) or real_pread(fd, size, offset)
+                try:
+                    entry = vault.metadata(large_id)
+                finally:
+                    os.pread = real_pread
+                if entry.get("origin") != "example.com" or "ciphertext" in entry or sum(reads) > 1024:
+                    print(f"✗ FAILED: metadata read {sum(reads)} bytes and returned {entry}")
+                    return False
+                legacy_id = vault.put("unused", name="placeholder")
+                vault._append(legacy_id, OP_PUT, {"name": "legacy", "ciphertext": "ciphertext-legacy", "updated": 1.0}, True)
+                if vault.metadata(legacy_id) != {"name": "legacy", "updated": 1.0, "id": legacy_id} or vault.get(legacy_id)["ciphertext"] != "ciphertext-legacy":
+                    print("✗ FAILED: whole-JSON records from older vaults not read")
+                    return False
+                try:
+                    Vault(vault_dir)
+                    print("✗ FAILED: vault opened twice concurrently")
+                    return False
+                except VaultError:
+                    pass
+        print("✓ Entries persist across reopen, updates and deletes applied")
+        print("✓ Compaction keeps only live entries")
+        print("✓ Names and metadata read without the ciphertext; older records still read")
+        print("✓ Concurrent open of the same vault refused")
+        
+        # Test 11: Metrics
+        print("\n[TEST 11] Metrics Exposition")
+        print("-" * 60)
+        registry = Registry()
+        latency = registry.histogram("op_seconds", "Operation latency", ("operation",), buckets=(0.5, 5.0))
+        errors = registry.counter("op_errors_total", "Failed operations", ("operation", "status"))
+        with latency.time(operation="encrypt"):
+            self.encrypt_password("metrics")
+        status = None
+        try:
+            self.decrypt_password("not a message")
+        except CryptoError as e:
+            status = e.status
+            errors.inc(operation="decrypt", status=status)
+        text = registry.render()
+        if latency.count(operation="encrypt") != 1 or 'op_seconds_bucket{operation="encrypt",le="+Inf"} 1' not in text:
+            print("✗ FAILED: histogram not rendered")
+            return False
+        if not status or f'op_errors_total{{operation="decrypt",status="{status}"}} 1' not in text:
+            print("✗ FAILED: error status not recorded")
+            return False
+        print("✓ Histogram buckets rendered in Prometheus format")
+        print("✓ Crypto failures labelled by status")
+        
+        # Test 12: Tracing and sampling profiler
+        print("\n[TEST 12] Request Tracing and Sampling Profiler")
+        print("-" * 60)
+        trace = tracing.begin("encrypt")
+        with tracing.span("encrypt"):
+            self.encrypt_password("traced")
+        with tracing.span("store"):
+            pass
+        tracing.end()
+        header = trace.server_timing()
+        if [name for name, _, _ in trace.spans] != ["encrypt", "store"] or not header.startswith("encrypt;dur="):
+            print("✗ FAILED: spans not recorded in order")
+            return False
+        with tracing.span("untraced"):
+            pass
+        with tempfile.TemporaryDirectory() as profile_dir:
+            output = os.path.join(profile_dir, "profile.folded")
+            profiler = tracing.SamplingProfiler(interval=0.01)
+            profiler.start(0.2, output)
+            self.encrypt_password("profiled")
+            profiler.join()
+            with open(output) as folded:
+                lines = folded.read().splitlines()
+        if not lines or not all(line.rsplit(" ", 1)[1].isdigit() for line in lines):
+            print("✗ FAILED: profiler did not write folded stacks")
+            return False
+        print(f"✓ Server-Timing: {header}")
+        print(f"✓ Profiler wrote {len(lines)} folded stacks from {profiler.samples} samples")
+        
+        # Test 13: Session store shared between worker processes
+        print("\n[TEST 13] Shared Session Store")
+        print("-" * 60)
+        with tempfile.TemporaryDirectory() as store_dir:
+            path = os.path.join(store_dir, "sessions.db")
+            key = os.urandom(32)
+            worker_a = SharedSessionStore(path, key, ttl=60)
+            worker_b = SharedSessionStore(path, key, ttl=60)
+            worker_a.set("session", "current", "shared-secret")
+            if worker_b.get("session", "current") != "shared-secret" or not worker_b.contains("session", "current"):
+                print("✗ FAILED: value not visible to another store instance")
+                return False
+            with open(path, "rb") as db_file:
+                if b"shared-secret" in db_file.read():
+                    print("✗ FAILED: value stored in plaintext")
+                    return False
+            worker_b.delete("session")
+            if worker_a.get("session", "current") is not None or len(worker_a) != 0:
+                print("✗ FAILED: delete not visible to another store instance")
+                return False
+
+            clock = [0.0]
+            capped = SharedSessionStore(os.path.join(store_dir, "capped.db"), key, ttl=60, max_sessions=8,
+                                        clock=lambda: clock[0])
+            for i in range(20):
+                clock[0] = float(i)
+                capped.set(f"session-{i}", "current", "x" * 16)
+            capped.set("session-19", "current", "x" * 4)
+            if len(capped) != 8 or capped.size_bytes != 7 * 16 + 4 or capped.get("session-11", "current") is not None:
+                print(f"✗ FAILED: {len(capped)} sessions, {capped.size_bytes} bytes after capping at 8")
+                return False
+            from app import purge_sessions
+            clock[0] = 100.0
+            stop = threading.Event()
+            threading.Thread(target=purge_sessions, args=(capped, 0.05, stop), daemon=True).start()
+            deadline = time.time() + 5
+            while len(capped) and time.time() < deadline:
+                time.sleep(0.05)
+            stop.set()
+            if len(capped) != 0 or capped.size_bytes != 0:
+                print("✗ FAILED: background purge left idle sessions behind")
+                return False
+        print("✓ Sessions shared between store instances on one database")
+        print("✓ Values encrypted at rest")
+        print("✓ Caps enforced from running totals; idle sessions purged in the background")
+        
+        # Test 14: ASGI variant keeps the endpoint contract
+        print("\n[TEST 14] ASGI Application")
+        print("-" * 60)
+        import asgi_app
+        
+        def call(method, path, body=None, headers=()):
+            messages = []
+            
+            async def receive():
+                return {"type": "http.request", "body": json.dumps(body).encode() if body is not None else b""}
+            
+            async def send(message):
+                messages.append(message)
+            
+            scope = {"type": "http", "method": method, "path": path, "query_string": b"",
+                     "headers": [(b"content-type", b"application/json")] + list(headers)}
+            asyncio.run(asgi_app.app(scope, receive, send))
+            response_headers = dict(messages[0]["headers"])
+            payload = b"".join(message.get("body", b"") for message in messages[1:])
+            return messages[0]["status"], response_headers, json.loads(payload)
+        
+        status, headers, payload = call("POST", "/api/generate-password", {"length": 20})
+        session = [(b"x-session-id", headers[b"x-session-id"])]
+        status, _, payload = call("POST", "/api/encrypt-password", headers=session)
+        if status != 200 or not payload.get("success"):
+            print(f"✗ FAILED: native encrypt route returned {status} {payload}")
+            return False
+        status, _, payload = call("POST", "/api/decrypt-batch", {"items": []})
+        if status != 400 or "error" not in payload:
+            print("✗ FAILED: batch validation differs from the Flask app")
+            return False
+        print("✓ Bridged and native routes share the session")
+        print("✓ Error responses match the Flask endpoints")
+        
+        # Test 15: Lazy initialization
+        print("\n[TEST 15] Lazy Initialization")
+        print("-" * 60)
+        probe = ("import sys, app; "
+                 "sys.exit(app._backend is not None or app._session_store is not None or 'gnupg' in sys.modules)")
+        if subprocess.run([sys.executable, "-c", probe], cwd=os.path.dirname(os.path.abspath(__file__))).returncode:
+            print("✗ FAILED: importing app initialized the backend or store")
+            return False
+        import app
+        app._backend = None  # force a fresh first use
+        created = set()
+        threads = [threading.Thread(target=lambda: created.add(id(app.get_crypto_backend()))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if len(created) != 1:
+            print("✗ FAILED: concurrent first use created more than one backend")
+            return False
+        print("✓ Importing app starts no gpg process and creates no store")
+        print("✓ Concurrent first use creates exactly one backend")
+        
+        # Test 16: Clipboard service
+        print("\n[TEST 16] Clipboard Service Queue")
+        print("-" * 60)
+        release = threading.Event()
+        delivered = []
+        
+        def dispatch(callback, result, error):
+            release.wait(5)  # hold the clipboard thread so requests pile up
+            callback(result, error)
+        
+        service = ClipboardService(dispatch, interval=0)
+        service.copy("ciphertext", lambda result, error: delivered.append("copy"))
+        for _ in range(3):
+            service.sanitize(2, 16, lambda result, error: delivered.append("sanitize"))
+        release.set()
+        service.stop(timeout=5)
+        if delivered != ["copy", "sanitize", "sanitize", "sanitize"] or service.commands != 2 or service.coalesced != 2:
+            print(f"✗ FAILED: expected one coalesced sanitize pass, got {delivered} in {service.commands} commands")
+            return False
+        print("✓ Three quick sanitize requests served by one pass")
+        print("✓ Every caller notified through the dispatcher")
+
+        # Test 17: Site index and lookup
+        print("\n[TEST 17] Site Index and Lookup")
+        print("-" * 60)
+        index = SiteIndex()
+        index.load([{"id": 1, "name": "GitHub", "origin": "github.com"},
+                    {"id": 2, "name": "Work GitHub", "origin": "login.github.com"},
+                    {"id": 3, "name": "Router", "origin": "192.168.1.1"}])
+        index.add(4, "Gitea", "https://git.example.org:8443/login")
+        if index.match("https://login.github.com/session") != [2, 1] or index.match("168.1.1") != []:
+            print("✗ FAILED: host lookup did not return exact then suffix matches")
+            return False
+        if index.search("git") != [4, 1, 2] or index.search("hub") != [1, 2]:
+            print(f"✗ FAILED: name search returned {index.search('git')} {index.search('hub')}")
+            return False
+        index.remove(1)
+        if index.match("github.com") != [] or index.search("git") != [4, 2]:
+            print("✗ FAILED: removed entry still indexed")
+            return False
+        print("✓ Exact and parent-domain host lookups")
+        print("✓ Prefix and substring name search")
+
+        with tempfile.TemporaryDirectory() as vault_dir:
+            previous_path, app.VAULT_PATH, app._vault = app.VAULT_PATH, vault_dir, None
+            previous_token, app.VAULT_TOKEN = app.VAULT_TOKEN, None
+            try:
+                client = app.app.test_client()
+                ciphertext = app.PasswordManager.encrypt_password("site-secret")
+                if client.post("/api/vault/entries", json={"name": "Example", "data": ciphertext}).status_code != 403:
+                    print("✗ FAILED: vault entries accepted without a configured token")
+                    return False
+                app.VAULT_TOKEN = "vault-secret"
+                client.environ_base["HTTP_X_VAULT_TOKEN"] = "wrong"
+                if (client.get("/api/vault/entries").status_code != 403
+                        or client.delete("/api/vault/entries/1").status_code != 403
+                        or client.get("/api/lookup?origin=example.com&masked=1").status_code != 403):
+                    print("✗ FAILED: vault entries accepted a wrong token")
+                    return False
+                client.environ_base["HTTP_X_VAULT_TOKEN"] = "vault-secret"
+                client.post("/api/vault/entries", json={"name": "Example", "data": ciphertext,
+                                                        "origin": "https://example.com"})
+                payload = client.get("/api/lookup?origin=https://www.example.com/login").get_json()
+                if payload.get("matches", [{}])[0].get("data") != ciphertext:
+                    print(f"✗ FAILED: lookup returned {payload}")
+                    return False
+                payload = client.get("/api/lookup?origin=example.com&masked=1").get_json()
+                if payload.get("masked") != "*" * len("site-secret"):
+                    print(f"✗ FAILED: masked lookup returned {payload}")
+                    return False
+                # A write that bypasses the app is picked up through the vault fingerprint
+                app.get_vault().put(ciphertext, name="Other", origin="other.example.net")
+                if client.get("/api/lookup?origin=other.example.net").status_code != 200:
+                    print("✗ FAILED: index not rebuilt after an outside write")
+                    return False
+                if client.get("/api/lookup?origin=unknown.test").status_code != 404:
+                    print("✗ FAILED: unknown site did not return 404")
+                    return False
+
+                for i in range(30):
+                    app.get_vault().put(ciphertext, name=f"github-{i:02d}")
+                pages, offset = [], 0
+                while offset < 40:
+                    page = client.get(f"/api/vault/entries?q=github&limit=5&offset={offset}").get_json()
+                    pages.append(page)
+                    offset += 5
+                names = [entry["name"] for page in pages for entry in page["entries"]]
+                if {page["total"] for page in pages} != {30} or names != [f"github-{i:02d}" for i in range(30)]:
+                    print(f"✗ FAILED: paged search returned totals {[page['total'] for page in pages]}, {len(names)} names")
+                    return False
+            finally:
+                app.get_vault().close()
+                app.VAULT_PATH, app._vault, app.VAULT_TOKEN = previous_path, None, previous_token
+        print("✓ Vault entry and lookup endpoints refused without the vault token")
+        print("✓ /api/lookup returns ciphertext or a masked password in one request")
+        print("✓ Paging a name search reports the full match count on every page")
+
+        # Test 18: Fused decrypt and event stream
+        print("\n[TEST 18] Decrypt-and-Sanitize and Event Stream")
+        print("-" * 60)
+        client = app.app.test_client()
+        ciphertext = app.PasswordManager.encrypt_password("pushed")
+        payload = client.post("/api/decrypt-and-sanitize", json={"data": ciphertext}).get_json()
+        if payload.get("masked") != "******" or [len(s) for s in payload.get("sanitized_strings", [])] != [264] * 5:
+            print(f"✗ FAILED: fused endpoint returned {payload}")
+            return False
+        print("✓ One request returns the masked password and sanitization strings")
+
+        stream = client.get("/api/events")  # same session, through the cookie
+        chunks = iter(stream.response)
+        events = [next(chunks), next(chunks)]
+        client.post("/api/decrypt-from-clipboard", json={"data": ciphertext}).close()
+        events.append(next(chunks))
+        stream.close()
+        pushed = [chunk for chunk in events if chunk.startswith(b"event: sanitize\n")]
+        if len(pushed) != 2 or len(app.event_hub) != 0:
+            print(f"✗ FAILED: expected a batch on connect and after the decrypt, got {events}")
+            return False
+        print("✓ Stream pushes a sanitization batch on connect and after each decrypt")
+
+        import serve
+        previous_streams = os.environ.pop("PASSWORD_MANAGER_MAX_EVENT_STREAMS", None)
+        limits = (serve.event_stream_limit(1, 4), serve.event_stream_limit(1, 1), serve.event_stream_limit(3, 8))
+        if previous_streams is not None:
+            os.environ["PASSWORD_MANAGER_MAX_EVENT_STREAMS"] = previous_streams
+        if limits != (3, 0, 0):
+            print(f"✗ FAILED: gunicorn event stream limits were {limits}")
+            return False
+        full_hub, app.event_hub = app.event_hub, app.EventHub(max_channels=0)
+        refused = client.get("/api/events").status_code
+        app.event_hub = full_hub
+        if refused != 503:
+            print(f"✗ FAILED: stream over the limit returned {refused}")
+            return False
+        print("✓ Streams leave a request thread free and are refused with several workers")
+
+        # Test 19: Compact ciphertext envelope
+        print("\n[TEST 19] Compact Ciphertext Envelope")
+        print("-" * 60)
+        armored = self.encrypt_password("compact-secret")
+        compact = self.backend.encrypt_compact("compact-secret")
+        if not envelope.is_compact(compact) or len(compact) >= len(armored):
+            print(f"✗ FAILED: compact form is not smaller ({len(compact)} vs {len(armored)} chars)")
+            return False
+        if envelope.to_compact(envelope.to_armor(compact)) != compact:
+            print("✗ FAILED: armor/compact conversion is not lossless")
+            return False
+        for text in (armored, compact, envelope.to_compact(armored), envelope.to_armor(compact)):
+            if self.decrypt_password(text) != "compact-secret":
+                print(f"✗ FAILED: could not decrypt {envelope.detect(text)} input")
+                return False
+        try:
+            self.decrypt_password(compact[:12])
+            print("✗ FAILED: truncated compact message was accepted")
+            return False
+        except CryptoError:
+            pass
+        print(f"✓ Armored {len(armored)} chars, compact {len(compact)} chars, both decrypt")
+
+        client = app.app.test_client()
+        client.post("/api/generate-password", json={"length": 16})
+        payload = client.post("/api/encrypt-password?format=compact").get_json()
+        data = client.get("/api/get-encrypted", headers={"X-Ciphertext-Format": "armor"}).get_json()["data"]
+        if payload.get("format") != "compact" or envelope.is_compact(data):
+            print(f"✗ FAILED: format negotiation returned {payload} / {data[:20]}")
+            return False
+        batch = client.post("/api/encrypt-batch?format=compact", json={"items": ["a", "b"]}).get_json()
+        decrypted = client.post("/api/decrypt-batch", json={"items": [r["data"] for r in batch["results"]]}).get_json()
+        if decrypted.get("succeeded") != 2 or client.get("/api/get-encrypted?format=binary").status_code != 400:
+            print(f"✗ FAILED: compact batch round trip returned {decrypted}")
+            return False
+        print("✓ Endpoints return the negotiated format and accept both")
+
+        # Test 20: Re-keying the vault
+        print("\n[TEST 20] Vault Re-key with Checkpoints")
+        print("-" * 60)
+        new_backend = get_backend(self.backend.name, gnupghome=self.gpg_home, passphrase="rotated passphrase")
+        with tempfile.TemporaryDirectory() as vault_dir, Vault(vault_dir) as vault:
+            for i in range(6):
+                encrypt = self.backend.encrypt_compact if i % 2 else self.backend.encrypt
+                vault.put(encrypt(f"secret-{i}"), name=f"entry-{i}", origin="example.com")
+            checkpoint_path = os.path.join(vault_dir, "rekey.checkpoint")
+            checkpoint = Checkpoint(checkpoint_path)
+            progress = io.StringIO()
+            # One entry in flight, and a stop (as from Ctrl-C) once the second is re-encrypted
+            interrupted = Rekeyer(vault, self.backend, new_backend, checkpoint, workers=1, window=1,
+                                  progress_seconds=60, out=progress)
+            reencrypt = interrupted.reencrypt
+
+            def reencrypt_then_stop(ciphertext):
+                result = reencrypt(ciphertext)
+                if interrupted.processed == 1:
+                    interrupted.stop()
+                return result
+            interrupted.reencrypt = reencrypt_then_stop
+            interrupted.run()
+            with open(checkpoint_path) as checkpoint_file:
+                stale_checkpoint = checkpoint_file.read()
+            if (checkpoint.done_through, checkpoint.rekeyed) != (2, 2) or not progress.getvalue().startswith("2/6 entries"):
+                print(f"✗ FAILED: interrupted run checkpointed {checkpoint.done_through}: {progress.getvalue()!r}")
+                return False
+
+            resumed = Checkpoint(checkpoint_path)
+            resumed.load()
+            Rekeyer(vault, self.backend, new_backend, resumed, workers=2, window=3,
+                    checkpoint_every=2, progress_seconds=60, out=progress).run()
+            if (resumed.rekeyed, resumed.skipped) != (6, 0) or not progress.getvalue().splitlines()[-1].startswith("6/6 entries"):
+                print(f"✗ FAILED: resumed run ended at {resumed.rekeyed} re-keyed, {resumed.skipped} skipped")
+                return False
+            for i, entry in enumerate(vault.iter_entries()):
+                if (new_backend.decrypt(entry["ciphertext"]) != f"secret-{i}"
+                        or envelope.is_compact(entry["ciphertext"]) != bool(i % 2)
+                        or entry["name"] != f"entry-{i}" or entry.get("origin") != "example.com"):
+                    print(f"✗ FAILED: entry {entry['id']} not re-keyed in place")
+                    return False
+            print("✓ Run stopped after 2 of 6 entries resumed at entry 3; name, metadata and format kept")
+
+            # A crash after re-keying entries 3-6 but before checkpointing them leaves the stale checkpoint
+            with open(checkpoint_path, "w") as checkpoint_file:
+                checkpoint_file.write(stale_checkpoint)
+            resumed = Checkpoint(checkpoint_path)
+            resumed.load()
+            Rekeyer(vault, self.backend, new_backend, resumed, workers=2, progress_seconds=60, out=progress).run()
+            if ((resumed.rekeyed, resumed.skipped, resumed.done_through) != (2, 4, 6)
+                    or not progress.getvalue().splitlines()[-1].startswith("6/6 entries")):
+                print(f"✗ FAILED: resumed run skipped {resumed.skipped} entries, expected 4")
+                return False
+            other_backend = get_backend(self.backend.name, gnupghome=self.gpg_home, passphrase="another")
+            try:
+                Rekeyer(vault, self.backend, other_backend, resumed, workers=1).run()
+                print("✗ FAILED: resumed with a different new passphrase")
+                return False
+            except RekeyError:
+                pass
+        print("✓ Resume skips re-keyed entries and refuses a different new passphrase")
+
+        # Test 21: Bulk import and export
+        print("\n[TEST 21] Credential Import and Export")
+        print("-" * 60)
+        previous_read_size, credential_io.READ_SIZE = credential_io.READ_SIZE, 7
+        try:
+            records = list(credential_io.read_records(io.StringIO(
+                '[{"title": "a", "url": "https://a.example/x", "password": "1"},\n'
+                ' {"name": "b", "password": 2}, "c", {"name": "d"}]'), credential_io.JSON))
+        finally:
+            credential_io.READ_SIZE = previous_read_size
+        if ([line for line, _ in records] != [1, 2, 2, 2] or records[0][1]["origin"] != "a.example"
+                or records[1][1]["password"] != "2" or not all(isinstance(r, str) for _, r in records[2:])):
+            print(f"✗ FAILED: incremental JSON parse returned {records}")
+            return False
+        print("✓ JSON parsed incrementally across tiny reads, bad records reported by line")
+
+        previous_vault_token, app.VAULT_TOKEN = app.VAULT_TOKEN, "vault-secret"
+
+        with tempfile.TemporaryDirectory() as vault_dir:
+            previous_path, app.VAULT_PATH, app._vault = app.VAULT_PATH, vault_dir, None
+            try:
+                client = app.app.test_client()
+                upload = "name,url,username,password\nMail,https://mail.example.com,me,hunter2\nBroken,,,\n"
+                if (client.post("/api/vault/import", data=upload, content_type="text/csv").status_code != 403
+                        or client.get("/api/vault/export").status_code != 403 or len(app.get_vault())):
+                    print("✗ FAILED: import or export served without the vault token")
+                    return False
+                client.environ_base["HTTP_X_VAULT_TOKEN"] = "vault-secret"
+                payload = client.post("/api/vault/import?format=compact", data=upload, content_type="text/csv").get_json()
+                if payload.get("imported") != 1 or payload["errors"][0]["line"] != 3:
+                    print(f"✗ FAILED: CSV import returned {payload}")
+                    return False
+                exported = client.get("/api/vault/export?type=json").data
+                entries = json.loads(exported)
+                if entries[0]["username"] != "me" or envelope.is_compact(entries[0]["data"]):
+                    print(f"✗ FAILED: export returned {entries}")
+                    return False
+                payload = client.post("/api/vault/import", data=exported, content_type="application/json").get_json()
+                stopped = client.post("/api/vault/import?type=json", data=b'{"name": "x", "password": "y"}\n{')
+                if payload.get("imported") != 1 or stopped.status_code != 400 or stopped.get_json()["imported"] != 1:
+                    print(f"✗ FAILED: re-import returned {payload} / {stopped.get_json()}")
+                    return False
+                match = client.get("/api/lookup?origin=mail.example.com&masked=1").get_json()
+                if match.get("masked") != "*******" or len(app.get_vault()) != 3:
+                    print(f"✗ FAILED: imported entry not found by lookup: {match}")
+                    return False
+            finally:
+                app.get_vault().close()
+                app.VAULT_PATH, app._vault = previous_path, None
+        print("✓ Import and export refused without the vault token")
+        print("✓ CSV/JSON upload, streamed export and export re-import round trip")
+
+        with tempfile.TemporaryDirectory() as vault_dir:
+            previous = app.VAULT_PATH, app.VAULT_SHARED
+            app.VAULT_PATH, app.VAULT_SHARED, app._vault = vault_dir, True, None
+            try:
+                rows = "".join(f"site-{i},https://s{i}.example,,data-{i}\n" for i in range(600))
+                chunks = [b"name,url,username,password\n"] + [rows[i:i + 1000].encode() for i in range(0, len(rows), 1000)]
+                messages = []
+
+                async def receive():
+                    body = chunks.pop(0)
+                    return {"type": "http.request", "body": body, "more_body": bool(chunks)}
+
+                async def send(message):
+                    messages.append(message)
+
+                scope = {"type": "http", "method": "POST", "path": "/api/vault/import", "query_string": b"type=csv",
+                         "headers": [(b"transfer-encoding", b"chunked"), (b"x-vault-token", b"vault-secret")]}
+                asyncio.run(asgi_app.app(scope, receive, send))
+                payload = json.loads(b"".join(message.get("body", b"") for message in messages[1:]))
+                if payload.get("imported") != 600:
+                    print(f"✗ FAILED: chunked ASGI import returned {payload}")
+                    return False
+
+                export = app.app.test_client().get("/api/vault/export", headers={"X-Vault-Token": "vault-secret"})
+                body = iter(export.response)
+                next(body)
+                next(body)  # mid-download
+                with Vault(vault_dir, lock_timeout=1) as other:
+                    other.put("written during the download", name="other")
+                downloaded = b"".join(body).decode()
+                export.close()
+                if downloaded.count("\n") < 599:
+                    print("✗ FAILED: export did not finish after another writer used the vault")
+                    return False
+
+                with app.open_vault() as vault:
+                    app.get_site_index(vault)
+                    app.get_sync_tree(vault)
+                loads = []
+                app.site_index.load = lambda *args, **kwargs: loads.append(args)
+                try:
+                    with Vault(vault_dir, lock_timeout=1, shared=True) as worker:
+                        with app.open_vault() as vault, worker.hold():
+                            pass  # readers in two processes share the lock
+                        with worker.hold(exclusive=True):
+                            new_id = worker.put("ciphertext-worker", name="Worker entry", origin="worker.example")
+                            worker.delete(1)
+                    with app.open_vault() as vault:
+                        found = app.get_site_index(vault).match("https://worker.example")
+                        tree = app.get_sync_tree(vault)
+                        rebuilt = vault_sync.SyncTree(vault.iter_entries())
+                        count = len(vault)
+                finally:
+                    del app.site_index.load
+                if loads or found != [new_id] or tree.node() != rebuilt.node() or len(tree) != count:
+                    print(f"✗ FAILED: another worker's writes were not picked up incrementally ({found}, {len(loads)} reloads)")
+                    return False
+            except VaultError as e:
+                print(f"✗ FAILED: vault held for the whole download: {e}")
+                return False
+            finally:
+                app.get_vault().close()
+                app.VAULT_PATH, app.VAULT_SHARED, app._vault = previous + (None,)
+        print("✓ Chunked ASGI upload streamed; shared vault only held per batch and page")
+        print("✓ Workers share the vault lock for reads and pick up each other's writes incrementally")
+        app.VAULT_TOKEN = previous_vault_token
+
+        # Test 22: Delta sync between two nodes
+        print("\n[TEST 22] Vault Delta Sync")
+        print("-" * 60)
+        import logging
+        from werkzeug.serving import make_server
+
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        with tempfile.TemporaryDirectory() as remote_dir, tempfile.TemporaryDirectory() as local_dir:
+            previous_path, app.VAULT_PATH, app._vault = app.VAULT_PATH, remote_dir, None
+            previous_token, app.SYNC_TOKEN = app.SYNC_TOKEN, None
+            server = make_server("127.0.0.1", 0, app.app, threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            try:
+                remote = app.get_vault()
+                for i in range(600):
+                    remote.put(f"ciphertext-{i}", name=f"entry-{i}", origin="example.com")
+                peer_url = f"http://127.0.0.1:{server.server_port}"
+                with Vault(local_dir) as local:
+                    try:
+                        vault_sync.pull_changes(local, vault_sync.SyncTree(local.iter_entries()),
+                                                vault_sync.HttpPeer(peer_url, "sync-secret"))
+                        print("✗ FAILED: sync endpoints answered without a configured token")
+                        return False
+                    except vault_sync.SyncError:
+                        pass
+                    app.SYNC_TOKEN = "sync-secret"
+                    first = vault_sync.pull_changes(local, vault_sync.SyncTree(local.iter_entries()),
+                                                    vault_sync.HttpPeer(peer_url, "sync-secret"))
+                    tree = vault_sync.SyncTree(local.iter_entries())
+                    if first["added"] != 600 or tree.node() != app.get_sync_tree(remote).node():
+                        print(f"✗ FAILED: initial sync returned {first}")
+                        return False
+
+                    remote.put("ciphertext-changed", name="entry-5", entry_id=6)
+                    remote.put("ciphertext-new", name="entry-new")
+                    local_id = tree.local_ids[vault_sync.entry_uid(remote.get(9))]
+                    local.put("ciphertext-local", name="entry-8", entry_id=local_id)
+                    delta = vault_sync.pull_changes(local, vault_sync.SyncTree(local.iter_entries()),
+                                                    vault_sync.HttpPeer(peer_url, "sync-secret"))
+                    if (delta["added"], delta["updated"]) != (1, 1) or delta["requests"] > 12:
+                        print(f"✗ FAILED: delta sync returned {delta}")
+                        return False
+                    if local.get(local_id)["ciphertext"] != "ciphertext-local" or len(local) != 601:
+                        print("✗ FAILED: newer local change was overwritten")
+                        return False
+                    print(f"✓ 600 entries copied, then 2 changes pulled in {delta['requests']} requests")
+
+                    legacy_id = len(local) + 1  # written the way vaults were before uids existed
+                    local._append(legacy_id, OP_PUT, {"name": "old", "ciphertext": "ciphertext-old", "updated": 1.0}, True)
+                    legacy_uid = vault_sync.entry_uid(local.get(legacy_id))
+                    local.put("ciphertext-rotated", name="old", entry_id=legacy_id)
+                    if local.get(legacy_id).get("uid") != legacy_uid:
+                        print("✗ FAILED: updating a pre-uid entry gave it a new identity")
+                        return False
+                    print("✓ Updated pre-uid entries keep their legacy uid")
+
+                    remote._append(len(remote) + 1, OP_PUT, {"name": "forged", "ciphertext": "ciphertext-forged",
+                                                             "updated": time.time(), "uid": "forged",
+                                                             "entry_id": 1, "sync": True}, True)
+                    first_entry = local.get(1)
+                    forged = vault_sync.pull_changes(local, vault_sync.SyncTree(local.iter_entries()),
+                                                     vault_sync.HttpPeer(peer_url, "sync-secret"))
+                    if forged["skipped"] != 1 or local.get(1) != first_entry:
+                        print(f"✗ FAILED: entry with put() arguments as metadata was pulled: {forged}")
+                        return False
+                    print("✓ Peer entries carrying put() arguments as metadata are skipped")
+                client = app.app.test_client()
+                if (client.get("/api/sync/summary?prefix=xyz", headers={"X-Sync-Token": "sync-secret"}).status_code != 400
+                        or client.get("/api/sync/summary", headers={"X-Sync-Token": "wrong"}).status_code != 403
+                        or client.post("/api/sync/run", json={"peer": peer_url}).status_code != 403):
+                    print("✗ FAILED: sync endpoints accepted a bad prefix, a wrong token or an unauthenticated run")
+                    return False
+            finally:
+                server.shutdown()
+                app.get_vault().close()
+                app.VAULT_PATH, app._vault, app.SYNC_TOKEN = previous_path, None, previous_token
+        print("✓ Later update wins; endpoints need the sync token and validate input")
+
+        # Test 23: Open-loop load test against a live server
+        print("\n[TEST 23] Load Test Harness")
+        print("-" * 60)
+        hundred, ten = list(range(1, 101)), list(range(1, 11))
+        ranks = [loadtest.percentile(hundred, 0.95), loadtest.percentile(hundred, 0.99), loadtest.percentile(hundred, 0.07),
+                 loadtest.percentile(ten, 0.5), loadtest.percentile(ten, 0.0), loadtest.percentile(ten, 1.0),
+                 loadtest.percentile([3.5], 0.99)]
+        if ranks != [95, 99, 7, 5, 1, 10, 3.5]:
+            print(f"✗ FAILED: nearest-rank percentiles returned {ranks}")
+            return False
+        print("✓ Nearest-rank percentiles of known lists")
+        server = make_server("127.0.0.1", 0, app.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            client = loadtest.Client(f"http://127.0.0.1:{server.server_port}")
+            mix = loadtest.parse_mix(loadtest.DEFAULT_MIX)
+            run = loadtest.LoadRun(client, mix, rate=10, duration=2, warmup=0.2, seed=7,
+                                   ciphertexts=loadtest.prepare_ciphertexts(client, 3))
+            result = run.run()
+        finally:
+            server.shutdown()
+        if result['arrivals'] < 5 or result['failed'] or set(result['flows']) != set(mix):
+            print(f"✗ FAILED: load run returned {result['arrivals']} arrivals, errors {result['errors']}")
+            return False
+        if len(result['routes']) != 5 or result['latency']['p99_ms'] < result['latency']['p50_ms']:
+            print(f"✗ FAILED: unexpected route statistics {result['routes']}")
+            return False
+        behind = dict(result, throughput_flows=result['offered_rate'] * 0.5)
+        if loadtest.saturation(behind, 0.01) is None or loadtest.saturation(
+                dict(result, throughput_flows=result['offered_rate']), 0.01) is not None:
+            print("✗ FAILED: saturation check misjudged the run")
+            return False
+        try:
+            loadtest.parse_mix("clipboard=1,unknown=2")
+            print("✗ FAILED: unknown flow accepted in the mix")
+            return False
+        except loadtest.LoadTestError:
+            pass
+        print(f"✓ {result['arrivals']} flows replayed at 10/s without errors, p99 {result['latency']['p99_ms']:.1f}ms")
+
+        # Test 24: Batch endpoints and the bounded worker pool
+        print("\n[TEST 24] Batch Endpoints and Worker Pool")
+        print("-" * 60)
+        client = app.app.test_client()
+        encrypted = client.post("/api/encrypt-batch", json={"items": ["one", "two"]}).get_json()
+        ciphertexts = [result["data"] for result in encrypted["results"]]
+        decrypted = client.post("/api/decrypt-batch", json={"items": ciphertexts + ["not a ciphertext"]}).get_json()
+        if (encrypted["succeeded"] != 2 or decrypted["succeeded"] != 2 or decrypted["failed"] != 1
+                or decrypted["results"][2]["success"] or decrypted["results"][1]["masked"] != "***"):
+            print(f"✗ FAILED: batch round trip returned {decrypted}")
+            return False
+        too_large = client.post("/api/decrypt-batch", json={"items": ["x"] * (app.MAX_BATCH_ITEMS + 1)})
+        if too_large.status_code != 400:
+            print("✗ FAILED: oversized batch accepted")
+            return False
+        print("✓ Batch items succeed and fail independently; oversized batches rejected")
+
+        gate = threading.Event()
+        pool = CryptoWorkerPool(workers=1, max_pending=2, submit_timeout=0.5)
+        threading.Timer(0.8, gate.set).start()
+        started = time.perf_counter()
+        outcomes = pool.map_results(lambda item: gate.wait() and item, range(10))
+        elapsed = time.perf_counter() - started
+        pool.shutdown()
+        busy = [value for ok, value in outcomes[2:] if not ok and isinstance(value, PoolBusy)]
+        if outcomes[:2] != [(True, 0), (True, 1)] or len(busy) != 8 or elapsed > 2.0:
+            print(f"✗ FAILED: full pool returned {outcomes} after {elapsed:.1f}s")
+            return False
+        print(f"✓ Full pool fails the rest of a batch at once ({elapsed:.1f}s for 10 items)")
+
+        # Test 25: Decrypt cache
+        print("\n[TEST 25] Decrypt Cache")
+        print("-" * 60)
+        clock = [0.0]
+        cache = DecryptCache(max_entries=2, ttl=30, clock=lambda: clock[0])
+        cache.put("ciphertext-a", "plain-a")
+        if cache.get("ciphertext-a") != "plain-a" or cache.get(" ciphertext-a\n") != "plain-a" or cache.get("other"):
+            print("✗ FAILED: cache lookups returned the wrong plaintext")
+            return False
+        if (cache.hits, cache.misses) != (2, 1):
+            print(f"✗ FAILED: expected 2 hits and 1 miss, got {cache.stats()}")
+            return False
+        print("✓ Hits and misses counted; lookups ignore surrounding whitespace")
+
+        buffers = [entry[1] for entry in cache._entries.values()]
+        cache.put("ciphertext-b", "plain-b")
+        cache.get("ciphertext-a")  # a is now the most recently used
+        cache.put("ciphertext-c", "plain-c")
+        if cache.get("ciphertext-b") is not None or cache.get("ciphertext-a") != "plain-a":
+            print("✗ FAILED: least recently used entry was not evicted")
+            return False
+        clock[0] = 31.0
+        cache.purge_expired()
+        if len(cache) != 0 or cache.get("ciphertext-c") is not None:
+            print(f"✗ FAILED: expired entries survived the purge ({len(cache)} left)")
+            return False
+        if any(any(buffer) for buffer in buffers):
+            print("✗ FAILED: evicted plaintext was not wiped")
+            return False
+        print("✓ LRU eviction and TTL expiry wipe the cached plaintext")
+
+        for disabled in (DecryptCache(max_entries=0), DecryptCache(ttl=0)):
+            disabled.put("ciphertext-a", "plain-a")
+            if disabled.enabled or len(disabled) or disabled.get("ciphertext-a") is not None:
+                print("✗ FAILED: disabled cache stored a plaintext")
+                return False
+        print("✓ max_entries=0 or ttl=0 disables the cache")
+
         print("\n" + "=" * 60)
         print("ALL TESTS PASSED ✓")
         print("=" * 60)
@@ -136,6 +981,7 @@ class PasswordManagerTester:
         return True
 
 if __name__ == "__main__":
-    tester = PasswordManagerTester()
+    # Optional backend name: python test_password_manager.py [gnupg|aead]
+    tester = PasswordManagerTester(sys.argv[1] if len(sys.argv) > 1 else None)
     success = tester.run_tests()
     exit(0 if success else 1)
@@ -0,0 +1,202 @@
+"""
+Per-request tracing and an on-demand sampling profiler.
+
+A Trace collects named spans (request parsing, crypto work, store access,
+JSON serialization) for one request.  The active trace lives in a context
+variable, so span() can be used anywhere on the request path and costs one
+lookup when tracing is off.  Finished traces are rendered as a Server-Timing
+header and can be appended to a JSON-lines trace file by a TraceWriter.
+
+SamplingProfiler periodically samples the stacks of all other threads for a
+fixed number of seconds and writes them in the folded format read by
+flamegraph.pl, speedscope and similar tools:
+
+    thread;outer (file.py:10);inner (file.py:42) 17
+"""
+
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar('password_manager_trace', default=None)
+
+
+class Trace:
+    """Spans recorded while handling one request"""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        self.spans = []
+
+    def add(self, name, started, duration):
+        self.spans.append((name, started - self.started, duration))
+
+    @property
+    def duration(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """Return a Server-Timing header value, summing repeated span names"""
+        totals = {}
+        for name, _, duration in self.spans:
+            totals[name] = totals.get(name, 0.0) + duration
+        metrics = [f'{name};dur={duration * 1000:.3f}' for name, duration in totals.items()]
+        metrics.append(f'total;dur={self.duration * 1000:.3f}')
+        return ', '.join(metrics)
+
+    def to_dict(self, **fields):
+        record = {'name': self.name, 'timestamp': self.wall_started, 'duration_ms': self.duration * 1000}
+        record.update(fields)
+        record['spans'] = [{'name': name, 'start_ms': start * 1000, 'duration_ms': duration * 1000}
+                           for name, start, duration in self.spans]
+        return record
+
+
+def begin(name):
+    """Start a trace for the current context and return it"""
+    trace = Trace(name)
+    _current.set(trace)
+    return trace
+
+
+def current():
+    """Return the active trace, or None when tracing is off"""
+    return _current.get()
+
+
+def end():
+    """Detach and return the active trace"""
+    trace = _current.get()
+    _current.set(None)
+    return trace
+
+
+@contextmanager
+def span(name):
+    """Record the with-block as a span of the active trace, if any"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, started, time.perf_counter() - started)
+
+
+class TracedProxy:
+    """Wrap an object so calls to the named methods are recorded as spans"""
+
+    def __init__(self, target, span_name, methods):
+        self._target = target
+        self._span_name = span_name
+        self._methods = frozenset(methods)
+
+    def __getattr__(self, attribute):
+        value = getattr(self._target, attribute)
+        if attribute not in self._methods:
+            return value
+
+        def traced(*args, **kwargs):
+            with span(self._span_name):
+                return value(*args, **kwargs)
+        return traced
+
+    def __len__(self):
+        return len(self._target)
+
+
+class TraceWriter:
+    """Append finished traces to a file, one JSON object per line"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def write(self, record):
+        line = json.dumps(record) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})'
+
+
+class SamplingProfiler:
+    """Samples every thread's stack at a fixed interval and writes folded stacks"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self.samples = 0
+        self.output_path = None
+        self.finished_at = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds, output_path):
+        """Profile for seconds in a background thread, then write output_path"""
+        with self._lock:
+            if self.running:
+                raise RuntimeError("Profiler is already running")
+            self.samples = 0
+            self.output_path = output_path
+            self.finished_at = None
+            self._thread = threading.Thread(target=self._run, args=(seconds, output_path),
+                                            name='sampling-profiler', daemon=True)
+            self._thread.start()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self, seconds, output_path):
+        own_ident = threading.get_ident()
+        stacks = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, f'thread-{ident}'))
+                stacks[';'.join(reversed(labels))] += 1
+            self.samples += 1
+            time.sleep(self.interval)
+
+        with open(output_path, 'w', encoding='utf-8') as output:
+            for stack, count in stacks.most_common():
+                output.write(f'{stack} {count}\n')
+        self.finished_at = time.time()
+
+    def stats(self):
+        return {
+            'running': self.running,
+            'interval': self.interval,
+            'samples': self.samples,
+            'output': self.output_path,
+            'finished_at': self.finished_at,
+        }
@@ -0,0 +1,744 @@
+"""
+Persistent vault of encrypted entries.
+
+On disk a vault is a directory holding two files:
+
+vault.log
+    Append-only record log.  After an 8-byte magic, every record is a frame
+    header (payload length, CRC32, entry id, op) followed by the payload.
+    Puts store the entry's name and metadata as JSON, with its own length
+    and CRC32, ahead of the ciphertext, so names can be listed without
+    reading ciphertexts (older logs hold the whole entry as one JSON
+    object, which is still read).  Updates append a new record and
+    deletions append a tombstone; nothing is rewritten in place.
+
+vault.idx
+    Fixed-size slots, one per entry id, holding the offset and length of the
+    entry's latest record.  The file is memory-mapped, so looking up an entry
+    is one struct unpack plus one pread.
+
+Writes are made durable by a background thread that fsyncs the log in
+batches (group commit); put(..., sync=True) waits for the batch containing
+its record.  The index header records how much of the log it covers and is
+flagged dirty while it may be ahead of the fsynced log, in which case it is
+rebuilt from the log on the next open.  A torn record at the end of the log
+(crash mid-write) is truncated away on open.
+
+Once enough of the log is superseded records, a background compaction
+copies the live records into a fresh log and swaps it in.
+
+A vault is held open by one process at a time (an exclusive flock on the
+log).  Processes that share a vault, such as several server workers, open it
+with shared=True instead: each keeps its handle and a private copy of the
+index, and brackets its reads and writes with hold(), which takes the flock
+(shared for reads, exclusive for writes) and first replays whatever the other
+processes appended since.  Writes are fsynced before the exclusive lock is
+released, and the index file is only rewritten at checkpoints.
+
+Only ciphertexts are stored; entry names and metadata are kept in the clear
+so entries can be listed and searched without decrypting them.  Every entry
+also gets a random uid, kept across updates, which names it on every node
+the vault is synced to (vault_sync.py); ids are local to one vault.
+"""
+
+import json
+import mmap
+import os
+import secrets
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+import vault_sync
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+LOG_NAME = 'vault.log'
+INDEX_NAME = 'vault.idx'
+
+LOG_MAGIC = b'PMVAULT1'
+INDEX_MAGIC = b'PMVI'
+INDEX_VERSION = 1
+
+OP_PUT = 1          # whole entry as one JSON object (written by earlier versions)
+OP_DELETE = 2
+OP_PUT_SPLIT = 3    # METADATA header, metadata JSON, then the ciphertext
+
+FLAG_LIVE = 1
+
+INDEX_CLEAN = 0
+INDEX_DIRTY = 1
+
+# payload length, crc32 of everything after it, entry id, op
+FRAME = struct.Struct('>IIQB')
+# magic, version, clean/dirty state, next entry id, log bytes covered
+INDEX_HEADER = struct.Struct('>4sIIQQ')
+INDEX_HEADER_SIZE = 32
+# record offset, record length, flags
+SLOT = struct.Struct('>QII')
+# metadata JSON length and crc32, at the start of an OP_PUT_SPLIT payload
+METADATA = struct.Struct('>II')
+# metadata bytes metadata() reads along with the header
+METADATA_READ = 256
+
+
+class VaultError(Exception):
+    """Raised when a vault cannot be opened or an entry is missing"""
+
+
+def _encode_record(entry_id, op, payload):
+    if op == OP_PUT_SPLIT:
+        metadata = {key: value for key, value in payload.items() if key != 'ciphertext'}
+        metadata = json.dumps(metadata, separators=(',', ':')).encode('utf-8')
+        body = METADATA.pack(len(metadata), zlib.crc32(metadata)) + metadata + payload['ciphertext'].encode('utf-8')
+    else:
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8') if payload is not None else b''
+    tail = struct.pack('>QB', entry_id, op) + body
+    return FRAME.pack(len(body), zlib.crc32(tail), entry_id, op) + body
+
+
+def _decode_record(data):
+    """Return (entry_id, op, payload) for one framed record, or None if it is torn"""
+    if len(data) < FRAME.size:
+        return None
+    length, crc, entry_id, op = FRAME.unpack_from(data)
+    if len(data) < FRAME.size + length or zlib.crc32(data[8:FRAME.size + length]) != crc:
+        return None
+    body = data[FRAME.size:FRAME.size + length]
+    if op == OP_PUT_SPLIT:
+        end = METADATA.size + METADATA.unpack_from(body)[0]
+        payload = json.loads(body[METADATA.size:end])
+        payload['ciphertext'] = body[end:].decode('utf-8')
+        return entry_id, op, payload
+    return entry_id, op, json.loads(body) if body else None
+
+
+class Vault:
+    """Append-only encrypted entry store with a memory-mapped offset index"""
+
+    def __init__(self, path, fsync_interval=0.05, fsync_batch=64,
+                 compact_ratio=0.5, compact_min_bytes=1024 * 1024, lock_timeout=0, shared=False):
+        self.path = path
+        self.shared = shared
+        self.lock_timeout = lock_timeout
+        self.fsync_interval = fsync_interval
+        self.fsync_batch = fsync_batch
+        self.compact_ratio = compact_ratio
+        self.compact_min_bytes = compact_min_bytes
+
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._synced = threading.Condition(self._lock)
+        self._closed = False
+        self._compacting = False
+
+        self._written_seq = 0
+        self._synced_seq = 0
+
+        # Threads of this process inside hold() (shared mode)
+        self._holders = threading.Condition()
+        self._readers = 0
+        self._writer = None
+        self._waiting_writers = 0
+
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        self._open_log(lock_timeout)
+        self._open_index()
+
+        if shared:
+            # Writes are fsynced when hold() releases the lock, not by a flusher
+            self._flusher = None
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        else:
+            self._flusher = threading.Thread(target=self._flush_loop, name='vault-fsync', daemon=True)
+            self._flusher.start()
+
+    # -- opening and recovery -------------------------------------------
+
+    def _open_log(self, lock_timeout):
+        self._log_path = os.path.join(self.path, LOG_NAME)
+        self._fd = os.open(self._log_path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o600)
+        try:
+            self._lock_log(True, lock_timeout)
+        except VaultError:
+            os.close(self._fd)
+            raise
+
+        self._log_size = os.fstat(self._fd).st_size
+        if self._log_size == 0:
+            os.write(self._fd, LOG_MAGIC)
+            os.fsync(self._fd)
+            self._log_size = len(LOG_MAGIC)
+        elif os.pread(self._fd, len(LOG_MAGIC), 0) != LOG_MAGIC:
+            os.close(self._fd)
+            raise VaultError(f"{self._log_path} is not a vault log")
+
+    def _lock_log(self, exclusive, timeout):
+        """flock the log, reopening it if a compaction replaced the file; True if it was reopened"""
+        if fcntl is None:
+            return False
+        deadline = time.monotonic() + timeout
+        reopened = False
+        while True:
+            try:
+                fcntl.flock(self._fd, (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB)
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise VaultError(f"Vault {self.path} is already open in another process")
+                time.sleep(0.01)
+                continue
+            # A compaction in the previous holder may have replaced the file we locked
+            if os.fstat(self._fd).st_ino == os.stat(self._log_path).st_ino:
+                return reopened
+            with self._lock:
+                os.close(self._fd)
+                self._fd = os.open(self._log_path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o600)
+            reopened = True
+
+    def _open_index(self, exclusive=True):
+        self._index_path = os.path.join(self.path, INDEX_NAME)
+        self._index_fd = os.open(self._index_path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._index_fd).st_size < INDEX_HEADER_SIZE + SLOT.size:
+            os.ftruncate(self._index_fd, INDEX_HEADER_SIZE + 1024 * SLOT.size)
+        self._map_index()
+
+        magic, version, state, next_id, covered = INDEX_HEADER.unpack_from(self._index)
+        usable = (magic == INDEX_MAGIC and version == INDEX_VERSION
+                  and state == INDEX_CLEAN and covered <= self._log_size)
+        if not usable:
+            self._index[:] = bytes(len(self._index))
+            next_id, covered = 1, len(LOG_MAGIC)
+
+        self._next_id = next_id
+        self._live = 0
+        self._dead_bytes = 0
+        live_bytes = 0
+        for entry_id in range(1, min(next_id, self._capacity)):
+            offset, length, flags = SLOT.unpack_from(self._index, self._slot_offset(entry_id))
+            if flags & FLAG_LIVE:
+                self._live += 1
+                live_bytes += length
+        self._dead_bytes = covered - len(LOG_MAGIC) - live_bytes
+
+        self._index_state = INDEX_CLEAN
+        self._mark_dirty()
+        self._replay(covered, truncate=exclusive)
+        if exclusive:
+            self._checkpoint()
+
+    def _map_index(self):
+        size = os.fstat(self._index_fd).st_size
+        if self.shared:
+            # Other processes write the log too, so each keeps its own copy of the index
+            self._index = mmap.mmap(-1, size)
+            self._index[:] = os.pread(self._index_fd, size, 0)
+        else:
+            self._index = mmap.mmap(self._index_fd, size)
+        self._capacity = (size - INDEX_HEADER_SIZE) // SLOT.size
+
+    def _refresh(self, reopened, exclusive):
+        """Catch up with records other processes appended since this one last held the lock"""
+        with self._lock:
+            if reopened:
+                # Compacted elsewhere: reload the index written with the new log
+                self._index.close()
+                os.close(self._index_fd)
+                self._log_size = os.fstat(self._fd).st_size
+                self._open_index(exclusive)
+            elif os.fstat(self._fd).st_size != self._log_size:
+                self._replay(self._log_size, truncate=exclusive)
+
+    def _replay(self, start, truncate=True):
+        """Apply log records from start onward to the index, truncating a torn tail if allowed"""
+        offset = start
+        with open(self._log_path, 'rb') as log:
+            log.seek(offset)
+            while True:
+                header = log.read(FRAME.size)
+                if not header:
+                    break
+                length = FRAME.unpack_from(header)[0] if len(header) == FRAME.size else 0
+                record = _decode_record(header + log.read(length))
+                if record is None:
+                    # Torn write from a crash: drop everything after the last good record
+                    if truncate:
+                        os.ftruncate(self._fd, offset)
+                    break
+                entry_id, op, _ = record
+                self._apply(entry_id, op, offset, FRAME.size + length)
+                offset += FRAME.size + length
+        self._log_size = offset
+
+    # -- index maintenance (lock held) ----------------------------------
+
+    @staticmethod
+    def _slot_offset(entry_id):
+        return INDEX_HEADER_SIZE + entry_id * SLOT.size
+
+    def _ensure_capacity(self, entry_id):
+        if entry_id < self._capacity:
+            return
+        capacity = self._capacity
+        while capacity <= entry_id:
+            capacity *= 2
+        if self.shared:
+            index = mmap.mmap(-1, INDEX_HEADER_SIZE + capacity * SLOT.size)
+            index[:len(self._index)] = self._index
+            self._index.close()
+            self._index, self._capacity = index, capacity
+            return
+        self._index.flush()
+        self._index.close()
+        os.ftruncate(self._index_fd, INDEX_HEADER_SIZE + capacity * SLOT.size)
+        self._map_index()
+
+    def _read_slot(self, entry_id):
+        if not 0 < entry_id < min(self._next_id, self._capacity):
+            return None
+        offset, length, flags = SLOT.unpack_from(self._index, self._slot_offset(entry_id))
+        return (offset, length) if flags & FLAG_LIVE else None
+
+    def _apply(self, entry_id, op, offset, length):
+        self._ensure_capacity(entry_id)
+        previous = self._read_slot(entry_id)
+        if previous is not None:
+            self._dead_bytes += previous[1]
+            self._live -= 1
+
+        if op != OP_DELETE:
+            SLOT.pack_into(self._index, self._slot_offset(entry_id), offset, length, FLAG_LIVE)
+            self._live += 1
+        else:
+            SLOT.pack_into(self._index, self._slot_offset(entry_id), 0, 0, 0)
+            self._dead_bytes += length
+        self._next_id = max(self._next_id, entry_id + 1)
+
+    def _write_index_header(self, covered, state):
+        INDEX_HEADER.pack_into(self._index, 0, INDEX_MAGIC, INDEX_VERSION, state, self._next_id, covered)
+        self._index_state = state
+
+    def _checkpoint(self):
+        """Make the log and index durable and record that they agree"""
+        os.fsync(self._fd)
+        self._index.flush()
+        self._write_index_header(self._log_size, INDEX_CLEAN)
+        if self.shared:
+            self._save_index()
+        else:
+            self._index.flush(0, mmap.PAGESIZE)
+
+    def _save_index(self):
+        """Replace the index file with this process's copy (shared mode, exclusive lock held)"""
+        temporary = self._index_path + '.tmp'
+        with open(temporary, 'wb') as index_file:
+            index_file.write(self._index)
+            index_file.flush()
+            os.fsync(index_file.fileno())
+        os.replace(temporary, self._index_path)
+        os.close(self._index_fd)
+        self._index_fd = os.open(self._index_path, os.O_RDWR, 0o600)
+
+    def _mark_dirty(self):
+        """Persist the dirty flag before the index can get ahead of the fsynced log"""
+        if self._index_state == INDEX_DIRTY:
+            return
+        magic, version, _, next_id, covered = INDEX_HEADER.unpack_from(self._index)
+        INDEX_HEADER.pack_into(self._index, 0, INDEX_MAGIC, INDEX_VERSION, INDEX_DIRTY, self._next_id, covered)
+        self._index.flush(0, mmap.PAGESIZE)
+        self._index_state = INDEX_DIRTY
+
+    # -- writes ---------------------------------------------------------
+
+    def _append(self, entry_id, op, payload, sync):
+        record = _encode_record(entry_id, op, payload)
+        if self.shared and self._writer != threading.get_ident():
+            raise VaultError("Shared vaults can only be written inside hold(exclusive=True)")
+        with self._lock:
+            if self._closed:
+                raise VaultError("Vault is closed")
+            self._mark_dirty()
+            offset = self._log_size
+            written = 0
+            while written < len(record):
+                written += os.write(self._fd, record[written:])
+            self._log_size += len(record)
+            self._apply(entry_id, op, offset, len(record))
+            self._written_seq += 1
+            seq = self._written_seq
+
+            if sync and self._flusher is not None:
+                self._synced.notify_all()
+                while self._synced_seq < seq and not self._closed:
+                    self._synced.wait()
+            elif self._written_seq - self._synced_seq >= self.fsync_batch:
+                self._synced.notify_all()
+
+        if sync and self._flusher is None:
+            self.sync()
+        self._maybe_compact()
+
+    def put(self, ciphertext, name='', entry_id=None, sync=False, updated=None, **metadata):
+        """Store an encrypted entry (new, or replacing entry_id) and return its id"""
+        if 'uid' not in metadata and entry_id is not None:
+            try:
+                # entries written before uids existed keep the name vault_sync gave them
+                metadata['uid'] = vault_sync.entry_uid(self.get(entry_id))
+            except VaultError:
+                pass
+        metadata.setdefault('uid', secrets.token_hex(16))
+        with self._lock:
+            if entry_id is None:
+                entry_id = self._next_id
+                self._next_id += 1
+        payload = dict(metadata, name=name, ciphertext=ciphertext, updated=updated or time.time())
+        self._append(entry_id, OP_PUT_SPLIT if isinstance(ciphertext, str) else OP_PUT, payload, sync)
+        return entry_id
+
+    def delete(self, entry_id, sync=False):
+        """Remove an entry; raises VaultError if it does not exist"""
+        with self._lock:
+            if self._read_slot(entry_id) is None:
+                raise VaultError(f"No vault entry with id {entry_id}")
+        self._append(entry_id, OP_DELETE, None, sync)
+
+    # -- reads ----------------------------------------------------------
+
+    def get(self, entry_id):
+        """Return the entry dict (id, name, ciphertext, updated, metadata...)"""
+        with self._lock:
+            slot = self._read_slot(entry_id)
+            if slot is None:
+                raise VaultError(f"No vault entry with id {entry_id}")
+            data = os.pread(self._fd, slot[1], slot[0])
+
+        record = _decode_record(data)
+        if record is None:
+            raise VaultError(f"Vault entry {entry_id} is corrupted")
+        entry = record[2]
+        entry['id'] = entry_id
+        return entry
+
+    def __contains__(self, entry_id):
+        with self._lock:
+            return self._read_slot(entry_id) is not None
+
+    def __len__(self):
+        return self._live
+
+    def ids(self, start=1, limit=None):
+        """Return the ids of live entries from start on in ascending order, at most limit of them"""
+        with self._lock:
+            end = min(self._next_id, self._capacity)
+            first = max(1, start)
+            ids = []
+            # With a limit, scan the index a window at a time instead of to the end
+            while first < end and (limit is None or len(ids) < limit):
+                last = end if limit is None else min(end, first + max(limit, 1024))
+                slots = SLOT.iter_unpack(self._index[self._slot_offset(first):self._slot_offset(last)])
+                ids.extend(entry_id for entry_id, (_, _, flags) in enumerate(slots, first) if flags & FLAG_LIVE)
+                first = last
+            return ids if limit is None else ids[:limit]
+
+    def metadata(self, entry_id):
+        """Return the entry dict without its ciphertext, reading only the name and metadata from disk"""
+        with self._lock:
+            slot = self._read_slot(entry_id)
+            if slot is None:
+                raise VaultError(f"No vault entry with id {entry_id}")
+            offset, length = slot
+            # Names and metadata are usually short enough to come with the header
+            head = os.pread(self._fd, min(length, FRAME.size + METADATA.size + METADATA_READ), offset)
+            split = len(head) >= FRAME.size + METADATA.size and FRAME.unpack_from(head)[3] == OP_PUT_SPLIT
+            if split:
+                size, crc = METADATA.unpack_from(head, FRAME.size)
+                start = FRAME.size + METADATA.size
+                data = head[start:start + size]
+                if len(data) < size:
+                    data = os.pread(self._fd, size, offset + start)
+            else:
+                data = os.pread(self._fd, length, offset)
+
+        if split:
+            if len(data) != size or zlib.crc32(data) != crc:
+                raise VaultError(f"Vault entry {entry_id} is corrupted")
+            entry = json.loads(data)
+        else:
+            record = _decode_record(data)
+            if record is None:
+                raise VaultError(f"Vault entry {entry_id} is corrupted")
+            entry = record[2]
+            entry.pop('ciphertext', None)
+        entry['id'] = entry_id
+        return entry
+
+    def iter_entries(self):
+        """Yield every live entry in id order without loading the whole vault"""
+        for entry_id in self.ids():
+            try:
+                yield self.get(entry_id)
+            except VaultError:
+                continue  # deleted since ids() was taken
+
+    def fingerprint(self):
+        """Return (log inode, log size), which changes whenever the vault is written or compacted"""
+        with self._lock:
+            return os.fstat(self._fd).st_ino, self._log_size
+
+    def stats(self):
+        """Return entry counts and log size figures"""
+        return {
+            'entries': self._live,
+            'log_bytes': self._log_size,
+            'dead_bytes': self._dead_bytes,
+            'unsynced_writes': self._written_seq - self._synced_seq,
+        }
+
+    def changes_since(self, fingerprint):
+        """Return (ids written or deleted since fingerprint, current fingerprint); ids is None if the log was replaced"""
+        with self._lock:
+            current = os.fstat(self._fd).st_ino, self._log_size
+            if fingerprint is None or fingerprint[0] != current[0] or not len(LOG_MAGIC) <= fingerprint[1] <= current[1]:
+                return None, current
+            changed = set()
+            offset = fingerprint[1]
+            while offset < current[1]:
+                header = os.pread(self._fd, FRAME.size, offset)
+                length = FRAME.size + FRAME.unpack_from(header)[0]
+                record = _decode_record(header + os.pread(self._fd, length - FRAME.size, offset + FRAME.size))
+                if record is None:
+                    return None, current
+                changed.add(record[0])
+                offset += length
+            return changed, current
+
+    # -- sharing between processes --------------------------------------
+
+    @contextmanager
+    def hold(self, exclusive=False):
+        """Hold the log's flock around a block of reads, or of writes if exclusive (shared mode)
+
+        Threads of one process share the flock, and a waiting writer keeps new
+        readers out, so holds must not nest.  Does nothing on unshared vaults.
+        """
+        if not self.shared:
+            yield self
+            return
+        self._acquire(exclusive)
+        try:
+            yield self
+        finally:
+            self._release(exclusive)
+
+    def _acquire(self, exclusive):
+        with self._holders:
+            self._waiting_writers += exclusive
+            try:
+                while self._writer is not None or (self._readers if exclusive else self._waiting_writers):
+                    self._holders.wait()
+                if exclusive or not self._readers:
+                    reopened = self._lock_log(exclusive, self.lock_timeout)
+                    try:
+                        self._refresh(reopened, exclusive)
+                    except BaseException:
+                        self._unlock_log()
+                        raise
+            finally:
+                self._waiting_writers -= exclusive
+                self._holders.notify_all()
+            if exclusive:
+                self._writer = threading.get_ident()
+            else:
+                self._readers += 1
+
+    def _release(self, exclusive):
+        try:
+            if exclusive:
+                # Durable before other processes can build on it
+                self.sync()
+                with self._lock:
+                    due = self._compaction_due()
+                if due:
+                    self.compact()
+        finally:
+            with self._holders:
+                if exclusive:
+                    self._writer = None
+                else:
+                    self._readers -= 1
+                if self._writer is None and not self._readers:
+                    self._unlock_log()
+                self._holders.notify_all()
+
+    def _unlock_log(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    # -- durability -----------------------------------------------------
+
+    def sync(self):
+        """fsync everything written so far and mark the index clean if nothing raced in"""
+        with self._sync_lock:
+            with self._lock:
+                if self._closed:
+                    return
+                seq, covered, fd = self._written_seq, self._log_size, self._fd
+                if seq == self._synced_seq:
+                    return
+            os.fsync(fd)
+            with self._lock:
+                if seq == self._written_seq:
+                    self._index.flush()
+                    self._write_index_header(covered, INDEX_CLEAN)
+                    self._index.flush(0, mmap.PAGESIZE)
+                self._synced_seq = max(self._synced_seq, seq)
+                self._synced.notify_all()
+
+    def _flush_loop(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                if self._written_seq == self._synced_seq:
+                    self._synced.wait(self.fsync_interval)
+                else:
+                    self._synced.wait(self.fsync_interval / 4)
+                if self._closed:
+                    return
+            self.sync()
+
+    # -- compaction -----------------------------------------------------
+
+    def _compaction_due(self):
+        return not (self._compacting or self._dead_bytes < self.compact_min_bytes
+                    or self._dead_bytes < self._log_size * self.compact_ratio)
+
+    def _maybe_compact(self):
+        if self.shared:
+            return  # done by hold() before it gives up the exclusive lock
+        with self._lock:
+            if not self._compaction_due():
+                return
+            self._compacting = True
+        threading.Thread(target=self._compact_in_background, name='vault-compact', daemon=True).start()
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        finally:
+            self._compacting = False
+
+    def compact(self):
+        """Rewrite the log with only live records, without blocking writers while copying"""
+        with self._compact_lock:
+            with self._lock:
+                if self._closed:
+                    return
+                snapshot_end = self._log_size
+                live = [(entry_id,) + self._read_slot(entry_id) for entry_id in self.ids()]
+                old_fd = self._fd
+
+            new_log_path = self._log_path + '.compact'
+            new_index_path = self._index_path + '.compact'
+            new_fd = os.open(new_log_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC | os.O_APPEND, 0o600)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(new_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.write(new_fd, LOG_MAGIC)
+                new_size = len(LOG_MAGIC)
+                slots = {}
+
+                # Phase 1: copy the live records as of the snapshot, writers keep going
+                for entry_id, offset, length in live:
+                    os.write(new_fd, os.pread(old_fd, length, offset))
+                    slots[entry_id] = (new_size, length)
+                    new_size += length
+
+                # Phase 2: under the lock, carry over whatever was appended meanwhile
+                with self._sync_lock, self._lock:
+                    offset = snapshot_end
+                    while offset < self._log_size:
+                        header = os.pread(old_fd, FRAME.size, offset)
+                        length = FRAME.size + FRAME.unpack_from(header)[0]
+                        entry_id, op = FRAME.unpack_from(header)[2:]
+                        os.write(new_fd, os.pread(old_fd, length, offset))
+                        if op != OP_DELETE:
+                            slots[entry_id] = (new_size, length)
+                        else:
+                            slots.pop(entry_id, None)
+                        new_size += length
+                        offset += length
+                    os.fsync(new_fd)
+
+                    next_id = self._next_id
+                    capacity = max(1024, self._capacity)
+                    index = bytearray(INDEX_HEADER_SIZE + capacity * SLOT.size)
+                    INDEX_HEADER.pack_into(index, 0, INDEX_MAGIC, INDEX_VERSION, INDEX_CLEAN, next_id, new_size)
+                    for entry_id, (offset, length) in slots.items():
+                        SLOT.pack_into(index, self._slot_offset(entry_id), offset, length, FLAG_LIVE)
+                    with open(new_index_path, 'wb') as index_file:
+                        index_file.write(index)
+                        index_file.flush()
+                        os.fsync(index_file.fileno())
+
+                    # A crash between the two renames leaves a dirty index, forcing a rebuild
+                    self._mark_dirty()
+                    os.replace(new_log_path, self._log_path)
+                    os.replace(new_index_path, self._index_path)
+
+                    self._index.close()
+                    os.close(self._index_fd)
+                    os.close(old_fd)
+                    self._fd = new_fd
+                    self._index_fd = os.open(self._index_path, os.O_RDWR, 0o600)
+                    self._map_index()
+                    self._index_state = INDEX_CLEAN
+                    self._log_size = new_size
+                    self._dead_bytes = new_size - len(LOG_MAGIC) - sum(length for _, length in slots.values())
+                    self._live = len(slots)
+                    self._synced_seq = self._written_seq
+                    self._synced.notify_all()
+            except BaseException:
+                if self._fd != new_fd:
+                    os.close(new_fd)
+                    for leftover in (new_log_path, new_index_path):
+                        if os.path.exists(leftover):
+                            os.remove(leftover)
+                raise
+
+    # -- lifecycle ------------------------------------------------------
+
+    def close(self):
+        """Flush pending writes, stop background threads and release the files"""
+        with self._compact_lock, self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._synced.notify_all()
+        if self._flusher is not None:
+            self._flusher.join()
+        if self.shared:
+            try:
+                with self.hold(exclusive=True), self._sync_lock, self._lock:
+                    self._checkpoint()
+            except VaultError:
+                pass  # held elsewhere; the next open replays the log past the last checkpoint
+        else:
+            with self._sync_lock, self._lock:
+                self._checkpoint()
+        with self._lock:
+            self._index.close()
+            os.close(self._index_fd)
+            os.close(self._fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Delta sync of vault entries between nodes.
+
+    python vault_sync.py pull http://laptop:5000 [--vault PATH] [--token TOKEN]
+
+Every entry is hashed (name, ciphertext, metadata and update time) and
+placed in a fixed-depth hash tree by the hash of its uid: DEPTH hex digits
+pick its leaf bucket, a bucket hashes its sorted (uid, entry hash) pairs and
+every inner node hashes its 16 children, up to one root hash.
+
+A node pulls from a peer by comparing trees top down through
+GET /api/sync/summary: equal subtrees are skipped without looking inside,
+and once a differing subtree is small enough the peer lists its entries.
+Only entries that are missing locally or newer on the peer are then fetched,
+still encrypted, with POST /api/sync/pull and written to the local vault
+with their uid and update time, so both trees end up with the same hashes.
+Matching one entry's change in a 100k-entry vault takes a handful of small
+requests instead of a copy of the vault.
+
+Conflicts are resolved per entry: the later update wins (ties go to the
+higher entry hash, so every node picks the same one).  Deletions are not
+propagated.  Run a pull on each node (or POST /api/sync/run, see app.py)
+for a two-way sync.
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+import urllib.error
+import urllib.parse
+import urllib.request
+
+DEPTH = 4
+DIGITS = '0123456789abcdef'
+EMPTY = hashlib.sha256(b'').hexdigest()
+LEAF_FETCH = 256
+MAX_PULL = 500
+TOKEN_HEADER = 'X-Sync-Token'
+# Entry fields that are Vault.put() arguments rather than metadata
+PUT_FIELDS = ('id', 'name', 'ciphertext', 'updated', 'entry_id', 'sync')
+
+
+class SyncError(Exception):
+    """Raised when a peer cannot be reached or answers unexpectedly"""
+
+
+def entry_uid(entry):
+    """The entry's uid; entries written before uids existed are named by their ciphertext"""
+    return entry.get('uid') or 'legacy-' + hashlib.sha256(entry['ciphertext'].encode('utf-8')).hexdigest()[:32]
+
+
+def entry_hash(entry):
+    """Content hash of everything in an entry except its local id"""
+    content = {key: value for key, value in entry.items() if key != 'id'}
+    content['uid'] = entry_uid(entry)
+    return hashlib.sha256(json.dumps(content, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def bucket_of(uid):
+    return hashlib.sha256(uid.encode('utf-8')).hexdigest()[:DEPTH]
+
+
+def newer(remote, local):
+    """Whether a (hash, updated) leaf from the peer should replace the local one"""
+    if local is None:
+        return True
+    if remote[0] == local[0]:
+        return False
+    return (remote[1], remote[0]) > (local[1], local[0])
+
+
+class SyncTree:
+    """Hash tree over the entries of one vault"""
+
+    def __init__(self, entries, version=None):
+        self.version = version
+        self.local_ids = {}    # uid -> local entry id
+        self.leaves = {}       # uid -> (entry hash, updated)
+        self._uids = {}        # local entry id -> uid
+        self._buckets = {}     # leaf bucket -> sorted uids
+        self._nodes = {}       # prefix -> (hash, entry count), non-empty subtrees only
+        self._apply(entries, ())
+
+    def updated(self, entries, deleted=(), version=None):
+        """A copy of the tree with entries added or replaced and the local ids in deleted removed"""
+        tree = SyncTree((), version)
+        tree.local_ids, tree.leaves, tree._uids = dict(self.local_ids), dict(self.leaves), dict(self._uids)
+        tree._buckets, tree._nodes = dict(self._buckets), dict(self._nodes)
+        tree._apply(entries, deleted)
+        return tree
+
+    def _apply(self, entries, deleted):
+        touched = {}           # bucket -> its uids, copied so the tree this came from is untouched
+        def bucket(uid):
+            prefix = bucket_of(uid)
+            if prefix not in touched:
+                touched[prefix] = self._buckets[prefix] = list(self._buckets.get(prefix, ()))
+            return touched[prefix]
+
+        def drop(entry_id):
+            uid = self._uids.pop(entry_id, None)
+            if uid is not None and self.local_ids.get(uid) == entry_id:
+                del self.local_ids[uid], self.leaves[uid]
+                bucket(uid).remove(uid)
+
+        for entry_id in deleted:
+            drop(entry_id)
+        for entry in entries:
+            uid = entry_uid(entry)
+            drop(entry['id'])
+            if uid in self.local_ids:
+                drop(self.local_ids[uid])
+            self.local_ids[uid] = entry['id']
+            self._uids[entry['id']] = uid
+            self.leaves[uid] = (entry_hash(entry), entry.get('updated', 0))
+            bucket(uid).append(uid)
+
+        for prefix, uids in touched.items():
+            if uids:
+                uids.sort()
+                digest = hashlib.sha256(''.join(uid + self.leaves[uid][0] for uid in uids).encode('utf-8'))
+                self._nodes[prefix] = (digest.hexdigest(), len(uids))
+            else:
+                del self._buckets[prefix]
+                self._nodes.pop(prefix, None)
+        level = set(touched)
+        for _ in range(DEPTH):
+            parents = {prefix[:-1] for prefix in level}
+            for parent in parents:
+                children = [self._nodes.get(parent + digit, (EMPTY, 0)) for digit in DIGITS]
+                count = sum(child[1] for child in children)
+                if count:
+                    digest = hashlib.sha256(''.join(child[0] for child in children).encode('ascii'))
+                    self._nodes[parent] = (digest.hexdigest(), count)
+                else:
+                    self._nodes.pop(parent, None)
+            level = parents
+
+    def __len__(self):
+        return len(self.leaves)
+
+    def node(self, prefix=''):
+        """(hash, entry count) of the subtree under prefix"""
+        return self._nodes.get(prefix, (EMPTY, 0))
+
+    def summary(self, prefix=''):
+        """The subtree's hash and count, with its non-empty children unless it is a leaf bucket"""
+        digest, count = self.node(prefix)
+        summary = {'prefix': prefix, 'hash': digest, 'count': count}
+        if len(prefix) < DEPTH:
+            summary['children'] = {}
+            for digit in DIGITS:
+                child = self._nodes.get(prefix + digit)
+                if child is not None:
+                    summary['children'][digit] = {'hash': child[0], 'count': child[1]}
+        return summary
+
+    def entries_under(self, prefix):
+        """[{uid, hash, updated}] for every entry in the subtree under prefix"""
+        if len(prefix) == DEPTH:
+            buckets = [prefix] if prefix in self._buckets else []
+        else:
+            buckets = sorted(bucket for bucket in self._buckets if bucket.startswith(prefix))
+        return [{'uid': uid, 'hash': self.leaves[uid][0], 'updated': self.leaves[uid][1]}
+                for bucket in buckets for uid in self._buckets[bucket]]
+
+
+def export_entry(vault, tree, uid):
+    """The vault entry for uid as sent to a peer (uid set, local id dropped), or None"""
+    entry_id = tree.local_ids.get(uid)
+    if entry_id is None:
+        return None
+    entry = vault.get(entry_id)
+    entry['uid'] = entry_uid(entry)
+    del entry['id']
+    return entry
+
+
+class HttpPeer:
+    """The sync endpoints of another node"""
+
+    def __init__(self, base_url, token=None, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.timeout = timeout
+        self.requests = 0
+
+    def _request(self, path, body=None):
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers[TOKEN_HEADER] = self.token
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers)
+        self.requests += 1
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise SyncError(f"{self.base_url}{path}: HTTP {e.code} {e.read()[:200].decode('utf-8', 'replace')}")
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise SyncError(f"{self.base_url}{path}: {e}")
+
+    def summary(self, prefix=''):
+        return self._request('/api/sync/summary?' + urllib.parse.urlencode({'prefix': prefix}))
+
+    def entries_under(self, prefix):
+        return self._request('/api/sync/summary?' + urllib.parse.urlencode({'prefix': prefix, 'leaves': 1}))['entries']
+
+    def pull(self, uids):
+        return self._request('/api/sync/pull', {'uids': uids})['entries']
+
+
+def differences(tree, peer):
+    """{uid: hash} of the peer's entries that are missing or older locally"""
+    wanted = {}
+    remote = peer.summary('')
+    if remote['hash'] == tree.node('')[0]:
+        return wanted
+    pending = [remote]
+    while pending:
+        remote = pending.pop()
+        for digit, child in remote['children'].items():
+            prefix = remote['prefix'] + digit
+            if child['hash'] == tree.node(prefix)[0]:
+                continue
+            if child['count'] <= LEAF_FETCH or len(prefix) == DEPTH:
+                for leaf in peer.entries_under(prefix):
+                    if newer((leaf['hash'], leaf['updated']), tree.leaves.get(leaf['uid'])):
+                        wanted[leaf['uid']] = leaf['hash']
+            else:
+                pending.append(peer.summary(prefix))
+    return wanted
+
+
+def pull_changes(vault, tree, peer):
+    """Bring the peer's new and updated entries into vault; returns counts of what happened"""
+    wanted = differences(tree, peer)
+    stats = {'added': 0, 'updated': 0, 'skipped': 0}
+    uids = list(wanted)
+    for start in range(0, len(uids), MAX_PULL):
+        for entry in peer.pull(uids[start:start + MAX_PULL]):
+            uid = entry.get('uid')
+            if uid not in wanted or entry_hash(entry) != wanted[uid]:
+                stats['skipped'] += 1  # changed on the peer since its summary; the next pull gets it
+                continue
+            if any(key in ('entry_id', 'sync') for key in entry):
+                stats['skipped'] += 1  # no vault writes these, and put() would take them as arguments
+                continue
+            metadata = {key: value for key, value in entry.items() if key not in PUT_FIELDS}
+            entry_id = tree.local_ids.get(uid)
+            vault.put(entry['ciphertext'], name=entry.get('name', ''), entry_id=entry_id,
+                      updated=entry['updated'], **metadata)
+            stats['updated' if entry_id is not None else 'added'] += 1
+    vault.sync()
+    stats['requests'] = peer.requests
+    return stats
+
+
+def main(argv=None):
+    import app
+    from vault import Vault, VaultError
+
+    parser = argparse.ArgumentParser(description="Pull new and changed vault entries from another node")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    pull_parser = subcommands.add_parser('pull', help="pull from a peer into the local vault")
+    pull_parser.add_argument('peer', help="base URL of the other node, e.g. http://laptop:5000")
+    pull_parser.add_argument('--vault', default=app.VAULT_PATH, help="local vault directory")
+    pull_parser.add_argument('--token', default=app.SYNC_TOKEN, help="the peer's sync token")
+    args = parser.parse_args(argv)
+
+    try:
+        with Vault(args.vault, lock_timeout=app.VAULT_LOCK_TIMEOUT) as vault:
+            stats = pull_changes(vault, SyncTree(vault.iter_entries()), HttpPeer(args.peer, args.token))
+    except (SyncError, VaultError) as e:
+        print(f"vault_sync: {e}", file=sys.stderr)
+        return 2
+    print(f"Added {stats['added']}, updated {stats['updated']}, skipped {stats['skipped']} "
+          f"({stats['requests']} requests)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+Virtualized list view for the Tk GUI.
+
+A ttk.Treeview slows down with every item inserted into it, and a vault can
+hold tens of thousands of entries.  VirtualList keeps the full (filtered)
+list of row keys in Python and gives the Treeview only as many items as fit
+in the window; scrolling reuses those items for the rows now in view.  The
+scrollbar, mouse wheel and arrow/page keys are driven by hand so they move
+through the whole list rather than the handful of items Tk knows about.
+
+Row contents come from a row_values(key) callable, called only for rows
+that are on screen.
+"""
+
+import tkinter as tk
+from tkinter import ttk
+
+# Used when the theme does not report a row height
+DEFAULT_ROW_HEIGHT = 20
+HEADING_HEIGHT = 24
+
+
+class VirtualList:
+    """Treeview that shows a window of a large list of keys"""
+
+    def __init__(self, parent, columns, row_values, height=15):
+        self.row_values = row_values
+        self.keys = []
+        self.offset = 0
+        self.rows = height
+        self.selected = None
+        self._window = []
+        self._on_select = []
+
+        self.frame = ttk.Frame(parent)
+        self.frame.columnconfigure(0, weight=1)
+        self.frame.rowconfigure(0, weight=1)
+
+        self.tree = ttk.Treeview(self.frame, columns=[name for name, _, _ in columns],
+                                 show="headings", selectmode="browse", height=height)
+        for name, heading, width in columns:
+            self.tree.heading(name, text=heading)
+            self.tree.column(name, width=width, stretch=(name == columns[0][0]))
+        self.tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+
+        self.scrollbar = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.yview)
+        self.scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+
+        self.tree.bind("<<TreeviewSelect>>", self._tree_selected)
+        self.tree.bind("<Configure>", self._resized)
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.tree.bind(sequence, self._wheel)
+        for sequence, step in (("<Up>", -1), ("<Down>", 1), ("<Prior>", "-page"), ("<Next>", "page"),
+                               ("<Home>", "home"), ("<End>", "end")):
+            self.tree.bind(sequence, lambda e, step=step: self._key_move(step))
+
+    def grid(self, **options):
+        self.frame.grid(**options)
+
+    def bind_select(self, callback):
+        """Call callback(key) whenever the selected row changes"""
+        self._on_select.append(callback)
+
+    def set_keys(self, keys):
+        """Show keys (in order) in place of the current list, keeping the selection if still listed"""
+        self.keys = keys
+        self.offset = self._clamp(self.offset)
+        self.render()
+
+    def key_at(self, y):
+        """Key of the row drawn at window y coordinate y, or None"""
+        iid = self.tree.identify_row(y)
+        if not iid:
+            return None
+        return self._window[int(iid)]
+
+    def refresh(self, key=None):
+        """Redraw the visible rows; with a key, only if that row is on screen"""
+        if key is None:
+            self.render()
+        elif key in self._window:
+            index = self._window.index(key)
+            self.tree.item(str(index), values=self.row_values(key))
+
+    def select(self, key):
+        """Select key and scroll it into view"""
+        try:
+            position = self.keys.index(key)
+        except ValueError:
+            return
+        if position < self.offset:
+            self.offset = position
+        elif position >= self.offset + self.rows:
+            self.offset = self._clamp(position - self.rows + 1)
+        self._set_selected(key)
+        self.render()
+
+    def yview(self, *args):
+        """Scrollbar command: ("moveto", fraction) or ("scroll", n, "units"|"pages")"""
+        if args[0] == "moveto":
+            offset = int(float(args[1]) * len(self.keys))
+        else:
+            count = int(args[1])
+            offset = self.offset + (count * self.rows if args[2] == "pages" else count)
+        offset = self._clamp(offset)
+        if offset != self.offset:
+            self.offset = offset
+            self.render()
+
+    def render(self):
+        """Point the Treeview's items at the rows from offset onwards"""
+        window = self.keys[self.offset:self.offset + self.rows]
+        for index, key in enumerate(window):
+            iid = str(index)
+            if index < len(self._window):
+                self.tree.item(iid, values=self.row_values(key))
+            else:
+                self.tree.insert("", tk.END, iid=iid, values=self.row_values(key))
+        for index in range(len(window), len(self._window)):
+            self.tree.delete(str(index))
+        self._window = window
+
+        if self.selected in window:
+            iid = str(window.index(self.selected))
+            if self.tree.selection() != (iid,):
+                self.tree.selection_set(iid)
+        elif self.tree.selection():
+            self.tree.selection_set(())
+
+        total = len(self.keys)
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + self.rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _clamp(self, offset):
+        return max(0, min(offset, len(self.keys) - self.rows))
+
+    def _set_selected(self, key):
+        if key != self.selected:
+            self.selected = key
+            for callback in self._on_select:
+                callback(key)
+
+    def _tree_selected(self, event):
+        selection = self.tree.selection()
+        if selection:
+            self._set_selected(self._window[int(selection[0])])
+
+    def _resized(self, event):
+        row_height = ttk.Style().lookup("Treeview", "rowheight")
+        row_height = int(row_height) if row_height else DEFAULT_ROW_HEIGHT
+        rows = max(1, (event.height - HEADING_HEIGHT) // row_height)
+        if rows != self.rows:
+            self.rows = rows
+            self.offset = self._clamp(self.offset)
+            self.render()
+
+    def _wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.yview("scroll", -3, "units")
+        else:
+            self.yview("scroll", 3, "units")
+        return "break"
+
+    def _key_move(self, step):
+        if not self.keys:
+            return "break"
+        position = self.keys.index(self.selected) if self.selected in self.keys else -1
+        if step == "home":
+            position = 0
+        elif step == "end":
+            position = len(self.keys) - 1
+        elif step in ("page", "-page"):
+            position += self.rows if step == "page" else -self.rows
+        else:
+            position += step
+        self.select(self.keys[max(0, min(position, len(self.keys) - 1))])
+        return "break"
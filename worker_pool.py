@@ -0,0 +1,90 @@
+"""
+Bounded worker pool for fanning crypto operations out in parallel.
+
+A fixed number of worker threads run the operations (each gpg call is its own
+subprocess, so threads are enough to keep several in flight).  At most
+`max_pending` operations may be queued or running at once; submitters block
+for up to `submit_timeout` seconds waiting for a slot and get PoolBusy after
+that, which is how backpressure reaches the HTTP layer.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+DEFAULT_MAX_PENDING = 256
+
+
+class PoolBusy(Exception):
+    """Raised when no queue slot frees up within the submit timeout"""
+
+
+class CryptoWorkerPool:
+    """Fixed-size thread pool with a cap on queued + running operations"""
+
+    def __init__(self, workers=DEFAULT_WORKERS, max_pending=DEFAULT_MAX_PENDING, submit_timeout=5.0):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.submit_timeout = submit_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='crypto-worker')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def pending(self):
+        """Number of operations currently queued or running"""
+        return self._pending
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def submit(self, fn, *args):
+        """Queue fn(*args), blocking while the pool is full; returns a Future"""
+        if not self._slots.acquire(timeout=self.submit_timeout):
+            raise PoolBusy(f"Crypto worker pool is full ({self.max_pending} operations pending)")
+
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def map_results(self, fn, items):
+        """Run fn over items in parallel, returning (ok, result_or_exception) per item in order
+
+        Once a submit times out the pool is full, so the rest of the items
+        fail with the same PoolBusy instead of each waiting out the timeout.
+        """
+        futures = []
+        busy = None
+        for item in items:
+            if busy is None:
+                try:
+                    futures.append(self.submit(fn, item))
+                    continue
+                except PoolBusy as e:
+                    busy = e
+            futures.append(busy)
+
+        results = []
+        for future in futures:
+            if isinstance(future, Exception):
+                results.append((False, future))
+                continue
+            try:
+                results.append((True, future.result()))
+            except Exception as e:
+                results.append((False, e))
+        return results
+
+    def shutdown(self, wait=True):
+        """Stop accepting work and optionally wait for running operations"""
+        self._executor.shutdown(wait=wait)